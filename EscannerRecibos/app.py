@@ -3,18 +3,23 @@ import os
 import uuid
 import json
 from werkzeug.utils import secure_filename
-import threading
 import shutil 
-from ocr import process_pdf_pages
-from parser import process_ticket
-from excel_generator import create_excel_report
-from email_sender import send_email_with_attachment
+import threading
+import config
+from pipeline import extraction_stats, warm_up
+from batch_processor import process_batch
+from jobs import job_manager, TERMINAL_STATUSES
+from uploads import save_streaming_upload, write_manifest, prune_store, UploadError
+from outbox import outbox
+from memory_budget import memory_budget
+from receipt_store import receipt_store, parse_period
+from reports import monthly_report, prune_reports
+import metrics
 
 app = Flask(__name__)
 
 # Configuración
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'pdf'}
 TEMP_REPORTS_FOLDER = 'temp_reports'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
@@ -23,10 +28,6 @@ if not os.path.exists(UPLOAD_FOLDER):
 if not os.path.exists('temp_reports'):
     os.makedirs('temp_reports')
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -35,14 +36,22 @@ def index():
 @app.route('/upload_multiple', methods=['POST'])
 def upload_multiple():
     """
-    Recibe MÚLTIPLES PDFs, los guarda en una carpeta de lote única
-    y devuelve el ID del lote.
-    """
-    # Usamos request.files.getlist para obtener todos los archivos
-    files = request.files.getlist('files[]')
+    Recibe MÚLTIPLES PDFs, los guarda en una carpeta de lote única,
+    encola su procesamiento en segundo plano y devuelve el ID del lote.
 
-    if not files or all(f.filename == '' for f in files):
-        return jsonify({'success': False, 'error': 'No se seleccionaron archivos'}), 400
+    El cuerpo se lee en streaming (uploads.py): cada PDF va a disco en
+    bloques mientras se calcula su hash, y los archivos idénticos se
+    guardan una sola vez.
+
+    ?periodo=AAAA-MM es el mes con el que se guardan los recibos que no
+    dicen su período en el texto (por defecto el mes en curso).
+    """
+    period = request.args.get('periodo') or None
+    if period is not None:
+        try:
+            period = parse_period(period)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'periodo debe tener el formato AAAA-MM'}), 400
 
     # Crear un ID de lote único
     batch_id = str(uuid.uuid4())
@@ -52,16 +61,36 @@ def upload_multiple():
     print(f"Nuevo lote creado: {batch_id}")
 
     try:
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(batch_dir, filename)
-                file.save(file_path)
-                print(f"Archivo guardado en lote {batch_id}: {filename}")
-        
+        files = save_streaming_upload(request.stream, request.content_type, request.content_length)
+
+        if not files:
+            shutil.rmtree(batch_dir)
+            return jsonify({'success': False, 'error': 'No se seleccionaron archivos'}), 400
+
+        write_manifest(batch_dir, files)
+        for f in files:
+            if f['duplicate_of']:
+                print(f"Archivo {f['filename']} idéntico a {f['duplicate_of']} en lote {batch_id}: se procesa una sola vez")
+            else:
+                print(f"Archivo guardado en lote {batch_id}: {f['filename']} ({f['sha256'][:12]})")
+        prune_store()
+        prune_reports()
+
+        # Encolar el procesamiento en segundo plano
+        job_manager.submit(batch_id, lambda: process_batch(batch_id, batch_dir, period))
+
         # Devolvemos el batch_id para que el frontend sepa a qué conectarse
-        return jsonify({'success': True, 'batch_id': batch_id})
-    
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'files': [{k: f[k] for k in ('filename', 'duplicate_of', 'seen_before')} for f in files]
+        })
+
+    except UploadError as e:
+        print(f"Subida rechazada en lote {batch_id}: {e}")
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+
     except Exception as e:
         print(f"Error al guardar archivos del lote: {e}")
         # Si falla, limpiar la carpeta del lote
@@ -81,105 +110,89 @@ def download_file(filename):
         as_attachment=True
     )
 
-def _send_email_in_background(excel_path, month, year):
+@app.route('/stats')
+def stats():
     """
-    Función de hilo simplificada: SOLO envía el email.
+    Páginas procesadas por cada camino de extracción (local / LLM / error)
+    desde que arrancó el servidor, estado de la bandeja de emails, recibos
+    guardados y uso (actual y pico) del presupuesto de memoria del OCR.
     """
-    print(f"[Hilo BKG] Iniciando envío de email para {excel_path}...")
-    try:
-        if excel_path:
-            send_email_with_attachment(excel_path, month, year)
-        print("[Hilo BKG] Email enviado.")
-    except Exception as e:
-        print(f"[Hilo BKG] Error en el hilo de envío de email: {e}")
+    return jsonify({'extraction_paths': extraction_stats(), 'outbox': outbox.stats(),
+                    'receipt_store': receipt_store.stats(), 'memory_budget': memory_budget.stats()})
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Contadores e histogramas de tiempos por etapa en formato Prometheus."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/recibos')
+def find_recibos():
+    """
+    Recibos guardados de un empleado (?empleado=, nombre y apellido en
+    cualquier orden) y/o de un mes (?periodo=AAAA-MM).
+    Sin parámetros devuelve los períodos guardados.
+    """
+    employee = request.args.get('empleado') or None
+    period = request.args.get('periodo') or None
+    if period is not None:
+        try:
+            period = parse_period(period)
+        except ValueError:
+            return jsonify({'error': 'El período debe tener el formato AAAA-MM'}), 400
+    if employee is None and period is None:
+        return jsonify({'periods': receipt_store.periods()})
+    return jsonify({'recibos': receipt_store.find(employee=employee, period=period)})
+
+@app.route('/reports/<period>')
+def download_monthly_report(period):
+    """
+    Reporte de Excel del mes (AAAA-MM) con todos los recibos guardados,
+    armado desde el almacén sin reprocesar los PDFs.
+    """
+    try:
+        period = parse_period(period)
+    except ValueError:
+        return jsonify({'error': 'El período debe tener el formato AAAA-MM'}), 400
+    path, count = monthly_report(period, directory=TEMP_REPORTS_FOLDER)
+    if path is None:
+        return jsonify({'error': f'No hay recibos guardados de {period}'}), 404
+    print(f"Reporte mensual {period}: {count} recibo(s)")
+    return send_from_directory(TEMP_REPORTS_FOLDER, os.path.basename(path), as_attachment=True)
 
 @app.route('/process_stream/<batch_id>')
 def process_stream(batch_id):
-    safe_batch_id = secure_filename(batch_id)
-    batch_dir = os.path.join(app.config['UPLOAD_FOLDER'], safe_batch_id)
-
-    if not os.path.isdir(batch_dir):
+    """
+    Stream SSE con el progreso del lote. El trabajo corre en segundo plano
+    (jobs.py); acá solo se lee su log de eventos. Cada evento lleva un 'id',
+    así que si el navegador se reconecta (cabecera Last-Event-ID) se sigue
+    desde el siguiente evento sin reprocesar el lote.
+    """
+    job = job_manager.get(secure_filename(batch_id))
+    if job is None:
         return jsonify({'error': 'Lote no encontrado'}), 404
 
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        start = int(last_event_id) + 1
+    except (TypeError, ValueError):
+        start = 0
+
     def generate_events():
-        all_recibos = []
-        excel_filename = None # Variable para guardar el nombre del archivo
-        
-        try:
-            pdf_files = [f for f in os.listdir(batch_dir) if allowed_file(f)]
-            print(f"Procesando lote {batch_id} con {len(pdf_files)} archivo(s)...")
-
-            # Bucle 1: Procesar todos los PDFs
-            for pdf_filename in pdf_files:
-                pdf_path = os.path.join(batch_dir, pdf_filename)
-                for page_text, page_num in process_pdf_pages(pdf_path):
-                    progress_data = {
-                        'status': 'progress',
-                        'message': f'Procesando {pdf_filename}: Página {page_num}...'
-                    }
-                    yield f"data: {json.dumps(progress_data)}\n\n" 
-
-                    if not page_text or page_text.startswith("ERROR_PROCESANDO_PAGINA"):
-                        continue 
-                    
-                    json_data = process_ticket(page_text)
-                    if 'recibos' in json_data and json_data['recibos']:
-                        all_recibos.extend(json_data['recibos'])
-            
-            # --- Lógica de finalización ---
-            
-            if not all_recibos:
-                # No se encontró nada, enviar error
-                final_data = {'status': 'error', 'message': 'No se encontraron recibos legibles en los documentos.'}
-            else:
-                # ¡Se encontraron recibos! Generar Excel ANTES de responder.
-                print("Procesamiento de páginas completo. Generando Excel...")
-                yield f"data: {json.dumps({'status': 'progress', 'message': 'Generando reporte de Excel...'})}\n\n"
-                
-                excel_path, month, year = create_excel_report(all_recibos)
-                
-                if excel_path is None:
-                    # Falló la creación del Excel
-                    final_data = {'status': 'error', 'message': 'Error al generar el archivo Excel.'}
-                else:
-                    # ¡Éxito! Obtenemos el nombre del archivo
-                    excel_filename = os.path.basename(excel_path)
-                    print(f"Excel generado: {excel_filename}. Iniciando hilo de email...")
-                    
-                    # Iniciar el hilo SOLO para enviar email
-                    threading.Thread(
-                        target=_send_email_in_background, 
-                        args=(excel_path, month, year)
-                    ).start()
-                    
-                    # Preparar la respuesta final para el frontend
-                    final_data = {
-                        'status': 'complete',
-                        'data': {'recibos': all_recibos},
-                        'download_filename': os.path.basename(excel_path) 
-                    }
-
-            # Enviar el mensaje final (sea de éxito o error)
-            print("Stream: Enviando datos completos al frontend.")
-            yield f"data: {json.dumps(final_data)}\n\n"
-
-        except Exception as e:
-            print(f"Error en el stream del lote: {e}")
-            error_data = {'status': 'error', 'message': str(e)}
-            yield f"data: {json.dumps(error_data)}\n\n"
-        
-        finally:
-            # Limpiar: Borrar la carpeta del LOTE (con los PDFs)
-            if os.path.exists(batch_dir):
-                try:
-                    shutil.rmtree(batch_dir)
-                    print(f"Carpeta de lote eliminada: {batch_dir}")
-                except Exception as e:
-                    print(f"Error al eliminar carpeta de lote {batch_dir}: {e}")
-            
-            # NOTA: NO borramos el archivo Excel
-            print("Stream: Conexión con frontend cerrada.")
+        index = start
+        while True:
+            events = job.wait_events(index, timeout=15)
+            if not events:
+                if job.finished:
+                    break
+                # Comentario SSE para mantener viva la conexión
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield f"id: {index}\ndata: {json.dumps(event)}\n\n"
+                index += 1
+                if event.get('status') in TERMINAL_STATUSES:
+                    print(f"Stream: lote {job.id} terminado ({event['status']}).")
+                    return
 
     return Response(
     stream_with_context(generate_events()), 
@@ -188,5 +201,33 @@ def process_stream(batch_id):
     )
 
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Estado del trabajo de un lote (en cola, procesando, terminado)."""
+    safe_job_id = secure_filename(job_id)
+    job = job_manager.get(safe_job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(job.to_dict(job_manager.queue_position(safe_job_id)))
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Resultado final del trabajo; 202 si todavía no terminó."""
+    job = job_manager.get(secure_filename(job_id))
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if not job.finished:
+        return jsonify({'job_id': job.id, 'status': job.status}), 202
+    return jsonify(job.result)
+
+
 if __name__ == '__main__':
+    # Retomar los emails que quedaron pendientes de una ejecución anterior
+    # (solo en el proceso que sirve, no en el vigilante del reloader)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        outbox.start()
+        # Opcional: cargar el OCR y abrir la conexión con el LLM antes del primer lote
+        if config.WARMUP_ON_START:
+            threading.Thread(target=warm_up, daemon=True).start()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,272 @@
+import os
+import shutil
+import time
+import config
+import metrics
+from dedup import dedupe_key
+from pipeline import run_pipeline
+from outbox import outbox
+from receipt_store import receipt_store, current_period, period_from_text
+from uploads import read_manifest, store_path
+
+
+def process_batch(batch_id, batch_dir, period=None):
+    """
+    Procesa todos los PDFs de la carpeta de un lote.
+
+    Es un generador de eventos (dicts con 'status' = 'progress', 'complete'
+    o 'error'); el último evento siempre es 'complete' o 'error'. Al
+    terminar borra la carpeta del lote (los PDFs quedan en el almacén por
+    contenido de uploads.py).
+
+    Cada recibo se informa en su propio evento (con la clave 'recibo') apenas
+    se extrae y su fila se escribe en ese momento en el reporte
+    (ReportWriter), así al terminar la última página solo falta cerrar el
+    Excel. El evento final trae los totales y el nombre del archivo, no la
+    lista de recibos.
+
+    Los recibos también se guardan en el almacén (receipt_store.py), para
+    los reportes mensuales, con el período que figura en su página; si no
+    figura, con 'period' (AAAA-MM, el indicado al subir el lote) o el mes en curso.
+    """
+    # Reporte de Excel; se crea con el primer recibo
+    report = None
+    # Recibos escritos en el reporte y suma de sus sueldos
+    totals = {'recibos': 0, 'sueldo': 0.0}
+    excel_filename = None # Variable para guardar el nombre del archivo
+    # Contador de páginas por camino (capa de texto / OCR / error)
+    page_sources = {'text_layer': 0, 'ocr': 0, 'error': 0}
+    # Aciertos y fallos de la caché de OCR
+    ocr_cache_stats = {'hit': 0, 'miss': 0}
+    # Páginas resueltas por el extractor local o por el LLM
+    extraction_paths = {'local': 0, 'llm': 0, 'none': 0, 'error': 0}
+    # Páginas que el LLM no pudo procesar (ni con reintentos) y sin resultado local
+    failed_pages = []
+    # Milisegundos acumulados por etapa en todo el lote (es tiempo de trabajo:
+    # con OCR y LLM en paralelo la suma puede superar al 'total' de reloj)
+    stage_timings = {}
+    # Duplicados omitidos: páginas (o mitades) antes del OCR y recibos ya extraídos
+    duplicates = {'pages': 0, 'recibos': 0}
+    seen_recibos = {}
+    # Tokens estimados del texto de las páginas que fueron al LLM, antes y después de compactarlo
+    prompt_tokens = {'before': 0, 'after': 0}
+    batch_start = time.perf_counter()
+    final_status = 'error'
+    period = period or current_period()
+    # Períodos en los que se guardaron recibos del lote
+    stored_periods = set()
+
+    try:
+        files = read_manifest(batch_dir)
+        print(f"Procesando lote {batch_id} con {len(files)} archivo(s)...")
+
+        # Los PDFs están guardados por contenido: cada hash se procesa una vez
+        # y se muestra con el primer nombre con el que se subió
+        pdf_names = {}
+        for f in files:
+            if f['duplicate_of']:
+                yield {
+                    'status': 'progress',
+                    'message': f"{f['filename']} es idéntico a {f['duplicate_of']}: se procesa una sola vez.",
+                    'duplicate_file': f['filename']
+                }
+            pdf_names.setdefault(store_path(f['sha256']), f['filename'])
+        pdf_hashes = {store_path(f['sha256']): f['sha256'] for f in files}
+
+        # Bucle 1: Procesar todos los PDFs
+        # (pipeline: OCR en paralelo -> cola -> extracción LLM concurrente)
+        pdf_paths = list(pdf_names)
+        for event in run_pipeline(pdf_paths):
+            if event['type'] == 'skip':
+                duplicates['pages'] += 1
+                original_pdf, original_page = event['duplicate_of']
+                if event['half']:
+                    message = (f"{pdf_names[event['pdf']]}: Página {event['page']} tiene dos copias iguales "
+                               f"lado a lado, se procesa solo la mitad izquierda.")
+                else:
+                    message = (f"{pdf_names[event['pdf']]}: Página {event['page']} omitida, es un duplicado de "
+                               f"{pdf_names[original_pdf]} página {original_page}.")
+                yield {
+                    'status': 'progress',
+                    'message': message,
+                    'duplicate_page': {'file': pdf_names[event['pdf']], 'page': event['page'],
+                                       'half': event['half'], 'reason': event['reason']},
+                    'duplicates': dict(duplicates)
+                }
+
+            elif event['type'] == 'wait':
+                # El OCR espera lugar en el presupuesto de memoria (otros lotes lo están usando)
+                yield {
+                    'status': 'queued',
+                    'message': (f"Esperando memoria libre para el OCR: el lote es el "
+                                f"{event['position']}° en la fila..."),
+                    'queue_position': event['position'],
+                    'memory_budget': event['memory']
+                }
+
+            elif event['type'] == 'page':
+                pdf_filename = pdf_names[event['pdf']]
+                source = event['info']['source']
+                page_sources[source] = page_sources.get(source, 0) + 1
+                source_label = {'text_layer': 'texto embebido', 'ocr': 'OCR'}.get(source, 'error')
+                if event['info'].get('layout'):
+                    source_label = f"OCR por regiones, formato {event['info']['layout']}"
+                cache_status = event['info'].get('cache')
+                if cache_status:
+                    ocr_cache_stats[cache_status] += 1
+                    if cache_status == 'hit':
+                        source_label += ' en caché'
+                yield {
+                    'status': 'progress',
+                    'message': f'Procesando {pdf_filename}: Página {event["page"]} ({source_label})...',
+                    'page_source': source,
+                    'page_sources': dict(page_sources),
+                    'ocr_cache': dict(ocr_cache_stats),
+                    'timings': event['timings']
+                }
+
+            elif event['type'] == 'result':
+                extraction_paths[event['extractor']] += 1
+                metrics.add_timings(stage_timings, event['timings'])
+                if 'prompt_tokens' in event:
+                    prompt_tokens['before'] += event['prompt_tokens']['before']
+                    prompt_tokens['after'] += event['prompt_tokens']['after']
+                    print(f"  {pdf_names[event['pdf']]} página {event['page']}: "
+                          f"{event['prompt_tokens']['before']} -> {event['prompt_tokens']['after']} tokens para el LLM")
+                if event['extractor'] == 'error':
+                    failed_pages.append({'file': pdf_names[event['pdf']], 'page': event['page'],
+                                         'error': event['json_data']['error']})
+                    yield {
+                        'status': 'progress',
+                        'message': (f"No se pudo extraer {pdf_names[event['pdf']]} página {event['page']}: "
+                                    f"el LLM no respondió ({event['json_data']['error']})."),
+                        'failed_page': failed_pages[-1]
+                    }
+                elif 'llm_error' in event:
+                    yield {
+                        'status': 'progress',
+                        'message': (f"{pdf_names[event['pdf']]} página {event['page']}: el LLM no respondió, "
+                                    f"se usa la lectura por reglas.")
+                    }
+                json_data = event['json_data']
+                if json_data and 'recibos' in json_data and json_data['recibos']:
+                    stored = []
+                    # Un lote puede traer varios meses: el mismo sueldo en otro mes no es un duplicado
+                    text_period = period_from_text(event.get('text'))
+                    page_period = text_period or period
+                    for recibo in json_data['recibos']:
+                        key = dedupe_key(recibo, page_period) if config.DEDUP_RECIBOS else None
+                        if key is not None and key in seen_recibos:
+                            duplicates['recibos'] += 1
+                            yield {
+                                'status': 'progress',
+                                'message': (f"Recibo duplicado omitido: {recibo.get('apellido', '')}, "
+                                            f"{recibo.get('nombre', '')} ({pdf_names[event['pdf']]} página "
+                                            f"{event['page']}, ya leído en {seen_recibos[key]})."),
+                                'duplicate_recibo': recibo,
+                                'duplicates': dict(duplicates)
+                            }
+                            continue
+                        if key is not None:
+                            seen_recibos[key] = f"{pdf_names[event['pdf']]} página {event['page']}"
+
+                        if report is None:
+                            # openpyxl se importa recién acá: no demora el arranque del servidor
+                            from excel_generator import ReportWriter
+                            report = ReportWriter()
+                        report.add(recibo)
+                        stored.append(dict(recibo, pdf_sha256=pdf_hashes[event['pdf']], page=event['page'],
+                                           filename=pdf_names[event['pdf']], extractor=event['extractor']))
+                        totals['recibos'] += 1
+                        sueldo = recibo.get('sueldo')
+                        if isinstance(sueldo, (int, float)) and not isinstance(sueldo, bool):
+                            totals['sueldo'] = round(totals['sueldo'] + sueldo, 2)
+                        yield {
+                            'status': 'progress',
+                            'message': (f"{pdf_names[event['pdf']]} página {event['page']}: "
+                                        f"{recibo.get('apellido', '')}, {recibo.get('nombre', '')}."),
+                            'recibo': {'nombre': recibo.get('nombre'), 'apellido': recibo.get('apellido'),
+                                       'sueldo': sueldo, 'file': pdf_names[event['pdf']], 'page': event['page']},
+                            'totals': dict(totals)
+                        }
+                    if stored and config.RECEIPT_STORE_ENABLED:
+                        try:
+                            receipt_store.upsert(stored, page_period, batch_id=batch_id,
+                                                 period_in_text=text_period is not None)
+                            stored_periods.add(page_period)
+                        except Exception as e:
+                            # Sin el almacén el lote sigue: solo falta en los reportes mensuales
+                            print(f"No se pudieron guardar los recibos de {pdf_names[event['pdf']]} "
+                                  f"página {event['page']}: {e}")
+
+        # --- Lógica de finalización ---
+
+        if report is None:
+            # No se encontró nada, enviar error
+            message = 'No se encontraron recibos legibles en los documentos.'
+            if failed_pages:
+                message += f' El LLM no respondió para {len(failed_pages)} página(s); volvé a intentar en unos minutos.'
+            final_data = {'status': 'error', 'message': message, 'failed_pages': failed_pages}
+        else:
+            # Las filas ya están escritas: solo falta la de totales y guardar
+            print("Procesamiento de páginas completo. Cerrando el Excel...")
+            yield {'status': 'progress', 'message': 'Guardando reporte de Excel...'}
+
+            with metrics.collecting() as timings, metrics.timed('excel'):
+                try:
+                    excel_path, month, year = report.close()
+                except Exception as e:
+                    print(f"[Error en excel_generator] No se pudo crear el archivo Excel: {e}")
+                    excel_path = month = year = None
+            metrics.add_timings(stage_timings, timings)
+
+            if excel_path is None:
+                # Falló la creación del Excel
+                final_data = {'status': 'error', 'message': 'Error al generar el archivo Excel.'}
+            else:
+                # ¡Éxito! Obtenemos el nombre del archivo
+                excel_filename = os.path.basename(excel_path)
+                print(f"Excel generado: {excel_filename}. Encolando email...")
+
+                # El envío lo hace la bandeja de salida (un solo trabajador con reintentos)
+                outbox.enqueue(excel_path, month, year)
+
+                # Preparar la respuesta final para el frontend
+                final_data = {
+                    'status': 'complete',
+                    'download_filename': excel_filename,
+                    'totals': totals,
+                    'period': period,
+                    'periods': sorted(stored_periods),
+                    'page_sources': page_sources,
+                    'ocr_cache': ocr_cache_stats,
+                    'extraction_paths': extraction_paths,
+                    'failed_pages': failed_pages,
+                    'duplicates': duplicates,
+                    'prompt_tokens': prompt_tokens,
+                    'timings': dict(stage_timings, total=round((time.perf_counter() - batch_start) * 1000, 1))
+                }
+
+        print(f"Páginas por camino en lote {batch_id}: {page_sources} | caché OCR: {ocr_cache_stats} | extracción: {extraction_paths} | duplicados: {duplicates} | tokens LLM: {prompt_tokens} | páginas sin extraer: {len(failed_pages)}")
+
+        # Enviar el mensaje final (sea de éxito o error)
+        final_status = final_data['status']
+        yield final_data
+
+    except Exception as e:
+        print(f"Error procesando el lote {batch_id}: {e}")
+        yield {'status': 'error', 'message': str(e)}
+
+    finally:
+        metrics.observe_stage('batch', time.perf_counter() - batch_start)
+        metrics.inc('recibos_batches_total', status=final_status)
+
+        # Limpiar: Borrar la carpeta del LOTE (con los PDFs)
+        if os.path.exists(batch_dir):
+            try:
+                shutil.rmtree(batch_dir)
+                print(f"Carpeta de lote eliminada: {batch_dir}")
+            except Exception as e:
+                print(f"Error al eliminar carpeta de lote {batch_dir}: {e}")
+
+        # NOTA: NO borramos el archivo Excel
@@ -0,0 +1,268 @@
+"""
+Benchmark de punta a punta del procesamiento de lotes, sin red.
+
+Genera PDFs sintéticos de recibos (benchmarks/synthetic.py, variantes con
+capa de texto y escaneada) y levanta un Groq falso local
+(benchmarks/fake_groq.py) con latencia configurable. Para cada PDF mide
+cada etapa por separado y el pipeline completo:
+
+- ocr:      ocr.process_pdf_pages (capa de texto u OCR, página por página)
+- llm:      parser.process_ticket sobre el texto compactado de cada página
+- excel:    excel_generator.create_excel_report con los recibos extraídos
+- pipeline: pipeline.run_pipeline (el camino real de process_batch)
+
+Informa páginas/seg, latencia por página p50/p95 y pico de memoria (RSS).
+Cada etapa corre en un subproceso propio (el pico de RSS es de esa etapa)
+con las cachés de OCR y LLM desactivadas. Los resultados se guardan en JSON
+para comparar corridas (--compare).
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/bench_e2e.py [--pages 1 10 100] [--variants text scanned]
+                                   [--stages ocr llm excel pipeline]
+                                   [--latency 0.4] [--jitter 0.1]
+                                   [--out benchmarks/results/e2e.json] [--compare anterior.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+STAGES = ['ocr', 'llm', 'excel', 'pipeline']
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def percentile(values, pct):
+    """Percentil por rango más cercano (None si no hay valores)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def _summary(stage, units, seconds, latencies, extra=None):
+    return {
+        'stage': stage,
+        'units': units,
+        'seconds': round(seconds, 3),
+        'pages_per_sec': round(units / seconds, 2) if seconds > 0 else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        'peak_rss_mb': _peak_rss_mb(),
+        'extra': extra or {},
+    }
+
+
+# --- Etapas (se ejecutan en el subproceso) ---
+
+def stage_ocr(pdf_path, workdir):
+    from ocr import process_pdf_pages
+    texts, latencies, sources = [], [], {}
+    start = last = time.perf_counter()
+    for text, page_num, info in process_pdf_pages(pdf_path, detailed=True):
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+        texts.append(text)
+        sources[info['source']] = sources.get(info['source'], 0) + 1
+    elapsed = time.perf_counter() - start
+    with open(os.path.join(workdir, 'texts.json'), 'w', encoding='utf-8') as fh:
+        json.dump(texts, fh)
+    return _summary('ocr', len(texts), elapsed, latencies, {'sources': sources})
+
+
+def stage_llm(pdf_path, workdir):
+    from parser import process_ticket
+    from compactor import compact_for_prompt
+    with open(os.path.join(workdir, 'texts.json'), encoding='utf-8') as fh:
+        texts = json.load(fh)
+    recibos, latencies, errores = [], [], 0
+    tokens = {'before': 0, 'after': 0}
+    start = time.perf_counter()
+    for text in texts:
+        t0 = time.perf_counter()
+        prompt_text, page_tokens = compact_for_prompt(text)
+        tokens['before'] += page_tokens['before']
+        tokens['after'] += page_tokens['after']
+        result = process_ticket(prompt_text)
+        latencies.append(time.perf_counter() - t0)
+        if result and result.get('recibos'):
+            recibos.extend(result['recibos'])
+        else:
+            errores += 1
+    elapsed = time.perf_counter() - start
+    with open(os.path.join(workdir, 'recibos.json'), 'w', encoding='utf-8') as fh:
+        json.dump(recibos, fh)
+    return _summary('llm', len(texts), elapsed, latencies, {'recibos': len(recibos), 'sin_recibos': errores,
+                                                          'prompt_tokens': tokens})
+
+
+def stage_excel(pdf_path, workdir):
+    from excel_generator import create_excel_report
+    with open(os.path.join(workdir, 'recibos.json'), encoding='utf-8') as fh:
+        recibos = json.load(fh)
+    start = time.perf_counter()
+    path, _, _ = create_excel_report(recibos) if recibos else (None, None, None)
+    elapsed = time.perf_counter() - start
+    return _summary('excel', len(recibos), elapsed, [],
+                    {'file_kb': round(os.path.getsize(path) / 1024, 1) if path else None})
+
+
+def stage_pipeline(pdf_path, workdir):
+    from pipeline import run_pipeline, extraction_stats
+    latencies, recibos = [], 0
+    start = last = time.perf_counter()
+    for event in run_pipeline([pdf_path]):
+        if event['type'] == 'result':
+            # Intervalo entre resultados: lo que "cuesta" cada página de punta a punta
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+            if event['json_data'] and event['json_data'].get('recibos'):
+                recibos += len(event['json_data']['recibos'])
+    elapsed = time.perf_counter() - start
+    return _summary('pipeline', len(latencies), elapsed, latencies,
+                    {'recibos': recibos, 'extraction_paths': extraction_stats()})
+
+
+STAGE_FUNCS = {'ocr': stage_ocr, 'llm': stage_llm, 'excel': stage_excel, 'pipeline': stage_pipeline}
+
+
+# --- Orquestación ---
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _run_stage(stage, pdf_path, workdir, env):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', stage, pdf_path, workdir],
+        capture_output=True, text=True, cwd=workdir, env=env,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        raise RuntimeError(f"La etapa {stage} falló (código {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _print_row(r):
+    def fmt(v):
+        return '-' if v is None else str(v)
+    print(f"{r['variant']:<9}{r['pages']:>6}  {r['stage']:<9}{r['units']:>6}{r['seconds']:>10}"
+          f"{fmt(r['pages_per_sec']):>10}{fmt(r['p50_ms']):>10}{fmt(r['p95_ms']):>10}{fmt(r['peak_rss_mb']):>10}")
+
+
+def _compare(results, previous_path):
+    with open(previous_path, encoding='utf-8') as fh:
+        previous = {(r['variant'], r['pages'], r['stage']): r for r in json.load(fh)['results']}
+    print(f"\nComparación contra {previous_path} (páginas/seg y p95):")
+    for r in results:
+        old = previous.get((r['variant'], r['pages'], r['stage']))
+        if not old or not old['pages_per_sec'] or not r['pages_per_sec']:
+            continue
+        delta = (r['pages_per_sec'] - old['pages_per_sec']) / old['pages_per_sec'] * 100
+        print(f"{r['variant']:<9}{r['pages']:>6}  {r['stage']:<9}"
+              f"{old['pages_per_sec']:>9} -> {r['pages_per_sec']:<9}({delta:+.1f}%)"
+              f"  p95 {old['p95_ms']} -> {r['p95_ms']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100],
+                    help='Páginas por PDF (1 a 500)')
+    ap.add_argument('--variants', nargs='+', default=['text', 'scanned'], choices=['text', 'scanned'])
+    ap.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    ap.add_argument('--latency', type=float, default=0.4, help='Latencia del Groq falso (segundos)')
+    ap.add_argument('--jitter', type=float, default=0.1)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', help='Archivo JSON de resultados (por defecto benchmarks/results/e2e-<fecha>.json)')
+    ap.add_argument('--compare', help='JSON de una corrida anterior para comparar')
+    ap.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        stage, pdf_path, workdir = args.child
+        print(json.dumps(STAGE_FUNCS[stage](pdf_path, workdir)))
+        return
+
+    for pages in args.pages:
+        if not 1 <= pages <= 500:
+            ap.error('--pages debe estar entre 1 y 500')
+
+    from fake_groq import start_server
+    from synthetic import make_pdf
+
+    server = start_server(latency=args.latency, jitter=args.jitter)
+    env = dict(os.environ,
+               GROQ_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+               GROQ_API_KEY='bench',
+               OCR_CACHE_ENABLED='0',
+               LLM_CACHE_ENABLED='0',
+               PYTHONPATH=ROOT)
+
+    # Las etapas llm y excel leen la salida de la anterior
+    stages = list(args.stages)
+    if 'excel' in stages and 'llm' not in stages:
+        stages.insert(stages.index('excel'), 'llm')
+    if 'llm' in stages and 'ocr' not in stages:
+        stages.insert(stages.index('llm'), 'ocr')
+
+    results = []
+    print(f"{'variante':<9}{'págs':>6}  {'etapa':<9}{'n':>6}{'segundos':>10}{'págs/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>10}")
+    try:
+        for variant in args.variants:
+            for pages in args.pages:
+                with tempfile.TemporaryDirectory() as workdir:
+                    pdf_path = os.path.join(workdir, f"recibos_{variant}_{pages}.pdf")
+                    make_pdf(pdf_path, pages, variant, args.seed)
+                    for stage in stages:
+                        r = _run_stage(stage, pdf_path, workdir, env)
+                        r.update({'variant': variant, 'pages': pages})
+                        results.append(r)
+                        _print_row(r)
+    finally:
+        server.shutdown()
+
+    out = args.out or os.path.join(HERE, 'results', f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as fh:
+        json.dump({
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'params': {'latency': args.latency, 'jitter': args.jitter, 'seed': args.seed,
+                       'pages': args.pages, 'variants': args.variants, 'stages': stages},
+            'results': results,
+        }, fh, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {out}")
+
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
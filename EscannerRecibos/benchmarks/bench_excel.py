@@ -0,0 +1,77 @@
+"""
+Benchmark de excel_generator.create_excel_report: modo normal (libro en
+memoria) contra modo streaming (hoja write-only + estilos con nombre).
+
+Mide segundos totales y pico de memoria (RSS) para 100, 10.000 y 100.000
+filas. Cada corrida usa un subproceso propio y una carpeta temporal.
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/bench_excel.py [--rows 100 10000 100000] [--modes normal streaming]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def _recibos(n):
+    for i in range(n):
+        yield {'nombre': f'Nombre{i}', 'apellido': f'Apellido{i}', 'sueldo': 100000 + i * 1.5}
+
+
+def run_child(mode, rows):
+    from excel_generator import create_excel_report
+    data = list(_recibos(rows)) if mode == 'normal' else _recibos(rows)
+    start = time.perf_counter()
+    path, _, _ = create_excel_report(data, mode=mode)
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': _peak_rss_mb(),
+        'file_kb': round(os.path.getsize(path) / 1024, 1) if path else None,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--rows', type=int, nargs='+', default=[100, 10_000, 100_000])
+    ap.add_argument('--modes', nargs='+', default=['normal', 'streaming'], choices=['normal', 'streaming'])
+    ap.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        mode, rows = args.child
+        print(json.dumps(run_child(mode, int(rows))))
+        return
+
+    print(f"{'modo':<11}{'filas':>9}{'segundos':>10}{'pico RSS MB':>13}{'archivo KB':>12}")
+    for rows in args.rows:
+        for mode in args.modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', mode, str(rows)],
+                    capture_output=True, text=True, check=True, cwd=tmp,
+                ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['mode']:<11}{r['rows']:>9}{r['seconds']:>10}{str(r['peak_rss_mb']):>13}{str(r['file_kb']):>12}")
+
+
+if __name__ == '__main__':
+    main()
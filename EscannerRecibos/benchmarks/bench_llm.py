@@ -0,0 +1,92 @@
+"""
+Prueba de carga del planificador de llamadas al LLM (llm_client.py), sin red.
+
+Manda --pages prompts de página (textos del corpus de
+benchmarks/fixtures/compaction_corpus.json, compactados) desde --threads
+hilos a un LLMScheduler con el backend 'stub' en el proceso: tarda
+--latency segundos por pedido y responde 429 con retry-after si se pasa de
+--rpm pedidos por minuto, como la API real.
+
+Corre dos veces:
+- reactivo: sin límites configurados, el planificador solo reacciona a los
+  429 (baja la concurrencia y espera lo que pide retry-after);
+- con límites: LLM_REQUESTS_PER_MINUTE igual al límite del stub, así que
+  el balde de fichas espera antes de pasarse y no debería haber 429.
+
+Informa el tiempo total, páginas/seg, 429, reintentos, errores y la
+concurrencia con la que terminó. Con --rpm menor que --pages la corrida
+tarda al menos un minuto (es el ritmo que impone el límite).
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/bench_llm.py [--pages 90] [--rpm 60] [--latency 0.1] [--threads 8]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import config
+from compactor import compact_for_prompt
+from llm_client import LLMScheduler, LLMError, StubBackend
+from parser import create_prompt
+
+CORPUS_PATH = os.path.join(HERE, 'fixtures', 'compaction_corpus.json')
+
+
+def run(prompts, threads, backend, max_concurrency, requests_per_minute):
+    sched = LLMScheduler(backend=backend, max_concurrency=max_concurrency,
+                         requests_per_minute=requests_per_minute, tokens_per_minute=0)
+    failed = 0
+
+    def call(prompt):
+        try:
+            json.loads(sched.complete(prompt))
+            return True
+        except LLMError:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        failed = sum(1 for ok in pool.map(call, prompts) if not ok)
+    seconds = time.perf_counter() - start
+    return dict(sched.stats(), seconds=round(seconds, 2), failed=failed,
+                pages_per_sec=round(len(prompts) / seconds, 2))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--pages', type=int, default=90)
+    ap.add_argument('--rpm', type=int, default=60, help='Límite de pedidos por minuto del stub')
+    ap.add_argument('--latency', type=float, default=0.1, help='Latencia del stub (segundos)')
+    ap.add_argument('--threads', type=int, default=8, help='Hilos que llaman al LLM (como LLM_WORKERS)')
+    ap.add_argument('--concurrency', type=int, default=8, help='LLM_MAX_CONCURRENCY')
+    args = ap.parse_args()
+
+    with open(CORPUS_PATH, encoding='utf-8') as fh:
+        corpus = json.load(fh)
+    prompts = [create_prompt(compact_for_prompt(corpus[i % len(corpus)]['text'])[0]) for i in range(args.pages)]
+
+    # Sin la espera que pide el stub los reintentos se agotarían enseguida
+    config.LLM_MAX_RETRIES = max(config.LLM_MAX_RETRIES, 4)
+
+    print(f"{args.pages} páginas, stub con {args.rpm} pedidos/min y {args.latency * 1000:.0f} ms, "
+          f"{args.threads} hilos, concurrencia máxima {args.concurrency}\n")
+    print(f"{'modo':<13}{'segundos':>10}{'págs/s':>9}{'429':>6}{'reintentos':>12}{'fallidas':>10}{'concurrencia':>14}")
+    results = {}
+    for mode, rpm in (('reactivo', 0), ('con límites', args.rpm)):
+        backend = StubBackend(latency=args.latency, requests_per_minute=args.rpm)
+        r = results[mode] = run(prompts, args.threads, backend, args.concurrency, rpm)
+        print(f"{mode:<13}{r['seconds']:>10}{r['pages_per_sec']:>9}{r['rate_limited']:>6}{r['retry']:>12}"
+              f"{r['failed']:>10}{r['limit']:>14}")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
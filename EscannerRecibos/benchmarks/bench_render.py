@@ -0,0 +1,132 @@
+"""
+Micro-benchmark del paso render -> imagen PIL -> (OCR) de ocr.py.
+
+Compara el camino anterior (pixmap RGB -> PNG -> Image.open) con el actual
+(pixmap en grises -> Image.frombuffer sobre pix.samples) en ms/página y pico
+de memoria (RSS). Cada modo corre en un subproceso propio para que el pico
+de memoria de uno no contamine al otro.
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/bench_render.py [archivo.pdf] [--dpi 300] [--ocr] [--repeat 3]
+
+Sin PDF se genera uno sintético de una página escaneada.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from PIL import Image
+from ocr import render_page_image
+
+MODES = ['png', 'samples']
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB, macOS bytes
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def _synthetic_pdf(path):
+    """PDF de una página 'escaneada': texto renderizado e insertado como imagen."""
+    src = fitz.open()
+    page = src.new_page()
+    y = 60
+    for i in range(40):
+        page.insert_text((40, y), f"Concepto {i:02d}  Sueldo basico  Apellido y nombre  1.234.567,89", fontsize=10)
+        y += 18
+    pix = page.get_pixmap(dpi=200)
+    out = fitz.open()
+    scanned = out.new_page(width=page.rect.width, height=page.rect.height)
+    scanned.insert_image(scanned.rect, stream=pix.tobytes("png"))
+    out.save(path)
+
+
+def _run_png(page, dpi, do_ocr):
+    pix = page.get_pixmap(dpi=dpi)
+    image = Image.open(io.BytesIO(pix.tobytes("png")))
+    image.load()
+    if do_ocr:
+        import pytesseract
+        pytesseract.image_to_string(image, lang='spa')
+
+
+def _run_samples(page, dpi, do_ocr):
+    image, pix = render_page_image(page, dpi)
+    if do_ocr:
+        import pytesseract
+        pytesseract.image_to_string(image, lang='spa')
+
+
+def run_child(pdf_path, mode, dpi, do_ocr, repeat):
+    runner = _run_png if mode == 'png' else _run_samples
+    doc = fitz.open(pdf_path)
+    times = []
+    for _ in range(repeat):
+        for page in doc:
+            start = time.perf_counter()
+            runner(page, dpi, do_ocr)
+            times.append((time.perf_counter() - start) * 1000)
+    doc.close()
+    times.sort()
+    return {
+        'mode': mode,
+        'pages': len(times),
+        'ms_per_page_mean': round(sum(times) / len(times), 2),
+        'ms_per_page_p50': round(times[len(times) // 2], 2),
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('pdf', nargs='?')
+    ap.add_argument('--dpi', type=int, default=300)
+    ap.add_argument('--ocr', action='store_true', help='incluir Tesseract en la medición')
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.pdf, args.child, args.dpi, args.ocr, args.repeat)))
+        return
+
+    tmp = None
+    pdf_path = args.pdf
+    if not pdf_path:
+        tmp = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        tmp.close()
+        _synthetic_pdf(tmp.name)
+        pdf_path = tmp.name
+
+    try:
+        print(f"PDF: {pdf_path} | DPI: {args.dpi} | OCR: {'sí' if args.ocr else 'no'}")
+        print(f"{'modo':<10}{'páginas':>9}{'ms/pág (media)':>16}{'ms/pág (p50)':>14}{'pico RSS MB':>13}")
+        for mode in MODES:
+            cmd = [sys.executable, os.path.abspath(__file__), pdf_path, '--child', mode,
+                   '--dpi', str(args.dpi), '--repeat', str(args.repeat)]
+            if args.ocr:
+                cmd.append('--ocr')
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['mode']:<10}{r['pages']:>9}{r['ms_per_page_mean']:>16}{r['ms_per_page_p50']:>14}"
+                  f"{str(r['peak_rss_mb']):>13}")
+    finally:
+        if tmp:
+            os.unlink(tmp.name)
+
+
+if __name__ == '__main__':
+    main()
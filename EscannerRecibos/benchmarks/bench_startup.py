@@ -0,0 +1,140 @@
+"""
+Benchmark del arranque: tiempo de importación y latencia del primer pedido.
+
+- import: tiempo de 'import <módulo>' en un proceso nuevo (mediana de
+  --repeat corridas) para app, pipeline, parser y cli. Como referencia se
+  mide también importar las dependencias pesadas juntas (fitz, pytesseract,
+  openpyxl, groq), que es lo que se pagaba antes al importar cualquiera de
+  esos módulos.
+- first: en un proceso nuevo, cuánto tarda el primer lote (un PDF
+  sintético de --pages páginas con capa de texto, todas por el LLM) hasta
+  el primer resultado y hasta el final, contra el Groq falso local
+  (benchmarks/fake_groq.py). En frío ('cold') el primer pedido paga cargar
+  fitz y el SDK de groq, crear el cliente y abrir la conexión; con
+  pipeline.warm_up() antes ('warm') se informa aparte lo que tardó el
+  precalentamiento.
+
+Las cachés de OCR y LLM se desactivan.
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/bench_startup.py [--repeat 5] [--pages 3] [--latency 0.05]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+MODULES = ['app', 'pipeline', 'parser', 'cli']
+HEAVY_DEPS = 'fitz, pytesseract, openpyxl, groq'
+
+
+def _import_ms(statement, env):
+    code = f"import time; t = time.perf_counter(); {statement}; print((time.perf_counter() - t) * 1000)"
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=ROOT, env=env)
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        raise RuntimeError(f"Falló: {statement}")
+    return float(proc.stdout.strip().splitlines()[-1])
+
+
+def child_first(pdf_path, warm):
+    """Primer lote en este proceso (recién arrancado). Devuelve los tiempos en ms."""
+    start = time.perf_counter()
+    import config
+    config.LOCAL_EXTRACTOR_MIN_CONFIDENCE = 1.1
+    from pipeline import run_pipeline, warm_up
+    result = {'import_ms': round((time.perf_counter() - start) * 1000, 1), 'warm_up_ms': None}
+
+    if warm:
+        t = time.perf_counter()
+        warm_up()
+        result['warm_up_ms'] = round((time.perf_counter() - t) * 1000, 1)
+
+    t = time.perf_counter()
+    first = None
+    results = 0
+    for event in run_pipeline([pdf_path]):
+        if event['type'] == 'result':
+            results += 1
+            if first is None:
+                first = time.perf_counter() - t
+    result.update({
+        'first_result_ms': round(first * 1000, 1) if first is not None else None,
+        'batch_ms': round((time.perf_counter() - t) * 1000, 1),
+        'pages': results,
+    })
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--repeat', type=int, default=5, help='Corridas por medición (se informa la mediana)')
+    ap.add_argument('--pages', type=int, default=3, help='Páginas del PDF del primer lote')
+    ap.add_argument('--latency', type=float, default=0.05, help='Latencia del Groq falso (segundos)')
+    ap.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        pdf_path, mode = args.child
+        print(json.dumps(child_first(pdf_path, mode == 'warm')))
+        return
+
+    from fake_groq import start_server
+    from synthetic import make_pdf
+
+    server = start_server(latency=args.latency, jitter=0)
+    env = dict(os.environ,
+               GROQ_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+               GROQ_API_KEY='bench',
+               OCR_CACHE_ENABLED='0',
+               LLM_CACHE_ENABLED='0',
+               PYTHONPATH=ROOT)
+
+    try:
+        print(f"Importación (mediana de {args.repeat} procesos nuevos):")
+        imports = {}
+        for name, statement in [(m, f"import {m}") for m in MODULES] + [(HEAVY_DEPS, f"import {HEAVY_DEPS}")]:
+            imports[name] = round(statistics.median(_import_ms(statement, env) for _ in range(args.repeat)), 1)
+            print(f"  {name:<32}{imports[name]:>10.1f} ms")
+
+        print(f"\nPrimer lote ({args.pages} página(s), Groq falso con {args.latency * 1000:.0f} ms de latencia):")
+        print(f"  {'modo':<8}{'import':>10}{'warm-up':>10}{'1er result.':>13}{'lote':>10}")
+        first = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            pdf_path = os.path.join(workdir, 'recibos.pdf')
+            make_pdf(pdf_path, args.pages, 'text')
+            for mode in ('cold', 'warm'):
+                runs = []
+                for _ in range(args.repeat):
+                    proc = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), '--child', pdf_path, mode],
+                        capture_output=True, text=True, cwd=workdir, env=env,
+                    )
+                    if proc.returncode != 0:
+                        print(proc.stderr[-2000:], file=sys.stderr)
+                        raise RuntimeError(f"El primer lote ({mode}) falló")
+                    runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+                first[mode] = {
+                    key: round(statistics.median(r[key] for r in runs), 1) if runs[0][key] is not None else None
+                    for key in ('import_ms', 'warm_up_ms', 'first_result_ms', 'batch_ms')
+                }
+                r = first[mode]
+                warm_ms = '-' if r['warm_up_ms'] is None else r['warm_up_ms']
+                print(f"  {mode:<8}{r['import_ms']:>10}{warm_ms:>10}{r['first_result_ms']:>13}{r['batch_ms']:>10}  ms")
+    finally:
+        server.shutdown()
+
+    print(json.dumps({'imports_ms': imports, 'first_batch_ms': first}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Regresión de la compactación del texto OCR (compactor.py).
+
+Sobre un corpus fijo de textos de recibos (benchmarks/fixtures/
+compaction_corpus.json: texto "OCR" de cada página y los recibos
+esperados) verifica, página por página, que compactar no cambie lo que se
+extrae:
+
+- el apellido, el nombre y el neto esperados que están en el texto
+  original siguen estando en el compactado;
+- el extractor local da el mismo resultado con los dos textos;
+- con --llm, parser.process_ticket (Groq, o el Groq falso con --fake) da
+  los mismos recibos (nombre y monto normalizados) con los dos textos.
+
+Un cambio en la extracción solo cuenta como regresión si con el texto
+original salían los recibos esperados y con el compactado no; si el
+compactado da el resultado esperado y el original no, se informa como mejora.
+
+Informa los tokens estimados antes y después por página y en total, y
+termina con código 1 si alguna página cambió.
+
+El corpus sale de benchmarks/synthetic.py con variantes típicas del OCR
+(basura, anclas mal leídas, nombre en el renglón siguiente, dos copias,
+dos empleados, texto legal largo, sin anclas). Se regenera con --build
+(solo hace falta si se agregan variantes: es determinístico).
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/compaction_regression.py [--llm [--fake]] [--verbose]
+    python benchmarks/compaction_regression.py --build
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from compactor import compact_for_prompt, _fold
+from local_extractor import extract_receipt
+from synthetic import receipt_data, format_amount_ar
+
+CORPUS_PATH = os.path.join(HERE, 'fixtures', 'compaction_corpus.json')
+
+_BASURA = ["~ '. ,_ ..", "| | ||  |", "Ii l1 ;: '", "=== --- ===", "°°  ,, ´", "rn ~ i'"]
+_LEGAL = ("La presente liquidación se abona de acuerdo a lo establecido en el art. 140 de la Ley 20.744 "
+          "y sus modificatorias. El trabajador declara haber recibido copia del presente recibo y "
+          "que la suma percibida es conforme a su categoría y convenio colectivo de trabajo vigente.")
+
+
+# --- Corpus ---
+
+def _receipt_lines(data, rng, anchor_name="Apellido y nombre:", anchor_net="Neto a cobrar:",
+                   name_next_line=False, label=None):
+    lines = []
+    if label:
+        lines.append(label)
+    lines += [
+        "RECIBO DE HABERES - LEY 20.744",
+        "Empleador: COMERCIAL DEL SUR S.A.   CUIT: 30-71234567-8",
+        "Domicilio: Av. Siempre Viva 742, Córdoba",
+    ]
+    name = f"{data['apellido'].upper()}, {data['nombre'].upper()}"
+    if name_next_line:
+        lines += [anchor_name, f"{name}    Legajo: {data['legajo']}"]
+    else:
+        lines.append(f"{anchor_name} {name}    Legajo: {data['legajo']}")
+    lines.append(f"CUIL: {data['cuil']}    Categoría: Administrativo A    Período: {data['periodo']}")
+    lines.append("Concepto                               Haberes            Descuentos")
+    for concepto, monto in data['haberes']:
+        lines.append(f"{concepto:<38} {format_amount_ar(monto):>16}")
+    for concepto, monto in data['descuentos']:
+        lines.append(f"{concepto:<38} {'':>16}  {format_amount_ar(monto):>16}")
+    lines.append(f"Total bruto: $ {format_amount_ar(data['bruto'])}")
+    lines.append(f"{anchor_net} $ {format_amount_ar(data['neto'])}")
+    lines.append("Recibí el importe neto de esta liquidación en pago de mi remuneración.")
+    lines.append("Firma del empleado ____________________")
+    return lines
+
+
+def _with_noise(lines, rng):
+    """Intercala renglones basura y espacios de más, como deja Tesseract."""
+    out = []
+    for line in lines:
+        if rng.random() < 0.3:
+            out.append(rng.choice(_BASURA))
+        out.append(line.replace(' ', '  ') if rng.random() < 0.3 else line)
+        if rng.random() < 0.1:
+            out.append('')
+    return out
+
+
+def _expected(*datas):
+    return [{'nombre': d['nombre'], 'apellido': d['apellido'], 'sueldo': d['neto']} for d in datas]
+
+
+def build_corpus(pages_per_variant=3, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+
+    def add(variant, lines, expected):
+        corpus.append({'id': f"{variant}-{len(corpus) + 1}", 'variant': variant,
+                       'text': "\n".join(lines), 'expected': expected})
+
+    for _ in range(pages_per_variant):
+        d = receipt_data(rng)
+        add('limpio', _receipt_lines(d, rng), _expected(d))
+
+        d = receipt_data(rng)
+        add('basura', _with_noise(_receipt_lines(d, rng), rng), _expected(d))
+
+        d = receipt_data(rng)
+        add('anclas_mal_leidas', _with_noise(_receipt_lines(d, rng, anchor_name="Apel1ido y n0mbre:",
+                                                            anchor_net="Net0 a c0brar:"), rng), _expected(d))
+
+        d = receipt_data(rng)
+        add('nombre_abajo', _receipt_lines(d, rng, name_next_line=True), _expected(d))
+
+        d = receipt_data(rng)
+        add('dos_copias', _receipt_lines(d, rng, label="ORIGINAL") + _receipt_lines(d, rng, label="DUPLICADO"),
+            _expected(d))
+
+        d1, d2 = receipt_data(rng), receipt_data(rng)
+        add('dos_empleados', _receipt_lines(d1, rng) + _receipt_lines(d2, rng), _expected(d1, d2))
+
+        d = receipt_data(rng)
+        add('texto_legal', _receipt_lines(d, rng) + [_LEGAL[i:i + 90] for i in range(0, len(_LEGAL), 90)],
+            _expected(d))
+
+        d = receipt_data(rng)
+        add('sin_anclas', _with_noise(_receipt_lines(d, rng, anchor_name="Sr./Sra.", anchor_net="Importe:"), rng),
+            _expected(d))
+    return corpus
+
+
+# --- Verificación ---
+
+def _present(value, raw, compact):
+    """Si 'value' está en el texto original, tiene que seguir estando en el compactado."""
+    needle = _fold(value)
+    return needle not in _fold(raw) or needle in _fold(compact)
+
+
+def _recibo_keys(json_data):
+    from dedup import dedupe_key
+    return sorted(map(str, (dedupe_key(r) for r in (json_data or {}).get('recibos', []) if isinstance(r, dict))))
+
+
+def _compare(name, expected, raw_result, compact_result, problems, notes):
+    raw_keys, compact_keys = _recibo_keys(raw_result), _recibo_keys(compact_result)
+    if raw_keys == compact_keys:
+        return
+    if compact_keys == expected:
+        notes.append(f"{name} mejoró")
+    else:
+        problems.append(f"{name}: {raw_keys} -> {compact_keys}")
+
+
+def check_page(page, use_llm=False):
+    """Devuelve (texto compactado, tokens, problemas, notas) de una página del corpus."""
+    raw = page['text']
+    compact, tokens = compact_for_prompt(raw)
+    expected = _recibo_keys({'recibos': page['expected']})
+    problems, notes = [], []
+
+    for recibo in page['expected']:
+        for value in (recibo['apellido'].upper(), recibo['nombre'].upper(), format_amount_ar(recibo['sueldo'])):
+            if not _present(value, raw, compact):
+                problems.append(f"falta '{value}'")
+
+    _compare('extractor local', expected, extract_receipt(raw)[0], extract_receipt(compact)[0], problems, notes)
+
+    if use_llm:
+        from parser import process_ticket
+        _compare('LLM', expected, process_ticket(raw), process_ticket(compact), problems, notes)
+
+    return compact, tokens, problems, notes
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--corpus', default=CORPUS_PATH)
+    ap.add_argument('--build', action='store_true', help='Regenerar el corpus y salir')
+    ap.add_argument('--llm', action='store_true', help='Comparar también la extracción del LLM')
+    ap.add_argument('--fake', action='store_true', help='Usar el Groq falso local para --llm')
+    ap.add_argument('--verbose', action='store_true', help='Mostrar el texto compactado de cada página')
+    args = ap.parse_args()
+
+    if args.build:
+        corpus = build_corpus()
+        os.makedirs(os.path.dirname(os.path.abspath(args.corpus)), exist_ok=True)
+        with open(args.corpus, 'w', encoding='utf-8') as fh:
+            json.dump(corpus, fh, ensure_ascii=False, indent=1)
+        print(f"Corpus de {len(corpus)} páginas guardado en {args.corpus}")
+        return 0
+
+    with open(args.corpus, encoding='utf-8') as fh:
+        corpus = json.load(fh)
+
+    server = None
+    if args.llm:
+        # Se compara la extracción en vivo, no lo guardado
+        import config
+        config.LLM_CACHE_ENABLED = False
+        if args.fake:
+            from fake_groq import start_server
+            server = start_server(latency=0, jitter=0)
+            os.environ['GROQ_BASE_URL'] = f"http://127.0.0.1:{server.server_port}"
+            os.environ.setdefault('GROQ_API_KEY', 'regresion')
+
+    total_before = total_after = 0
+    failures = 0
+    print(f"{'página':<24}{'antes':>8}{'después':>9}{'ahorro':>9}  resultado")
+    try:
+        for page in corpus:
+            compact, tokens, problems, notes = check_page(page, args.llm)
+            total_before += tokens['before']
+            total_after += tokens['after']
+            saving = 1 - tokens['after'] / tokens['before'] if tokens['before'] else 0
+            status = 'CAMBIÓ: ' + '; '.join(problems) if problems else ', '.join(['ok'] + notes)
+            failures += bool(problems)
+            print(f"{page['id']:<24}{tokens['before']:>8}{tokens['after']:>9}{saving:>8.0%}  {status}")
+            if args.verbose:
+                print("    " + compact.replace("\n", "\n    "))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    saving = 1 - total_after / total_before if total_before else 0
+    print(f"\nTotal: {total_before} -> {total_after} tokens ({saving:.0%} menos), "
+          f"{failures} de {len(corpus)} página(s) con cambios")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
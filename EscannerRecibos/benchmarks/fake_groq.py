@@ -0,0 +1,129 @@
+"""
+Servidor local que imita el endpoint chat-completions de Groq (compatible
+con OpenAI) para correr el pipeline sin red ni API key.
+
+Cada pedido espera 'latency' segundos (+/- 'jitter') y responde con el JSON
+que devolvería el modelo: para el prompt de una página {"recibos": [...]},
+para el prompt por lotes {"paginas": [{"id", "recibos"}]}. Los datos se
+sacan del texto con el extractor local (llm_client.stub_answer), así que el
+resultado es plausible. Con 'rate_limit' (pedidos por minuto) responde 429
+con retry-after al pasarse, como la API real.
+
+El cliente se apunta acá con GROQ_BASE_URL=http://127.0.0.1:<puerto>
+(o, con LLM_BACKEND=openai, LLM_BASE_URL=http://127.0.0.1:<puerto>/v1).
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/fake_groq.py [--port 8089] [--latency 0.4] [--jitter 0.1] [--rate-limit 30]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import stub_answer, TokenBucket
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            retry_after = self._rate_limited(server)
+        if retry_after is not None:
+            self._send_json(429, {'error': {'message': 'Rate limit reached (fake)', 'type': 'tokens',
+                                            'code': 'rate_limit_exceeded'}},
+                            {'retry-after': str(math.ceil(retry_after))})
+            return
+
+        delay = max(0.0, server.latency + random.uniform(-server.jitter, server.jitter))
+        time.sleep(delay)
+
+        prompt = ''.join(m.get('content', '') for m in body.get('messages', []))
+        content = stub_answer(prompt)
+        self._send_json(200, {
+            'id': f"fake-{server.requests}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                      'total_tokens': (len(prompt) + len(content)) // 4},
+        })
+
+    def do_GET(self):
+        # Listado de modelos: lo usa el precalentamiento del cliente (llm_client.py)
+        self._send_json(200, {'object': 'list', 'data': [
+            {'id': 'fake', 'object': 'model', 'created': 0, 'owned_by': 'fake'}
+        ]})
+
+    @staticmethod
+    def _rate_limited(server):
+        """Segundos a esperar si el pedido supera el cupo de rate_limit por minuto (None si pasa)."""
+        wait = server.quota.try_take(1)
+        if not wait:
+            return None
+        server.rate_limited += 1
+        return wait
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, latency=0.4, jitter=0.1, rate_limit=0):
+    """
+    Arranca el servidor en un hilo. Devuelve el servidor; su URL base es
+    f"http://127.0.0.1:{server.server_port}" y se detiene con shutdown().
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.requests = 0
+    # Cupo que se repone de a poco, como la API real (0 = sin límite)
+    server.quota = TokenBucket(rate_limit)
+    server.rate_limited = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name='fake-groq', daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--port', type=int, default=8089)
+    ap.add_argument('--latency', type=float, default=0.4)
+    ap.add_argument('--jitter', type=float, default=0.1)
+    ap.add_argument('--rate-limit', type=int, default=0, help='Pedidos por minuto antes de responder 429 (0 = sin límite)')
+    args = ap.parse_args()
+    server = start_server(args.port, args.latency, args.jitter, args.rate_limit)
+    print(f"Groq falso escuchando en http://127.0.0.1:{server.server_port} (latencia {args.latency}s)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
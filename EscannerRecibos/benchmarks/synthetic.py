@@ -0,0 +1,139 @@
+"""
+Generador de PDFs sintéticos de recibos de sueldo para benchmarks.
+
+Dos variantes:
+- 'text':    PDF con capa de texto (como los que exporta un sistema de sueldos).
+- 'scanned': cada página se rasteriza, se le agrega ruido, una leve rotación
+             y compresión JPEG, y se inserta como imagen (sin capa de texto).
+
+Los datos (nombres, montos) salen de un generador con semilla, así que dos
+corridas con los mismos parámetros producen el mismo PDF.
+
+Uso (desde la carpeta EscannerRecibos):
+    python benchmarks/synthetic.py salida.pdf --pages 10 --variant scanned
+"""
+import argparse
+import io
+import random
+
+import fitz
+from PIL import Image, ImageFilter
+
+NOMBRES = ['Juan', 'María', 'Carlos', 'Ana', 'Jorge', 'Lucía', 'Ramón', 'Sofía', 'Diego', 'Valeria',
+           'Martín', 'Florencia', 'José Luis', 'María Laura', 'Pablo', 'Gabriela']
+APELLIDOS = ['Fernández', 'González', 'Rodríguez', 'López', 'Martínez', 'Pérez', 'Gómez', 'Díaz',
+             'Sánchez', 'Romero', 'Sosa', 'Álvarez', 'Torres', 'Ruiz', 'Ramírez', 'Benítez']
+CONCEPTOS = ['Sueldo básico', 'Antigüedad', 'Presentismo', 'Horas extras 50%', 'Adicional título']
+DESCUENTOS = ['Jubilación 11%', 'Ley 19032 3%', 'Obra social 3%', 'Cuota sindical 2%']
+MESES = ['ENERO', 'FEBRERO', 'MARZO', 'ABRIL', 'MAYO', 'JUNIO', 'JULIO', 'AGOSTO',
+         'SEPTIEMBRE', 'OCTUBRE', 'NOVIEMBRE', 'DICIEMBRE']
+
+
+def format_amount_ar(value):
+    """1234567.891 -> '1.234.567,89'"""
+    entero, decimales = f"{value:,.2f}".split('.')
+    return f"{entero.replace(',', '.')},{decimales}"
+
+
+def receipt_data(rng):
+    """Datos de un recibo: empleado, período, conceptos y neto."""
+    basico = round(rng.uniform(350_000, 2_500_000), 2)
+    haberes = [(CONCEPTOS[0], basico)]
+    for concepto in rng.sample(CONCEPTOS[1:], rng.randint(1, 3)):
+        haberes.append((concepto, round(basico * rng.uniform(0.02, 0.25), 2)))
+    bruto = sum(m for _, m in haberes)
+    descuentos = [(d, round(bruto * float(d.split()[-1].rstrip('%')) / 100, 2))
+                  for d in DESCUENTOS[:rng.randint(3, 4)]]
+    neto = round(bruto - sum(m for _, m in descuentos), 2)
+    return {
+        'nombre': rng.choice(NOMBRES),
+        'apellido': rng.choice(APELLIDOS),
+        'legajo': rng.randint(100, 9999),
+        'cuil': f"20-{rng.randint(10_000_000, 45_000_000)}-{rng.randint(0, 9)}",
+        'periodo': f"{rng.choice(MESES)} {rng.randint(2023, 2026)}",
+        'haberes': haberes,
+        'descuentos': descuentos,
+        'bruto': round(bruto, 2),
+        'neto': neto,
+    }
+
+
+def _draw_receipt(page, data):
+    """Escribe un recibo con el formato habitual (empleador, empleado, conceptos, neto)."""
+    y = 50
+
+    def line(text, x=40, size=10):
+        nonlocal y
+        page.insert_text((x, y), text, fontsize=size, fontname='helv')
+        y += size + 6
+
+    line("RECIBO DE HABERES - LEY 20.744", size=13)
+    line("Empleador: COMERCIAL DEL SUR S.A.   CUIT: 30-71234567-8")
+    line("Domicilio: Av. Siempre Viva 742, Córdoba")
+    y += 6
+    line(f"Apellido y nombre: {data['apellido'].upper()}, {data['nombre'].upper()}    Legajo: {data['legajo']}")
+    line(f"CUIL: {data['cuil']}    Categoría: Administrativo A    Período: {data['periodo']}")
+    y += 6
+    line("Concepto                               Haberes            Descuentos")
+    for concepto, monto in data['haberes']:
+        line(f"{concepto:<38} {format_amount_ar(monto):>16}")
+    for concepto, monto in data['descuentos']:
+        line(f"{concepto:<38} {'':>16}  {format_amount_ar(monto):>16}")
+    y += 6
+    line(f"Total bruto: $ {format_amount_ar(data['bruto'])}")
+    line(f"Neto a cobrar: $ {format_amount_ar(data['neto'])}", size=11)
+    y += 10
+    line("Recibí el importe neto de esta liquidación en pago de mi remuneración.", size=8)
+
+
+def _scan(page, rng, dpi=150):
+    """Imagen 'escaneada' de la página: grises, rotación leve, ruido y JPEG."""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    image = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+    image = image.rotate(rng.uniform(-1.2, 1.2), resample=Image.BICUBIC, fillcolor=255)
+    noise = Image.effect_noise(image.size, 40).filter(ImageFilter.GaussianBlur(0.6))
+    image = Image.blend(image, noise, 0.12)
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=rng.randint(55, 80))
+    return buf.getvalue()
+
+
+def make_pdf(path, pages, variant='text', seed=0):
+    """
+    Genera un PDF de 'pages' recibos (uno por página) en la variante pedida.
+    Devuelve la lista de datos esperados [{'nombre', 'apellido', 'sueldo'}].
+    """
+    if variant not in ('text', 'scanned'):
+        raise ValueError(f"Variante desconocida: {variant}")
+    rng = random.Random(f"{seed}-{variant}")
+    doc = fitz.open()
+    expected = []
+    for _ in range(pages):
+        data = receipt_data(rng)
+        expected.append({'nombre': data['nombre'], 'apellido': data['apellido'], 'sueldo': data['neto']})
+        page = doc.new_page(width=595, height=842)
+        _draw_receipt(page, data)
+        if variant == 'scanned':
+            src = fitz.open()
+            src.insert_pdf(doc, from_page=doc.page_count - 1)
+            image = _scan(src[0], rng)
+            doc.delete_page(-1)
+            page = doc.new_page(width=595, height=842)
+            page.insert_image(page.rect, stream=image)
+    doc.save(path, garbage=3, deflate=True)
+    return expected
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('output')
+    ap.add_argument('--pages', type=int, default=10)
+    ap.add_argument('--variant', choices=['text', 'scanned'], default='text')
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+    make_pdf(args.output, args.pages, args.variant, args.seed)
+    print(f"{args.output}: {args.pages} página(s) ({args.variant})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+    """
+    Caché clave/valor persistente en un archivo SQLite.
+
+    - Desalojo LRU: si el total supera max_bytes se borran las entradas
+      usadas hace más tiempo.
+    - TTL opcional (segundos, 0 = sin vencimiento).
+    - Segura entre hilos y entre procesos (los workers de OCR comparten el
+      mismo archivo): una conexión por hilo/proceso y journal WAL.
+    """
+
+    def __init__(self, path, max_bytes, ttl=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Tras un fork la conexión heredada no se puede reutilizar
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)")
+            self._schema_ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Devuelve el valor guardado o None si no existe o venció."""
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if self.ttl and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+        except sqlite3.Error as e:
+            print(f"[Caché {self.path}] Error de lectura: {e}")
+            return None
+
+    def set(self, key, value):
+        """Guarda el valor (texto) y desaloja entradas viejas si hace falta."""
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode('utf-8')), now, now),
+            )
+            self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"[Caché {self.path}] Error de escritura: {e}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Se libera hasta el 90% del máximo para no desalojar en cada escritura
+        target = int(self.max_bytes * 0.9)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT key, size FROM cache ORDER BY last_access").fetchall()
+            for key, size in rows:
+                if total <= target:
+                    break
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                total -= size
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        """Cantidad de entradas y bytes ocupados."""
+        try:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+            return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes}
+        except sqlite3.Error as e:
+            print(f"[Caché {self.path}] Error al leer estadísticas: {e}")
+            return {'entries': 0, 'bytes': 0, 'max_bytes': self.max_bytes}
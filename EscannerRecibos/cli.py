@@ -0,0 +1,311 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+import config
+from dedup import dedupe_key
+from ocr import page_count
+from pipeline import run_pipeline
+from receipt_store import receipt_store, current_period, parse_period, period_from_text
+
+# Procesamiento por lotes sin interfaz web.
+#
+# Procesa carpetas enteras de PDFs con el mismo pipeline que la app (OCR en
+# paralelo con todos los núcleos -> extractor local -> LLM) sin levantar
+# Flask ni mandar emails. En la carpeta de salida deja:
+#
+# - recibos.jsonl: un recibo por renglón (archivo, sha256, página, nombre,
+#   apellido, sueldo, período y extractor), escrito a medida que se extraen;
+# - progreso.jsonl: el registro de las páginas terminadas (por sha256 del
+#   PDF, así renombrar o mover los archivos no cambia nada);
+# - el reporte de Excel, al terminar.
+#
+# Los recibos también se guardan en el almacén de la app (receipt_store.py)
+# con el período que figura en cada recibo (si no figura, el de --period o el
+# mes en curso), así entran en el reporte mensual (/reports/AAAA-MM) junto
+# con los lotes subidos por la web.
+#
+# Si se corta (Ctrl+C, un error, se apaga la máquina) se vuelve a ejecutar
+# el mismo comando y sigue desde donde quedó: las páginas del registro no se
+# procesan de nuevo. Las páginas que fallaron (OCR o LLM) no se registran,
+# así que se reintentan en la corrida siguiente.
+#
+# Uso (desde la carpeta EscannerRecibos):
+#     python cli.py carpeta/ otra/*.pdf -o salida/ [-r] [--workers N] [--llm-workers N]
+#     python cli.py carpeta/ -o salida/ --restart      (empezar de cero)
+#     python cli.py carpeta/ -o salida/ --period 2024-03   (recibos sin período: marzo de 2024)
+
+RECIBOS_FILE = 'recibos.jsonl'
+JOURNAL_FILE = 'progreso.jsonl'
+
+
+def find_pdfs(inputs, recursive=False):
+    """Rutas de los PDFs de las carpetas, patrones y archivos indicados (sin repetir, ordenadas)."""
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(item, recursive=recursive) or [item]
+        for path in candidates:
+            if os.path.isfile(path) and path.lower().endswith('.pdf'):
+                found.append(os.path.abspath(path))
+    return sorted(set(found))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_jsonl(path):
+    """Renglones válidos de un JSON Lines (el último puede estar cortado si se interrumpió)."""
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+    return rows
+
+
+class Progress:
+    """
+    Registro de las páginas terminadas y archivo de recibos de la carpeta de
+    salida. Cada página se registra después de escribir sus recibos, así que
+    al retomar se descartan los recibos de páginas que no llegaron al registro.
+    """
+
+    def __init__(self, out_dir, restart=False):
+        self.recibos_path = os.path.join(out_dir, RECIBOS_FILE)
+        self.journal_path = os.path.join(out_dir, JOURNAL_FILE)
+        if restart:
+            for path in (self.recibos_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        # {sha256: {página, ...}}
+        self.done = {}
+        for row in _read_jsonl(self.journal_path):
+            self.done.setdefault(row['sha256'], set()).add(row['page'])
+
+        # Recibos de las páginas registradas (los demás se vuelven a extraer)
+        self.recibos = [r for r in _read_jsonl(self.recibos_path)
+                        if r.get('pagina') in self.done.get(r.get('sha256'), ())]
+        tmp_path = self.recibos_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            for recibo in self.recibos:
+                fh.write(json.dumps(recibo, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.recibos_path)
+
+        self._recibos_fh = open(self.recibos_path, 'a', encoding='utf-8')
+        self._journal_fh = open(self.journal_path, 'a', encoding='utf-8')
+
+    def pending_pages(self, sha256, total):
+        done = self.done.get(sha256, ())
+        return [p for p in range(1, total + 1) if p not in done]
+
+    def add_recibo(self, recibo):
+        self.recibos.append(recibo)
+        self._recibos_fh.write(json.dumps(recibo, ensure_ascii=False) + '\n')
+
+    def mark_done(self, sha256, page, **extra):
+        self._recibos_fh.flush()
+        os.fsync(self._recibos_fh.fileno())
+        self.done.setdefault(sha256, set()).add(page)
+        self._journal_fh.write(json.dumps(dict(extra, sha256=sha256, page=page)) + '\n')
+        self._journal_fh.flush()
+        os.fsync(self._journal_fh.fileno())
+
+    def close(self):
+        self._recibos_fh.close()
+        self._journal_fh.close()
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+def run(pdf_paths, out_dir, chunk_size=50, restart=False, period=None):
+    """
+    Procesa los PDFs y deja los resultados en out_dir (y en el almacén de
+    recibos, en el período que figura en cada uno o si no en 'period' o el mes en curso).
+    Devuelve el código de salida (0 ok, 1 sin recibos o con páginas fallidas).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    period = period or current_period()
+    progress = Progress(out_dir, restart=restart)
+
+    # Cada contenido se procesa una vez, con el primer nombre con el que aparece
+    names, pending = {}, {}
+    for path in pdf_paths:
+        sha256 = file_sha256(path)
+        if sha256 in names.values():
+            print(f"{path} es idéntico a otro PDF de la lista: se procesa una sola vez.", file=sys.stderr)
+            continue
+        names[path] = sha256
+        remaining = progress.pending_pages(sha256, page_count(path))
+        if remaining:
+            pending[path] = remaining
+
+    # Los recibos ya extraídos cuentan para la deduplicación
+    seen = {}
+    for recibo in progress.recibos:
+        key = dedupe_key(recibo, recibo.get('periodo')) if config.DEDUP_RECIBOS else None
+        if key is not None:
+            seen.setdefault(key, f"{recibo['archivo']} página {recibo['pagina']}")
+
+    total_pages = sum(len(p) for p in pending.values())
+    print(f"{len(names)} PDF(s), {total_pages} página(s) pendiente(s), "
+          f"{len(progress.recibos)} recibo(s) de corridas anteriores.", file=sys.stderr)
+
+    stats = {'pages': 0, 'skipped': 0, 'failed': 0, 'recibos': 0, 'duplicates': 0}
+    start = time.perf_counter()
+    interrupted = False
+    paths = list(pending)
+    try:
+        # Por tandas: el plan de duplicados y la primera página no esperan a todo el lote
+        for i in range(0, len(paths), chunk_size):
+            chunk = paths[i:i + chunk_size]
+            for event in run_pipeline(chunk, pages={p: pending[p] for p in chunk}):
+                path = event['pdf']
+                label = f"{os.path.basename(path)} p.{event['page']}"
+
+                if event['type'] == 'skip':
+                    if event['half']:
+                        continue
+                    stats['skipped'] += 1
+                    original_pdf, original_page = event['duplicate_of']
+                    progress.mark_done(names[path], event['page'], skipped=True)
+                    message = f"omitida, duplicado de {os.path.basename(original_pdf)} p.{original_page}"
+
+                elif event['type'] == 'result':
+                    json_data = event['json_data']
+                    if json_data is None or 'error' in json_data:
+                        # OCR o LLM fallidos (sin API key, sin conexión): no se registra la página
+                        stats['failed'] += 1
+                        message = "ERROR, se reintenta en la próxima corrida"
+                    else:
+                        found = []
+                        stored = []
+                        # El mismo sueldo en otro mes no es un duplicado
+                        text_period = period_from_text(event.get('text'))
+                        page_period = text_period or period
+                        for recibo in json_data.get('recibos') or []:
+                            key = dedupe_key(recibo, page_period) if config.DEDUP_RECIBOS else None
+                            if key is not None and key in seen:
+                                stats['duplicates'] += 1
+                                found.append(f"{recibo.get('apellido', '')} duplicado de {seen[key]}")
+                                continue
+                            if key is not None:
+                                seen[key] = f"{path} página {event['page']}"
+                            stored.append(dict(recibo, pdf_sha256=names[path], page=event['page'],
+                                               filename=os.path.basename(path), extractor=event['extractor']))
+                            progress.add_recibo({
+                                'archivo': path,
+                                'sha256': names[path],
+                                'pagina': event['page'],
+                                'nombre': recibo.get('nombre'),
+                                'apellido': recibo.get('apellido'),
+                                'sueldo': recibo.get('sueldo'),
+                                'periodo': page_period,
+                                'extractor': event['extractor'],
+                            })
+                            stats['recibos'] += 1
+                            found.append(f"{recibo.get('apellido', '')}, {recibo.get('nombre', '')} "
+                                         f"$ {recibo.get('sueldo')}")
+                        if stored and config.RECEIPT_STORE_ENABLED:
+                            receipt_store.upsert(stored, page_period, period_in_text=text_period is not None)
+                        progress.mark_done(names[path], event['page'])
+                        message = f"{event['extractor']}: " + ('; '.join(found) or 'sin recibos')
+
+                else:
+                    continue
+
+                stats['pages'] += 1
+                elapsed = time.perf_counter() - start
+                rate = stats['pages'] / elapsed if elapsed else 0
+                eta = _format_eta((total_pages - stats['pages']) / rate) if rate else '?'
+                print(f"[{stats['pages']}/{total_pages} | {rate:.1f} pág/s | faltan {eta}] {label}: {message}",
+                      file=sys.stderr)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        progress.close()
+
+    if interrupted:
+        print(f"\nInterrumpido tras {stats['pages']} página(s). Para seguir, ejecutar el mismo comando.",
+              file=sys.stderr)
+        return 130
+
+    print(f"\n{stats['pages']} página(s) en {time.perf_counter() - start:.1f} s: {stats['recibos']} recibo(s) "
+          f"nuevos, {stats['skipped']} página(s) duplicada(s), {stats['duplicates']} recibo(s) duplicado(s), "
+          f"{stats['failed']} página(s) con error.", file=sys.stderr)
+
+    if not progress.recibos:
+        print("No se encontraron recibos legibles en los documentos.", file=sys.stderr)
+        return 1
+
+    from excel_generator import create_excel_report
+    excel_path, _, _ = create_excel_report(progress.recibos, directory=out_dir)
+    if excel_path is None:
+        print("Error al generar el archivo Excel.", file=sys.stderr)
+        return 1
+    print(f"Reporte: {excel_path}\nRecibos: {progress.recibos_path}", file=sys.stderr)
+    if stats['failed']:
+        print(f"Hay {stats['failed']} página(s) con error: ejecutar de nuevo para reintentarlas.", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Procesamiento de carpetas de recibos en PDF sin la interfaz web")
+    ap.add_argument('inputs', nargs='+', help='Carpetas, archivos PDF o patrones (ej. "recibos/*.pdf")')
+    ap.add_argument('-o', '--output', required=True, help='Carpeta de salida (reporte, recibos.jsonl y progreso)')
+    ap.add_argument('-r', '--recursive', action='store_true', help='Buscar PDFs también en subcarpetas')
+    ap.add_argument('--workers', type=int, help='Procesos de OCR (por defecto uno por núcleo)')
+    ap.add_argument('--llm-workers', type=int, help=f'Hilos del LLM (por defecto {config.LLM_WORKERS})')
+    ap.add_argument('--chunk', type=int, default=50, help='PDFs por tanda del pipeline (por defecto 50)')
+    ap.add_argument('--restart', action='store_true', help='Descartar el progreso anterior y empezar de cero')
+    ap.add_argument('--period', help='Mes de los recibos sin período en su texto, AAAA-MM (por defecto el actual)')
+    ap.add_argument('--quiet', action='store_true', help='Mostrar solo el progreso (sin el log de OCR y LLM)')
+    args = ap.parse_args()
+
+    if args.workers:
+        config.OCR_WORKERS = args.workers
+    if args.llm_workers:
+        config.LLM_WORKERS = args.llm_workers
+
+    period = None
+    if args.period:
+        try:
+            period = parse_period(args.period)
+        except ValueError:
+            ap.error('--period debe tener el formato AAAA-MM')
+
+    pdf_paths = find_pdfs(args.inputs, args.recursive)
+    if not pdf_paths:
+        print("No se encontraron PDFs.", file=sys.stderr)
+        return 1
+
+    if args.quiet:
+        # El log de los módulos va a stdout; el progreso, a stderr
+        sys.stdout = open(os.devnull, 'w')
+    return run(pdf_paths, args.output, chunk_size=max(1, args.chunk), restart=args.restart, period=period)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import re
+import unicodedata
+import config
+
+# Compactación del texto OCR antes de mandarlo al LLM.
+#
+# El texto de una página trae mucho que el modelo no necesita para sacar
+# nombre y neto: la tabla de conceptos, los datos del empleador, el texto
+# legal y basura del OCR. Todo eso son tokens que se pagan y se esperan en
+# cada llamada. compact_text():
+#
+# 1. colapsa espacios y descarta renglones vacíos o repetidos seguidos;
+# 2. conserva siempre los renglones de las anclas (y los siguientes) de nombre
+#    ("Apellido y nombre", "Empleado", ...) y de monto ("Neto a cobrar",
+#    "Total", "Son pesos", ...), tolerando errores típicos del OCR;
+# 3. fuera de esas zonas descarta la basura (renglones sin palabras
+#    legibles), el texto legal y los datos del empleador, y la tabla de
+#    conceptos si la página tiene un ancla de monto;
+# 4. recorta al presupuesto de tokens (PROMPT_MAX_TOKENS por cada recibo
+#    de la página), primero las anclas y después el resto,
+#    siempre en el orden original.
+#
+# Si no se encuentra ningún ancla solo se limpia la basura y se recorta:
+# el LLM tiene que buscar el nombre en todo el texto.
+
+
+def estimate_tokens(text):
+    """Estimación rápida de tokens (~3.5 caracteres por token en español)."""
+    return int(len(text) / 3.5) + 1
+
+
+# Sobre el renglón "plegado" (minúsculas, sin tildes, 1/| -> l, 0 -> o)
+_RE_ANCLA_NOMBRE = re.compile(
+    r"ap[e3][li]{2}d[o0]s?\b|\bn[o0]mbres?\b|\bemplead[o0]\b|\btrabajad[o0]r\b|\bagente\b"
+)
+_RE_ANCLA_MONTO = re.compile(
+    r"\bneto\b|cobrar|percibir|\b[li]iquido\b|\btotal\b|\bbruto\b|\bimporte\b|son pesos"
+)
+# Texto legal, datos del empleador y pie del recibo
+_RE_DESCARTABLE = re.compile(
+    r"\b(recibi|conformidad|conforme|firma|ley\s*n?\W?\s*\d|art(iculo)?\W?\s*\d|deposit|"
+    r"lugar y fecha|cuit|domicilio|direccion|empleador|razon social)"
+)
+# Un importe con formato de moneda (1.234,56 / 1234,56 / 1,234.56)
+_RE_IMPORTE = re.compile(r"\d{1,3}(?:[.,\s]\d{3})*[.,]\d{2}\b")
+_RE_VOCAL = re.compile(r"[aeiou]")
+_RE_CONSONANTES = re.compile(r"[bcdfghjklmnpqrstvwxyz]{5,}")
+_PLIEGUE = str.maketrans({'1': 'l', '|': 'l', '!': 'l', '0': 'o'})
+
+
+def _fold(line):
+    line = unicodedata.normalize('NFKD', line.lower()).encode('ascii', 'ignore').decode()
+    return line.translate(_PLIEGUE)
+
+
+def _is_noise(line):
+    """Renglón sin contenido legible: símbolos, letras sueltas o basura del OCR."""
+    legible = 0
+    for token in line.split():
+        word = token.strip('.,;:()[]{}"\'$*-_=|/\\').lower()
+        if not word:
+            continue
+        if any(c.isdigit() for c in word) and sum(c.isdigit() for c in word) >= len(word) / 2:
+            legible += len(word)
+        elif (word.isalpha() and len(word) >= 2 and _RE_VOCAL.search(_fold(word))
+              and not _RE_CONSONANTES.search(_fold(word))):
+            legible += len(word)
+    visible = sum(1 for c in line if not c.isspace())
+    return legible < 3 or legible < visible * 0.5
+
+
+def _clean_lines(text):
+    """Renglones con espacios colapsados, sin vacíos ni repetidos seguidos."""
+    lines = []
+    for raw in (text or '').splitlines():
+        line = " ".join(raw.split())
+        if line and (not lines or line != lines[-1]):
+            lines.append(line)
+    return lines
+
+
+def compact_text(text, max_tokens=None, context_lines=None):
+    """
+    Versión compacta del texto OCR de una página para el prompt del LLM.
+    max_tokens es el presupuesto por recibo (por defecto config.PROMPT_MAX_TOKENS).
+    """
+    if max_tokens is None:
+        max_tokens = config.PROMPT_MAX_TOKENS
+    if context_lines is None:
+        context_lines = config.PROMPT_ANCHOR_CONTEXT_LINES
+
+    lines = _clean_lines(text)
+    folded = [_fold(line) for line in lines]
+    name_anchors = [i for i, f in enumerate(folded) if _RE_ANCLA_NOMBRE.search(f)]
+    # "Recibí el importe neto..." no es un ancla: sin números es texto legal
+    amount_anchors = [
+        i for i, f in enumerate(folded)
+        if _RE_ANCLA_MONTO.search(f) and (any(c.isdigit() for c in f) or not _RE_DESCARTABLE.search(f))
+    ]
+
+    # El dato suele estar en el mismo renglón que el ancla o en los siguientes
+    anchors = set(name_anchors + amount_anchors)
+    near = set()
+    for i in anchors:
+        near.update(range(i, min(len(lines), i + context_lines + 1)))
+
+    # Prioridad 0: ancla o renglón siguiente; 1: resto legible; None: se descarta
+    priorities = []
+    for i, line in enumerate(lines):
+        if not any(c.isalnum() for c in line):
+            priorities.append(None)
+        elif i in anchors:
+            priorities.append(0)
+        elif i in near and not _RE_DESCARTABLE.search(folded[i]):
+            priorities.append(0)
+        elif _is_noise(line) or _RE_DESCARTABLE.search(folded[i]):
+            priorities.append(None)
+        elif amount_anchors and _RE_IMPORTE.search(line):
+            # Renglón de la tabla de conceptos: el neto ya está cerca de su ancla
+            priorities.append(None)
+        else:
+            priorities.append(1)
+
+    # Presupuesto: un recibo por cada ancla de nombre (páginas con varias copias o empleados)
+    budget = max_tokens * max(1, len(name_anchors)) if max_tokens else None
+    keep = set()
+    used = 0
+    for level in (0, 1):
+        for i, priority in enumerate(priorities):
+            if priority != level:
+                continue
+            cost = estimate_tokens(lines[i] + "\n")
+            if budget is not None and used + cost > budget:
+                continue
+            keep.add(i)
+            used += cost
+
+    return "\n".join(line for i, line in enumerate(lines) if i in keep)
+
+
+def compact_for_prompt(text):
+    """
+    Texto a enviar al LLM y tokens estimados antes y después:
+    (texto, {'before': n, 'after': m}). Con PROMPT_COMPACT_ENABLED=0 el
+    texto va igual que salió del OCR.
+    """
+    before = estimate_tokens(text)
+    if not config.PROMPT_COMPACT_ENABLED:
+        return text, {'before': before, 'after': before}
+    compact = compact_text(text)
+    if not compact.strip():
+        # Nada reconocible: mejor que el LLM vea el original
+        return text, {'before': before, 'after': before}
+    return compact, {'before': before, 'after': estimate_tokens(compact)}
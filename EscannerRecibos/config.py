@@ -15,6 +15,8 @@ DEBUG = True
 HOST = '0.0.0.0'
 # Puerto
 PORT = 5000
+# Al arrancar, precalentar en segundo plano el pool de OCR y la conexión con el LLM
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', '0') == '1'
 
 # === CONFIGURACIÓN MAIL
 MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
@@ -22,6 +24,164 @@ MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
 MAIL_USERNAME = os.getenv('MAIL_USERNAME', '')
 MAIL_PASSWORD = os.getenv('MAIL_PASSWORD', '')
 EMAIL_RECIPIENT_HARDCODED = ''
+# STARTTLS al conectar (0 para un servidor SMTP local de prueba)
+MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', '1') == '1'
+# Timeout de la conexión SMTP (segundos)
+MAIL_TIMEOUT = int(os.getenv('MAIL_TIMEOUT', 30))
 
 # === CONFIGURACIÓN APIS
-GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
\ No newline at end of file
+GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+
+# === CONFIGURACIÓN LLM (ver llm_client.py)
+# Backend: 'groq', 'openai' (cualquier servidor compatible con OpenAI) o 'stub' (simulado, sin red)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'groq')
+LLM_MODEL = os.getenv('LLM_MODEL', 'llama-3.1-8b-instant')
+# URL base y clave del servidor compatible con OpenAI (backend 'openai')
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', 'http://127.0.0.1:8080/v1')
+LLM_API_KEY = os.getenv('LLM_API_KEY', '')
+# Timeout de cada llamada (segundos)
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+# Llamadas simultáneas máximas (baja sola ante respuestas 429 y se recupera de a una)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+# Límites del plan de la API (0 = sin límite: solo se reacciona a los 429)
+LLM_REQUESTS_PER_MINUTE = int(os.getenv('LLM_REQUESTS_PER_MINUTE', 0))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 0))
+# Tokens de respuesta que se reservan por llamada hasta conocer el uso real
+LLM_COMPLETION_TOKENS = int(os.getenv('LLM_COMPLETION_TOKENS', 200))
+# Reintentos ante 429, timeouts, errores de conexión y 5xx (backoff exponencial con jitter)
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+LLM_RETRY_BASE_SECONDS = float(os.getenv('LLM_RETRY_BASE_SECONDS', 1))
+LLM_RETRY_MAX_SECONDS = float(os.getenv('LLM_RETRY_MAX_SECONDS', 30))
+# Backend 'stub': latencia simulada (segundos) y pedidos por minuto antes de responder 429 (0 = sin límite)
+LLM_STUB_LATENCY = float(os.getenv('LLM_STUB_LATENCY', 0.2))
+LLM_STUB_REQUESTS_PER_MINUTE = int(os.getenv('LLM_STUB_REQUESTS_PER_MINUTE', 0))
+
+# === CONFIGURACIÓN OCR
+# Usar la capa de texto embebida del PDF cuando sea de buena calidad
+OCR_USE_TEXT_LAYER = os.getenv('OCR_USE_TEXT_LAYER', '1') == '1'
+# Mínimo de caracteres útiles para aceptar la capa de texto de una página
+OCR_TEXT_LAYER_MIN_CHARS = int(os.getenv('OCR_TEXT_LAYER_MIN_CHARS', 80))
+# Proporción mínima de palabras "reconocibles" en la capa de texto
+OCR_TEXT_LAYER_MIN_WORD_RATIO = float(os.getenv('OCR_TEXT_LAYER_MIN_WORD_RATIO', 0.6))
+# DPI de render para OCR
+OCR_DPI = int(os.getenv('OCR_DPI', 300))
+# Idioma de Tesseract
+OCR_LANG = os.getenv('OCR_LANG', 'spa')
+# Motor de OCR: 'tesserocr' (persistente, carga el modelo una vez por proceso),
+# 'pytesseract' (un proceso por página) o 'auto' (tesserocr si está instalado)
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto')
+# DPI de la primera pasada de OCR (0 = usar siempre OCR_DPI)
+OCR_LOW_DPI = int(os.getenv('OCR_LOW_DPI', 200))
+# Confianza media mínima de Tesseract (0-100) para aceptar la pasada de DPI bajo
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', 75))
+# Procesos de OCR en paralelo (0 = uno por núcleo)
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', 0))
+# Páginas que procesa cada tarea de un worker
+OCR_PAGES_PER_TASK = int(os.getenv('OCR_PAGES_PER_TASK', 4))
+# Tiempo máximo de OCR por página en segundos (0 = sin límite)
+OCR_PAGE_TIMEOUT = float(os.getenv('OCR_PAGE_TIMEOUT', 120))
+# OCR por regiones para formatos de recibo conocidos (ver layouts.py)
+OCR_ROI_ENABLED = os.getenv('OCR_ROI_ENABLED', '1') == '1'
+# Registro de formatos (JSON); si no existe se hace siempre OCR de página completa
+LAYOUTS_PATH = os.getenv('LAYOUTS_PATH', 'layouts.json')
+# Distancia de Hamming máxima (de 256 bits) entre hashes perceptuales para reconocer un formato
+LAYOUT_HASH_MAX_DISTANCE = int(os.getenv('LAYOUT_HASH_MAX_DISTANCE', 24))
+# Confianza mínima del extractor local sobre lo leído en las regiones;
+# por debajo se repite el OCR con la página completa
+OCR_ROI_MIN_CONFIDENCE = float(os.getenv('OCR_ROI_MIN_CONFIDENCE', 0.8))
+
+# === CONFIGURACIÓN MEMORIA (ver memory_budget.py)
+# Memoria para renderizar páginas y pasarlas por OCR, entre todos los lotes (MB, 0 = sin límite)
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', 1024))
+# Bytes estimados por píxel renderizado: el pixmap en gris (1) más las copias del motor de OCR
+MEMORY_BYTES_PER_PIXEL = float(os.getenv('MEMORY_BYTES_PER_PIXEL', 4))
+
+# === CONFIGURACIÓN DUPLICADOS (ver dedup.py)
+# Omitir antes del OCR las páginas (y medias hojas) casi idénticas a otra del lote
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', '1') == '1'
+# DPI del render de baja resolución para la huella
+DEDUP_DPI = int(os.getenv('DEDUP_DPI', 72))
+# Corrimiento (píxeles a DEDUP_DPI) que se tolera entre la tinta de dos copias
+DEDUP_TOLERANCE_PX = int(os.getenv('DEDUP_TOLERANCE_PX', 1))
+# Distancia de Hamming máxima (de 1024 bits) del hash grueso para comparar en detalle
+DEDUP_COARSE_MAX_DISTANCE = int(os.getenv('DEDUP_COARSE_MAX_DISTANCE', 48))
+# Celdas de 8x8 px que pueden cambiar entre dos páginas para considerarlas iguales.
+# Es conservador a propósito: un nombre o un importe distinto cambia 5 o más
+DEDUP_MAX_CHANGED_CELLS = int(os.getenv('DEDUP_MAX_CHANGED_CELLS', 2))
+# Páginas escaneadas anteriores contra las que se compara cada una
+DEDUP_WINDOW = int(os.getenv('DEDUP_WINDOW', 4))
+# Deduplicar los recibos extraídos por nombre y monto normalizados
+DEDUP_RECIBOS = os.getenv('DEDUP_RECIBOS', '1') == '1'
+
+# === CONFIGURACIÓN PIPELINE
+# Hilos que llaman al LLM en paralelo
+LLM_WORKERS = int(os.getenv('LLM_WORKERS', 4))
+# Tamaño de la cola entre el OCR y el LLM (páginas)
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 8))
+# Presupuesto de tokens por llamada al agrupar varias páginas (0 = una página por llamada)
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv('LLM_BATCH_TOKEN_BUDGET', 6000))
+# Máximo de páginas por llamada agrupada
+LLM_BATCH_MAX_PAGES = int(os.getenv('LLM_BATCH_MAX_PAGES', 20))
+# Compactar el texto OCR antes de mandarlo al LLM (ver compactor.py)
+PROMPT_COMPACT_ENABLED = os.getenv('PROMPT_COMPACT_ENABLED', '1') == '1'
+# Presupuesto de tokens del texto compactado, por cada recibo de la página (0 = sin recorte)
+PROMPT_MAX_TOKENS = int(os.getenv('PROMPT_MAX_TOKENS', 300))
+# Renglones que se conservan antes y después de cada ancla de nombre o de monto
+PROMPT_ANCHOR_CONTEXT_LINES = int(os.getenv('PROMPT_ANCHOR_CONTEXT_LINES', 1))
+
+# === CONFIGURACIÓN CACHÉ
+# Caché persistente del texto OCR por página
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', '1') == '1'
+OCR_CACHE_PATH = os.getenv('OCR_CACHE_PATH', os.path.join('cache', 'ocr_cache.sqlite3'))
+OCR_CACHE_MAX_MB = int(os.getenv('OCR_CACHE_MAX_MB', 200))
+# Caché persistente de extracciones del LLM (texto OCR normalizado -> recibos)
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') == '1'
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join('cache', 'llm_cache.sqlite3'))
+LLM_CACHE_MAX_MB = int(os.getenv('LLM_CACHE_MAX_MB', 50))
+# Vencimiento de las entradas en segundos (por defecto 30 días)
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 30 * 24 * 3600))
+
+# === CONFIGURACIÓN EXTRACCIÓN LOCAL
+# Confianza mínima del extractor por reglas para no consultar al LLM (1.1 = siempre LLM)
+LOCAL_EXTRACTOR_MIN_CONFIDENCE = float(os.getenv('LOCAL_EXTRACTOR_MIN_CONFIDENCE', 0.9))
+
+# === CONFIGURACIÓN EXCEL
+# A partir de cuántas filas el reporte se genera en modo streaming (write-only)
+EXCEL_STREAMING_THRESHOLD = int(os.getenv('EXCEL_STREAMING_THRESHOLD', 1000))
+
+# === CONFIGURACIÓN RECIBOS GUARDADOS (ver receipt_store.py)
+# Guardar los recibos de cada lote para armar reportes mensuales sin reprocesar
+RECEIPT_STORE_ENABLED = os.getenv('RECEIPT_STORE_ENABLED', '1') == '1'
+RECEIPT_STORE_PATH = os.getenv('RECEIPT_STORE_PATH', os.path.join('data', 'recibos.sqlite3'))
+# Retención de temp_reports: días que se conserva un reporte y tamaño máximo de la carpeta (MB).
+# Los reportes que la bandeja de salida todavía tiene que enviar no se borran
+REPORTS_RETENTION_DAYS = int(os.getenv('REPORTS_RETENTION_DAYS', 7))
+REPORTS_MAX_MB = int(os.getenv('REPORTS_MAX_MB', 500))
+
+# === CONFIGURACIÓN TRABAJOS
+# Lotes que se procesan a la vez (los demás esperan en cola)
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', 2))
+# Segundos que se conserva el log de un trabajo terminado
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 3600))
+
+# === CONFIGURACIÓN SUBIDAS
+# Tamaño de bloque al leer el cuerpo de la subida (bytes)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 256 * 1024))
+# Límites de tamaño por archivo y por lote (MB)
+UPLOAD_MAX_FILE_MB = int(os.getenv('UPLOAD_MAX_FILE_MB', 100))
+UPLOAD_MAX_BATCH_MB = int(os.getenv('UPLOAD_MAX_BATCH_MB', 1024))
+# Tamaño máximo del almacén de PDFs por contenido (MB)
+UPLOAD_STORE_MAX_MB = int(os.getenv('UPLOAD_STORE_MAX_MB', 2048))
+
+# === CONFIGURACIÓN BANDEJA DE SALIDA (EMAIL)
+# Carpeta de la cola de emails pendientes (sobrevive a reinicios)
+OUTBOX_DIR = os.getenv('OUTBOX_DIR', 'outbox')
+# Reintentos por mensaje antes de pasarlo a <outbox>/failed
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+# Backoff exponencial entre reintentos (segundos)
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', 30))
+OUTBOX_RETRY_MAX_SECONDS = int(os.getenv('OUTBOX_RETRY_MAX_SECONDS', 3600))
+# Juntar los reportes de esta ventana en un solo email (0 = uno por reporte)
+OUTBOX_DIGEST_SECONDS = int(os.getenv('OUTBOX_DIGEST_SECONDS', 0))
+# Cerrar la conexión SMTP tras estos segundos sin envíos
+OUTBOX_IDLE_SECONDS = int(os.getenv('OUTBOX_IDLE_SECONDS', 60))
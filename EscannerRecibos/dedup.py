@@ -0,0 +1,325 @@
+import re
+import unicodedata
+from collections import deque
+from lazy_imports import lazy_module
+from PIL import Image, ImageChops, ImageFilter
+import config
+from ocr import extract_text_layer, text_layer_quality, page_content_hash
+from parser import normalize_text
+
+fitz = lazy_module('fitz')
+
+# Detección de páginas y recibos duplicados.
+#
+# Los recibos se imprimen por duplicado (copia del empleador y del
+# empleado) y muchas veces se escanean las dos, en páginas separadas o lado
+# a lado en la misma hoja apaisada. Antes del OCR se arma un plan del lote
+# (plan_batch) que omite las páginas repetidas y, en las hojas con dos
+# copias iguales lado a lado, procesa solo la mitad izquierda:
+#
+# 1. Página idéntica (mismo contenido en el PDF): mismo ocr.page_content_hash.
+# 2. Página con capa de texto: mismo texto normalizado (sin ORIGINAL/DUPLICADO).
+# 3. Página escaneada: huella perceptual de un render a DEDUP_DPI (tinta
+#    binarizada y enderezada), comparada con las últimas DEDUP_WINDOW páginas.
+#    Primero un hash grueso de 32x32 descarta las que no se parecen; después
+#    se alinean por sus perfiles de tinta y se cuentan las celdas donde una
+#    tiene tinta densa sin tinta de la otra cerca (tolera el ruido y los
+#    corrimientos chicos del escaneo, no un nombre o un importe distinto).
+#
+# El umbral de las páginas escaneadas es conservador: dos recibos de
+# empleados distintos con el mismo formato difieren en pocas celdas, y
+# omitir uno por error es peor que procesarlo dos veces. Las copias
+# escaneadas por separado que difieren en la marca ORIGINAL/DUPLICADO
+# cambian tanto como un nombre y no se omiten acá; esas se descartan
+# después, al deduplicar los recibos extraídos por nombre y monto
+# (dedupe_key).
+
+# Enderezado: búsqueda gruesa de -2° a 2° cada 0,25° sobre una versión a
+# _DESKEW_DPI y después fina, cada 0,05°, a DEDUP_DPI
+_DESKEW_DPI = 36
+_DESKEW_COARSE = [a / 4 for a in range(-8, 9)]
+_DESKEW_FINE = [a / 20 for a in range(-2, 3)]
+_INK_THRESHOLD = 150
+_COARSE_SIZE = 32
+_SHIFTS = (-1, 0, 1)
+# Corrimiento máximo (píxeles a DEDUP_DPI) entre dos escaneos de la misma hoja
+_MAX_OFFSET = 24
+# Las diferencias se cuentan en celdas de 8x8 píxeles: una celda "cambió"
+# si más de ~15% de ella es tinta de una copia sin correspondencia en la
+# otra. El ruido del escaneo deja píxeles sueltos; un nombre o un importe
+# distinto, varias celdas densas.
+_CELL_PX = 8
+_CELL_MIN_LEVEL = 40
+# Diferencia de dos huellas que no se pueden comparar
+_MAX_CELLS = 10 ** 6
+# Con más celdas distintas que esto en la primera comparación no se sigue
+_GIVE_UP_CELLS = 40
+
+
+class Fingerprint:
+    """Huella de una página (o de media página) para comparar contra otras."""
+
+    def __init__(self, image):
+        # 'image' en modo 'L': 255 = tinta, 0 = fondo
+        self.image = image
+        self.ink = image.histogram()[255]
+        # Tinta "engordada": marca la zona cercana a la tinta de esta página
+        self.dilated = image.filter(ImageFilter.MaxFilter(2 * config.DEDUP_TOLERANCE_PX + 1))
+        coarse = image.resize((_COARSE_SIZE, _COARSE_SIZE), Image.BOX).tobytes()
+        bits = 0
+        for value in coarse:
+            bits = (bits << 1) | (1 if value > 12 else 0)
+        self.coarse = bits
+        # Perfiles de tinta por fila y por columna, para alinear dos huellas
+        self.rows = list(image.resize((1, image.height), Image.BOX).tobytes())
+        self.cols = list(image.resize((image.width, 1), Image.BOX).tobytes())
+
+    @property
+    def blank(self):
+        return self.ink < 50
+
+
+def _profile_score(image):
+    """Para una imagen de tinta: qué tan concentrada está en renglones (mayor = más derecha)."""
+    def score(angle):
+        # El desvío mínimo hace que todos los ángulos pasen por la misma interpolación
+        rotated = image.rotate(angle + 1e-3, resample=Image.BILINEAR, fillcolor=0)
+        profile = rotated.resize((1, rotated.height), Image.BOX).tobytes()
+        return sum(v * v for v in profile)
+    return score
+
+
+def _deskew(ink_image):
+    """Ángulo (grados) que alinea los renglones: maximiza la varianza del perfil horizontal."""
+    small = ink_image.resize((max(1, ink_image.width * _DESKEW_DPI // config.DEDUP_DPI),
+                              max(1, ink_image.height * _DESKEW_DPI // config.DEDUP_DPI)), Image.BOX)
+    best = max(_DESKEW_COARSE, key=_profile_score(small))
+    return max((best + step for step in _DESKEW_FINE), key=_profile_score(ink_image))
+
+
+def fingerprint_page(page, clip=None):
+    """
+    Huella de la página (o de la zona 'clip', un fitz.Rect) a partir de un
+    render en grises a config.DEDUP_DPI.
+    """
+    pix = page.get_pixmap(dpi=config.DEDUP_DPI, colorspace=fitz.csGRAY, alpha=False, clip=clip)
+    gray = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+    ink = gray.point(lambda v: 255 if v < _INK_THRESHOLD else 0)
+    del gray, pix
+    angle = _deskew(ink)
+    if angle:
+        ink = ink.rotate(angle, resample=Image.BILINEAR, fillcolor=0).point(lambda v: 255 if v > 127 else 0)
+    return Fingerprint(ink)
+
+
+def _correlation(a, b, offset):
+    n = len(a)
+    return sum(a[i] * b[i - offset] for i in range(max(0, offset), min(n, n + offset)))
+
+
+def _best_offset(a, b):
+    """
+    Corrimiento de 'b' que mejor alinea su perfil con el de 'a'
+    (correlación): primero sobre los perfiles reducidos a 1/4 y después se
+    ajusta al píxel.
+    """
+    a4 = [sum(a[i:i + 4]) for i in range(0, len(a), 4)]
+    b4 = [sum(b[i:i + 4]) for i in range(0, len(b), 4)]
+    coarse = max(range(-_MAX_OFFSET // 4, _MAX_OFFSET // 4 + 1), key=lambda o: _correlation(a4, b4, o))
+    return max(range(coarse * 4 - 3, coarse * 4 + 4), key=lambda o: _correlation(a, b, o))
+
+
+def _overlap(size, dx, dy):
+    """Cajas de la zona común de 'a' y de 'b' corrida (dx, dy)."""
+    width, height = size
+    box_a = (max(0, dx), max(0, dy), min(width, width + dx), min(height, height + dy))
+    box_b = (max(0, -dx), max(0, -dy), min(width, width - dx), min(height, height - dy))
+    return box_a, box_b
+
+
+def _changed_cells(image, other_dilated):
+    """Celdas donde 'image' tiene tinta densa que no cae cerca de tinta de la otra."""
+    uncovered = ImageChops.subtract(image, other_dilated)
+    cells = uncovered.resize((max(1, uncovered.width // _CELL_PX), max(1, uncovered.height // _CELL_PX)), Image.BOX)
+    return sum(cells.histogram()[_CELL_MIN_LEVEL:])
+
+
+def difference(a, b):
+    """
+    Diferencia entre dos huellas: cantidad de celdas que cambiaron (0 =
+    iguales salvo ruido), con 'b' corrida según sus perfiles de tinta
+    (más/menos un píxel). Se toma la mayor de las dos direcciones, así
+    cuenta tanto lo que falta como lo que sobra.
+    """
+    if a.blank or b.blank:
+        return 0 if a.blank and b.blank else _MAX_CELLS
+    if a.image.size != b.image.size:
+        return _MAX_CELLS
+
+    base_dx, base_dy = _best_offset(a.cols, b.cols), _best_offset(a.rows, b.rows)
+    best = _MAX_CELLS
+    # Se empieza por el corrimiento de los perfiles; si ahí ya difieren
+    # mucho no son la misma hoja y no vale la pena afinar
+    for dx, dy in sorted(((dx, dy) for dx in _SHIFTS for dy in _SHIFTS), key=lambda s: s != (0, 0)):
+        box_a, box_b = _overlap(a.image.size, base_dx + dx, base_dy + dy)
+        score = max(_changed_cells(a.image.crop(box_a), b.dilated.crop(box_b)),
+                    _changed_cells(b.image.crop(box_b), a.dilated.crop(box_a)))
+        best = min(best, score)
+        if best == 0 or best > _GIVE_UP_CELLS:
+            break
+    return best
+
+
+def coarse_distance(a, b):
+    return bin(a.coarse ^ b.coarse).count('1')
+
+
+def is_duplicate(a, b):
+    """Devuelve (es_duplicado, diferencia) entre dos huellas."""
+    if coarse_distance(a, b) > config.DEDUP_COARSE_MAX_DISTANCE:
+        return False, None
+    diff = difference(a, b)
+    return diff <= config.DEDUP_MAX_CHANGED_CELLS, diff
+
+
+def half_clips(page):
+    """Mitades izquierda y derecha de una hoja apaisada (o None si es vertical)."""
+    r = page.rect
+    if r.width < r.height * 1.2:
+        return None
+    mid = r.x0 + r.width / 2
+    return fitz.Rect(r.x0, r.y0, mid, r.y1), fitz.Rect(mid, r.y0, r.x1, r.y1)
+
+
+def _text_key(page, clip=None):
+    """Texto normalizado de la capa de texto, o None si la página hay que pasarla por OCR."""
+    if not config.OCR_USE_TEXT_LAYER:
+        return None
+    text, words = extract_text_layer(page, clip=clip)
+    if not text_layer_quality(text, words)['ok']:
+        return None
+    return normalize_text(text)
+
+
+class BatchPlan:
+    """
+    Qué procesar de cada PDF del lote:
+    - pages: {pdf: [páginas]} en orden, sin las duplicadas.
+    - clips: {pdf: {página: (x0, y0, x1, y1)}} zona a procesar (mitad izquierda).
+    - skips: lo omitido, un dict por página o mitad con 'pdf', 'page',
+      'half' (None o 'derecha'), 'duplicate_of' (pdf, página), 'reason'
+      ('identical' / 'text' / 'image') y 'difference' (celdas distintas, solo 'image').
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.clips = {}
+        self.skips = []
+
+
+def _plan_page(page, pdf_path, page_num, plan, seen_keys, seen_texts, recent):
+    ref = (pdf_path, page_num)
+
+    # 1. Contenido idéntico en el PDF (sirve para digitales y escaneadas)
+    key = page_content_hash(page)
+    if key in seen_keys:
+        return {'duplicate_of': seen_keys[key], 'reason': 'identical'}
+    seen_keys[key] = ref
+
+    halves = half_clips(page)
+
+    # 2. Capa de texto: se compara el texto normalizado
+    text = _text_key(page)
+    if text is not None:
+        if text and text in seen_texts:
+            return {'duplicate_of': seen_texts[text], 'reason': 'text'}
+        seen_texts.setdefault(text, ref)
+        if halves:
+            left, right = (_text_key(page, clip) for clip in halves)
+            if left and left == right:
+                plan.clips.setdefault(pdf_path, {})[page_num] = tuple(halves[0])
+                plan.skips.append({'pdf': pdf_path, 'page': page_num, 'half': 'derecha',
+                                   'duplicate_of': ref, 'reason': 'text'})
+        return None
+
+    # 3. Escaneada: huella perceptual contra las últimas páginas
+    fingerprint = fingerprint_page(page)
+    if not fingerprint.blank:
+        for other_ref, other in recent:
+            duplicate, diff = is_duplicate(fingerprint, other)
+            if duplicate:
+                return {'duplicate_of': other_ref, 'reason': 'image', 'difference': diff}
+        recent.append((ref, fingerprint))
+
+    if halves:
+        left, right = (fingerprint_page(page, clip) for clip in halves)
+        if not left.blank and not right.blank:
+            duplicate, diff = is_duplicate(left, right)
+            if duplicate:
+                plan.clips.setdefault(pdf_path, {})[page_num] = tuple(halves[0])
+                plan.skips.append({'pdf': pdf_path, 'page': page_num, 'half': 'derecha',
+                                   'duplicate_of': ref, 'reason': 'image', 'difference': diff})
+    return None
+
+
+def plan_batch(pdf_paths, pages=None):
+    """
+    Recorre las páginas del lote (sin OCR) y arma el BatchPlan con las
+    páginas y mitades a procesar. 'pages' ({pdf: [páginas]}) limita el plan
+    a esas páginas de cada PDF. Un PDF que no se puede abrir se deja
+    completo en el plan (el OCR informará el error).
+    """
+    plan = BatchPlan()
+    seen_keys, seen_texts = {}, {}
+    recent = deque(maxlen=max(config.DEDUP_WINDOW, 0))
+
+    for pdf_path in pdf_paths:
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            print(f"Deduplicación: no se pudo abrir '{pdf_path}': {e}")
+            plan.pages[pdf_path] = None
+            continue
+        with doc:
+            kept = plan.pages[pdf_path] = []
+            page_nums = range(1, len(doc) + 1)
+            if pages is not None and pages.get(pdf_path) is not None:
+                page_nums = pages[pdf_path]
+            for page_num in page_nums:
+                try:
+                    skip = _plan_page(doc[page_num - 1], pdf_path, page_num, plan, seen_keys, seen_texts, recent)
+                except Exception as e:
+                    print(f"Deduplicación: error en la página {page_num} de '{pdf_path}': {e}")
+                    skip = None
+                if skip is None:
+                    kept.append(page_num)
+                else:
+                    plan.skips.append(dict(skip, pdf=pdf_path, page=page_num, half=None))
+    return plan
+
+
+# --- Recibos ---
+
+def normalize_name(value):
+    """Nombre sin tildes, signos, mayúsculas ni orden de las palabras."""
+    value = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode()
+    return " ".join(sorted(re.findall(r"[a-z]+", value.lower())))
+
+
+def dedupe_key(recibo, period=None):
+    """
+    Clave de un recibo: nombre y apellido normalizados (sin tildes, signos
+    ni orden) y monto redondeado al centavo. None si no tiene nombre.
+    Con 'period' (AAAA-MM) el período es parte de la clave: el mismo sueldo
+    en otro mes es otro recibo.
+    """
+    name = normalize_name(f"{recibo.get('nombre', '')} {recibo.get('apellido', '')}")
+    if not name:
+        return None
+    try:
+        sueldo = round(float(recibo.get('sueldo') or 0), 2)
+    except (TypeError, ValueError):
+        sueldo = str(recibo.get('sueldo'))
+    if period is not None:
+        return period, name, sueldo
+    return name, sueldo
@@ -6,55 +6,138 @@ from email.mime.base import MIMEBase
 from email import encoders
 import os
 
-def send_email_with_attachment(filepath, month_name, year):
+
+def email_configured():
+    """Indica si hay remitente y destinatario configurados."""
+    return bool(config.MAIL_USERNAME and config.EMAIL_RECIPIENT_HARDCODED)
+
+
+def _attach_file(msg, filepath):
+    filename = os.path.basename(filepath)
+    with open(filepath, 'rb') as attachment:
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(attachment.read())
+
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', f"attachment; filename= {filename}")
+    msg.attach(part)
+
+
+def build_report_message(reports):
     """
-    Envía un email con el archivo de reporte adjunto.
+    Arma el email para una lista de reportes [(filepath, month_name, year)].
+    Con un solo reporte es el mensaje de siempre; con varios es un resumen
+    (digest) con todos los Excel adjuntos.
     """
-    
-    # Comprobar si las credenciales están configuradas
-    if not config.MAIL_USERNAME or not config.EMAIL_RECIPIENT_HARDCODED:
-        print("Error: Configuración de email no encontrada en config.py. Omitiendo envío.")
-        return False
+    msg = MIMEMultipart()
+    msg['From'] = config.MAIL_USERNAME
+    msg['To'] = config.EMAIL_RECIPIENT_HARDCODED
 
-    try:
-        # Crear el mensaje
-        msg = MIMEMultipart()
-        msg['From'] = config.MAIL_USERNAME
-        msg['To'] = config.EMAIL_RECIPIENT_HARDCODED
+    if len(reports) == 1:
+        _, month_name, year = reports[0]
         msg['Subject'] = f"Reporte de Sueldos Procesados - {month_name} {year}"
-        
+
         # Cuerpo del email
         body = f"""
         Se ha completado un procesamiento de recibos de sueldo.
-        
+
         Se adjunta el reporte de Excel para {month_name} {year}.
-        
+
+        - Este es un mensaje automático -
+        """
+    else:
+        periodos = []
+        for _, month_name, year in reports:
+            if f"{month_name} {year}" not in periodos:
+                periodos.append(f"{month_name} {year}")
+        msg['Subject'] = f"Reportes de Sueldos Procesados ({len(reports)}) - {', '.join(periodos)}"
+
+        lista = "\n".join(
+            f"        - {os.path.basename(filepath)} ({month_name} {year})"
+            for filepath, month_name, year in reports
+        )
+        body = f"""
+        Se completaron {len(reports)} procesamientos de recibos de sueldo.
+
+        Se adjuntan los reportes de Excel:
+{lista}
+
         - Este es un mensaje automático -
         """
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Adjuntar el archivo
-        filename = os.path.basename(filepath)
-        with open(filepath, 'rb') as attachment:
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
-        
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f"attachment; filename= {filename}")
-        msg.attach(part)
-        
-        # Conectar y enviar
-        print(f"Conectando a {config.MAIL_SERVER} para enviar email a {config.EMAIL_RECIPIENT_HARDCODED}...")
-        server = smtplib.SMTP(config.MAIL_SERVER, config.MAIL_PORT, local_hostname="localhost")
-        server.starttls()
-        server.login(config.MAIL_USERNAME, config.MAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(config.MAIL_USERNAME, config.EMAIL_RECIPIENT_HARDCODED, text)
-        server.quit()
-        
+    msg.attach(MIMEText(body, 'plain'))
+
+    for filepath, _, _ in reports:
+        _attach_file(msg, filepath)
+    return msg
+
+
+class SmtpConnection:
+    """
+    Conexión SMTP persistente: se abre (STARTTLS + login) la primera vez que
+    se envía y se reutiliza en los envíos siguientes. Si el servidor la
+    cerró, se vuelve a conectar y autenticar una vez antes de fallar.
+    """
+
+    def __init__(self):
+        self.server = None
+
+    def _connect(self):
+        print(f"Conectando a {config.MAIL_SERVER}:{config.MAIL_PORT}...")
+        server = smtplib.SMTP(config.MAIL_SERVER, config.MAIL_PORT, local_hostname="localhost",
+                              timeout=config.MAIL_TIMEOUT)
+        try:
+            if config.MAIL_USE_TLS:
+                server.starttls()
+            if config.MAIL_PASSWORD:
+                server.login(config.MAIL_USERNAME, config.MAIL_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+
+    def send(self, msg):
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.sendmail(config.MAIL_USERNAME, config.EMAIL_RECIPIENT_HARDCODED, msg.as_string())
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Conexión vencida (timeout del servidor): reconectar y reintentar una vez
+            self.close()
+            self._connect()
+            self.server.sendmail(config.MAIL_USERNAME, config.EMAIL_RECIPIENT_HARDCODED, msg.as_string())
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+
+def send_email_with_attachment(filepath, month_name, year):
+    """
+    Envía un email con el archivo de reporte adjunto (conexión de un solo uso).
+    Para los lotes se usa la bandeja de salida (outbox.py), que reutiliza la
+    conexión y reintenta.
+    """
+
+    # Comprobar si las credenciales están configuradas
+    if not email_configured():
+        print("Error: Configuración de email no encontrada en config.py. Omitiendo envío.")
+        return False
+
+    connection = SmtpConnection()
+    try:
+        msg = build_report_message([(filepath, month_name, year)])
+        print(f"Enviando email a {config.EMAIL_RECIPIENT_HARDCODED}...")
+        connection.send(msg)
         print("Email enviado exitosamente.")
         return True
-        
+
     except Exception as e:
         print(f"Error al enviar email: {e}")
-        return False
\ No newline at end of file
+        return False
+    finally:
+        connection.close()
@@ -1,22 +1,61 @@
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from datetime import datetime
 import os
+import config
 
-def create_excel_report(recibos_data):
+# Mapeo manual para meses en español
+meses_es = [
+    "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", 
+    "JULIO", "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"
+]
+
+CURRENCY_FORMAT = '"$" #,##0.00'
+COLUMN_WIDTHS = {'A': 35, 'B': 20, 'C': 20, 'D': 18, 'E': 18, 'F': 18, 'G': 18}
+TEMP_REPORTS_DIR = 'temp_reports'
+
+
+def create_excel_report(recibos_data, mode=None, directory=None):
+    """
+    Crea el reporte de Excel de los recibos.
+
+    mode='normal' arma el libro completo en memoria; mode='streaming' escribe
+    fila por fila con una hoja write-only y estilos con nombre (ver
+    ReportWriter). Por defecto se usa streaming para lotes grandes
+    (más de config.EXCEL_STREAMING_THRESHOLD filas) o si recibos_data no es
+    una lista (por ejemplo, un generador).
+    El archivo se guarda en 'directory' (por defecto temp_reports).
+    Devuelve (ruta, mes, año) o (None, None, None) si falla.
+    """
+    if mode is None:
+        if isinstance(recibos_data, (list, tuple)) and len(recibos_data) <= config.EXCEL_STREAMING_THRESHOLD:
+            mode = 'normal'
+        else:
+            mode = 'streaming'
+
+    if mode == 'normal':
+        return _create_excel_report_normal(recibos_data, directory)
+
+    try:
+        writer = ReportWriter()
+        for recibo in recibos_data:
+            writer.add(recibo)
+        return writer.close(directory=directory)
+    except Exception as e:
+        print(f"[Error en excel_generator] No se pudo crear el archivo Excel: {e}")
+        return None, None, None
+
+
+def _create_excel_report_normal(recibos_data, directory=None):
     """
     Crea un archivo Excel con:
     - Formato: A (Nombre), D (Sueldo), E (Adelanto), F (Pagos), G (Saldo)
     - Estética: Idéntica a la imagen, con cabeceras grandes y borde exterior.
     """
     
-    # Mapeo manual para meses en español
-    meses_es = [
-        "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", 
-        "JULIO", "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"
-    ]
-    
     now = datetime.now()
     month_name = meses_es[now.month - 1]
     year = now.year
@@ -177,7 +216,7 @@ def create_excel_report(recibos_data):
         ws.cell(end_row, end_col).border     = Border(bottom=medium_side, right=medium_side, top=thin_side, left=thin_side) # G(total)
 
         # 9. Guardar en un archivo temporal
-        temp_dir = 'temp_reports'
+        temp_dir = directory or TEMP_REPORTS_DIR
         os.makedirs(temp_dir, exist_ok=True)
         
         filename = f"Reporte_Sueldos_{month_name}_{year}_{now.strftime('%H%M%S')}.xlsx"
@@ -190,4 +229,173 @@ def create_excel_report(recibos_data):
     
     except Exception as e:
         print(f"[Error en excel_generator] No se pudo crear el archivo Excel: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
+
+
+class ReportWriter:
+    """
+    Generador de reportes para lotes grandes (miles de filas).
+
+    - Usa una hoja write-only de openpyxl: cada fila se escribe al agregarla
+      y no queda en memoria, así que se pueden ir agregando recibos a medida
+      que llegan (add) y cerrar el archivo al final (close).
+    - Los estilos se registran una sola vez como NamedStyle y las celdas
+      solo los referencian por nombre, en lugar de crear Font/Border por celda.
+    - Los bordes (grilla fina + contorno grueso) se resuelven fila por fila
+      en una sola pasada, sin recorrer la tabla de nuevo al final.
+
+    El resultado se ve igual al de create_excel_report en modo normal.
+    """
+
+    # Filas fijas de la plantilla
+    HEADER_ROW = 3
+    FIRST_DATA_ROW = 4
+    LAST_COL = 7  # G
+
+    def __init__(self, now=None):
+        self.now = now or datetime.now()
+        self.month_name = meses_es[self.now.month - 1]
+        self.year = self.now.year
+
+        self.wb = openpyxl.Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(self.month_name)
+        self._styles = set()
+        self._next_row = 1
+        self.rows = 0
+
+        for letter, width in COLUMN_WIDTHS.items():
+            self.ws.column_dimensions[letter].width = width
+        self._write_header()
+
+    # --- Estilos ---
+
+    _BASES = {
+        # nombre: (fuente, relleno, alineación, formato numérico)
+        'plain': (None, None, None, None),
+        'month': (Font(bold=True), PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid"),
+                  Alignment(horizontal='center', vertical='center'), None),
+        'header': (Font(bold=True, size=12), PatternFill(start_color="D9D9D9", end_color="D9D9D9", fill_type="solid"),
+                   Alignment(horizontal='center', vertical='center'), None),
+        'bold': (Font(bold=True), None, None, None),
+        'money': (None, None, None, CURRENCY_FORMAT),
+        'money_red': (Font(color="FF0000"), None, None, CURRENCY_FORMAT),
+        'money_bold': (Font(bold=True), None, None, CURRENCY_FORMAT),
+        'money_bold_red': (Font(bold=True, color="FF0000"), None, None, CURRENCY_FORMAT),
+    }
+
+    @staticmethod
+    def _border(row_kind, col):
+        """
+        Borde de una celda de la tabla según su fila y columna:
+        grilla fina por dentro y contorno medio alrededor de la tabla
+        (cabecera, columnas A y G, fila de totales).
+        """
+        thin = Side(style='thin')
+        medium = Side(style='medium')
+        if row_kind == 'month':
+            return Border(left=thin, right=thin, top=thin, bottom=thin)
+
+        top = medium if row_kind == 'header' else thin
+        bottom = medium if row_kind == 'total' else thin
+        if col == 1:
+            left, right = medium, thin
+        elif col == ReportWriter.LAST_COL:
+            left, right = thin, medium
+        elif row_kind == 'header':
+            # Las cabeceras centrales no tienen bordes laterales
+            left = right = None
+        else:
+            left = right = thin
+        return Border(left=left, right=right, top=top, bottom=bottom)
+
+    def _style(self, base, row_kind, col):
+        """Nombre del estilo registrado para (base, fila, columna); lo crea la primera vez."""
+        edge = 'l' if col == 1 else 'r' if col == self.LAST_COL else 'c'
+        name = f"rep_{base}_{row_kind}_{edge}"
+        if name not in self._styles:
+            font, fill, alignment, number_format = self._BASES[base]
+            # Sin fuente propia se usa la fuente por defecto del libro (Calibri 11)
+            style = NamedStyle(name=name, font=font or DEFAULT_FONT, border=self._border(row_kind, col))
+            if fill:
+                style.fill = fill
+            if alignment:
+                style.alignment = alignment
+            if number_format:
+                style.number_format = number_format
+            self.wb.add_named_style(style)
+            self._styles.add(name)
+        return name
+
+    # --- Filas ---
+
+    def _append(self, cells):
+        """Escribe una fila: lista de (valor, estilo) o None para celdas vacías."""
+        row = []
+        for item in cells:
+            if item is None:
+                row.append(None)
+                continue
+            value, style = item
+            cell = WriteOnlyCell(self.ws, value=value)
+            if style:
+                cell.style = style
+            row.append(cell)
+        self.ws.append(row)
+        self._next_row += 1
+
+    def _write_header(self):
+        # Fila 1: mes y año (D1:G1 combinadas)
+        self._append([None, None, None,
+                      (f"{self.month_name} {self.year}", self._style('month', 'month', 4))] +
+                     [(None, self._style('plain', 'month', col)) for col in range(5, 8)])
+        self.ws.merged_cells.add('D1:G1')
+        # Fila 2: vacía
+        self._append([])
+        # Fila 3: cabeceras de columnas
+        titles = ['NOMBRE Y APELLIDO', None, None, 'SUELDO', 'ADELANTO', 'PAGOS', 'SALDO']
+        self._append([(title, self._style('header', 'header', col)) for col, title in enumerate(titles, 1)])
+        self.ws.merged_cells.add('A3:C3')
+
+    def add(self, recibo):
+        """Agrega la fila de un recibo."""
+        r = self._next_row
+        nombre_completo = f"{recibo.get('apellido', 'N/A')}, {recibo.get('nombre', 'N/A')}".upper()
+        self._append([
+            (nombre_completo, self._style('plain', 'body', 1)),
+            (None, self._style('plain', 'body', 2)),
+            (None, self._style('plain', 'body', 3)),
+            (recibo.get('sueldo', 0), self._style('money', 'body', 4)),
+            (None, self._style('money_red', 'body', 5)),
+            (None, self._style('money_red', 'body', 6)),
+            (f"=D{r}-E{r}-F{r}", self._style('money_bold', 'body', 7)),
+        ])
+        self.rows += 1
+
+    def close(self, filepath=None, directory=None, final_path=None):
+        """
+        Escribe la fila de TOTALES y guarda el archivo en 'filepath' (por
+        defecto un nombre con mes y hora en 'directory' o temp_reports).
+        'final_path' es la ruta que se informa cuando 'filepath' es un
+        temporal que después se renombra. Devuelve (ruta, mes, año).
+        """
+        last_data_row = self._next_row - 1
+        first = self.FIRST_DATA_ROW
+        self._append([
+            ("TOTALES", self._style('bold', 'total', 1)),
+            (None, self._style('plain', 'total', 2)),
+            (None, self._style('plain', 'total', 3)),
+            (f"=SUM(D{first}:D{last_data_row})", self._style('money_bold', 'total', 4)),
+            (f"=SUM(E{first}:E{last_data_row})", self._style('money_bold_red', 'total', 5)),
+            (f"=SUM(F{first}:F{last_data_row})", self._style('money_bold_red', 'total', 6)),
+            (f"=SUM(G{first}:G{last_data_row})", self._style('money_bold', 'total', 7)),
+        ])
+
+        if filepath is None:
+            directory = directory or TEMP_REPORTS_DIR
+            os.makedirs(directory, exist_ok=True)
+            filename = f"Reporte_Sueldos_{self.month_name}_{self.year}_{self.now.strftime('%H%M%S')}.xlsx"
+            filepath = os.path.join(directory, filename)
+
+        self.wb.save(filepath)
+        print(f"Reporte de Excel generado en: {final_path or filepath} ({self.rows} filas)")
+        return filepath, self.month_name, self.year
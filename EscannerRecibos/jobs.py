@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+# Motor de trabajos en segundo plano.
+#
+# Cada lote subido se encola como un trabajo; un pool de tamaño fijo
+# (config.MAX_CONCURRENT_JOBS) los ejecuta fuera de la petición HTTP.
+# Los eventos de progreso quedan en un log por trabajo, numerados desde 0,
+# así el stream SSE solo tiene que leer el log y un cliente que se
+# reconecta (Last-Event-ID) sigue desde donde estaba sin reprocesar nada.
+
+TERMINAL_STATUSES = ('complete', 'error')
+
+
+class Job:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'
+        self.events = []
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    def append(self, event):
+        """Agrega un evento al log y despierta a los lectores."""
+        with self._cond:
+            self.events.append(event)
+            if event.get('status') in TERMINAL_STATUSES:
+                self.status = event['status']
+                self.result = event
+                self.finished_at = time.time()
+            self._cond.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    def wait_events(self, start, timeout):
+        """
+        Devuelve los eventos desde el índice 'start', esperando hasta
+        'timeout' segundos si todavía no hay ninguno nuevo.
+        """
+        with self._cond:
+            if len(self.events) <= start and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[start:]
+
+    def to_dict(self, queue_position=None):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'events': len(self.events),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if queue_position is not None:
+            data['queue_position'] = queue_position
+        if self.events:
+            data['last_event'] = self.events[-1]
+        return data
+
+
+class JobManager:
+    def __init__(self, max_workers, retention_seconds):
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._queue = []
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, events_fn):
+        """
+        Encola un trabajo. 'events_fn' es una función sin argumentos que
+        devuelve un generador de eventos (el último debe ser terminal).
+        """
+        self._purge()
+        job = Job(job_id)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._queue.append(job_id)
+            position = len(self._queue)
+        job.append({'status': 'queued', 'message': 'Lote en cola, esperando un procesador libre...',
+                    'queue_position': position})
+        self._executor.submit(self._run, job, events_fn)
+        return job
+
+    def _run(self, job, events_fn):
+        with self._lock:
+            if job.id in self._queue:
+                self._queue.remove(job.id)
+        job.status = 'running'
+        job.started_at = time.time()
+        job.append({'status': 'progress', 'message': 'Procesando...'})
+        try:
+            for event in events_fn():
+                job.append(event)
+        except Exception as e:
+            print(f"Error en el trabajo {job.id}: {e}")
+            job.append({'status': 'error', 'message': str(e)})
+        finally:
+            if not job.finished:
+                job.append({'status': 'error', 'message': 'El procesamiento terminó sin resultado.'})
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job_id):
+        """Posición en la cola (1 = el próximo) o None si no está esperando."""
+        with self._lock:
+            if job_id in self._queue:
+                return self._queue.index(job_id) + 1
+        return None
+
+    def _purge(self):
+        """Olvida los trabajos terminados hace más de retention_seconds."""
+        limit = time.time() - self.retention_seconds
+        with self._lock:
+            viejos = [job_id for job_id, job in self._jobs.items()
+                      if job.finished and job.finished_at < limit]
+            for job_id in viejos:
+                del self._jobs[job_id]
+
+
+job_manager = JobManager(config.MAX_CONCURRENT_JOBS, config.JOB_RETENTION_SECONDS)
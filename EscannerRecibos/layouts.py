@@ -0,0 +1,211 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
+from lazy_imports import lazy_module
+from PIL import Image
+import config
+
+fitz = lazy_module('fitz')
+
+# Registro de formatos (layouts) de recibos conocidos.
+#
+# Cada formato se reconoce con una huella barata de la página:
+# - 'hash': hash perceptual de una miniatura de la página (256 bits, hex:
+#   qué celdas de una grilla de 16x16 tienen tinta), aceptado si la
+#   distancia de Hamming es <= 'max_distance'.
+# - 'anchors': textos que tienen que aparecer en 'anchor_box' (se le hace
+#   OCR a esa zona chica, a DPI bajo).
+# y define, para cada recibo de la página, las cajas donde están el nombre y
+# el neto. ocr.py solo renderiza y pasa por OCR esas cajas; si la página no
+# coincide con ningún formato se hace el OCR de la página completa.
+#
+# Las cajas son fracciones del ancho/alto de la página: [x0, y0, x1, y1].
+# El registro se lee de config.LAYOUTS_PATH, por ejemplo:
+#
+# {"layouts": [
+#   {"name": "sistema_x",
+#    "fingerprint": {"hash": "f0e1...", "max_distance": 24,
+#                    "anchors": ["RECIBO DE HABERES"], "anchor_box": [0, 0, 1, 0.08]},
+#    "dpi": 300,
+#    "receipts": [{"nombre": [0.05, 0.13, 0.75, 0.17], "neto": [0.05, 0.55, 0.6, 0.6]}]}
+# ]}
+#
+# Para registrar uno nuevo a partir de un PDF de ejemplo:
+#     python layouts.py add ejemplo.pdf --name sistema_x --nombre 0.05 0.13 0.75 0.17 --neto 0.05 0.55 0.6 0.6
+
+# DPI de la miniatura para el hash perceptual (una A4 queda en ~150x210 px)
+_THUMB_DPI = 18
+_HASH_SIZE = 16
+# DPI del OCR de la zona de anclas
+_ANCHOR_DPI = 150
+FIELDS = ('nombre', 'neto')
+
+
+class Layout:
+    def __init__(self, data):
+        self.name = data['name']
+        fingerprint = data.get('fingerprint', {})
+        self.hash = fingerprint.get('hash')
+        self.max_distance = fingerprint.get('max_distance', config.LAYOUT_HASH_MAX_DISTANCE)
+        self.anchors = [a.lower() for a in fingerprint.get('anchors', [])]
+        self.anchor_box = fingerprint.get('anchor_box')
+        self.dpi = data.get('dpi', config.OCR_DPI)
+        self.receipts = data['receipts']
+        if not self.hash and not self.anchors:
+            raise ValueError(f"El formato '{self.name}' no tiene huella (hash o anchors)")
+        if self.anchors and not self.anchor_box:
+            raise ValueError(f"El formato '{self.name}' tiene anchors sin anchor_box")
+        for receipt in self.receipts:
+            for field in FIELDS:
+                if field not in receipt:
+                    raise ValueError(f"El formato '{self.name}' no tiene la caja '{field}'")
+
+
+def page_rect_for_box(page, box):
+    """Convierte una caja en fracciones de página a un fitz.Rect en puntos."""
+    r = page.rect
+    x0, y0, x1, y1 = box
+    return fitz.Rect(r.x0 + x0 * r.width, r.y0 + y0 * r.height,
+                     r.x0 + x1 * r.width, r.y0 + y1 * r.height)
+
+
+def page_hash(page):
+    """
+    Hash perceptual de la página: se reduce a una grilla de 16x16 y cada bit
+    indica si esa celda es más oscura que el promedio (tiene texto o líneas).
+    Las páginas del mismo formato difieren en pocos bits aunque cambien los
+    datos; una página en blanco o de otro formato, en muchos más.
+    """
+    pix = page.get_pixmap(dpi=_THUMB_DPI, colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    pixels = image.resize((_HASH_SIZE, _HASH_SIZE), Image.BOX).tobytes()
+    mean = sum(pixels) / len(pixels)
+    bits = 0
+    for value in pixels:
+        bits = (bits << 1) | (1 if value < mean - 2 else 0)
+    return f"{bits:0{_HASH_SIZE * _HASH_SIZE // 4}x}"
+
+
+def hamming(hash_a, hash_b):
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+@functools.lru_cache(maxsize=1)
+def _load(path, mtime):
+    with open(path, encoding='utf-8') as fh:
+        raw = fh.read()
+    layouts = [Layout(item) for item in json.loads(raw).get('layouts', [])]
+    version = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:12]
+    return layouts, version
+
+
+def load_layouts():
+    """
+    Devuelve (formatos, versión). La versión cambia cuando cambia el archivo
+    y entra en la clave de la caché de OCR. Sin archivo: ([], 'none').
+    """
+    path = config.LAYOUTS_PATH
+    if not config.OCR_ROI_ENABLED or not path or not os.path.exists(path):
+        return [], 'none'
+    try:
+        return _load(path, os.path.getmtime(path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error leyendo el registro de formatos {path}: {e}. Se usa OCR de página completa.")
+        return [], 'error'
+
+
+def layouts_version():
+    return load_layouts()[1]
+
+
+def match_layout(page, recognize):
+    """
+    Busca el formato de la página. 'recognize(imagen)' es la función de OCR
+    (devuelve texto, confianza) que se usa para la zona de anclas.
+    Devuelve el Layout o None.
+    """
+    layouts, _ = load_layouts()
+    if not layouts:
+        return None
+
+    fingerprint = None
+    anchor_texts = {}
+    for layout in layouts:
+        if layout.hash:
+            if fingerprint is None:
+                fingerprint = page_hash(page)
+            if hamming(fingerprint, layout.hash) > layout.max_distance:
+                continue
+        if layout.anchors:
+            key = tuple(layout.anchor_box)
+            if key not in anchor_texts:
+                pix = page.get_pixmap(dpi=_ANCHOR_DPI, clip=page_rect_for_box(page, layout.anchor_box),
+                                      colorspace=fitz.csGRAY, alpha=False)
+                image = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+                anchor_texts[key] = " ".join(recognize(image)[0].lower().split())
+                del image, pix
+            if not all(anchor in anchor_texts[key] for anchor in layout.anchors):
+                continue
+        return layout
+    return None
+
+
+def _add_layout(args):
+    """Agrega (o reemplaza) un formato tomando la huella de una página de ejemplo."""
+    doc = fitz.open(args.pdf)
+    page = doc[args.page - 1]
+    fingerprint = {'hash': page_hash(page), 'max_distance': args.max_distance}
+    if args.anchors:
+        fingerprint['anchors'] = args.anchors
+        fingerprint['anchor_box'] = args.anchor_box
+    entry = {
+        'name': args.name,
+        'fingerprint': fingerprint,
+        'dpi': args.dpi,
+        'receipts': [{'nombre': args.nombre, 'neto': args.neto}],
+    }
+    Layout(entry)
+
+    path = args.registry or config.LAYOUTS_PATH
+    data = {'layouts': []}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as fh:
+            data = json.load(fh)
+    data['layouts'] = [item for item in data['layouts'] if item['name'] != args.name] + [entry]
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(data, fh, ensure_ascii=False, indent=2)
+    print(f"Formato '{args.name}' guardado en {path} (hash {fingerprint['hash']})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Registro de formatos de recibos para OCR por regiones")
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    add = sub.add_parser('add', help='Registrar un formato a partir de un PDF de ejemplo')
+    add.add_argument('pdf')
+    add.add_argument('--name', required=True)
+    add.add_argument('--page', type=int, default=1)
+    add.add_argument('--nombre', type=float, nargs=4, required=True, metavar=('X0', 'Y0', 'X1', 'Y1'))
+    add.add_argument('--neto', type=float, nargs=4, required=True, metavar=('X0', 'Y0', 'X1', 'Y1'))
+    add.add_argument('--anchors', nargs='+')
+    add.add_argument('--anchor-box', type=float, nargs=4, default=[0, 0, 1, 0.1], metavar=('X0', 'Y0', 'X1', 'Y1'))
+    add.add_argument('--max-distance', type=int, default=config.LAYOUT_HASH_MAX_DISTANCE)
+    add.add_argument('--dpi', type=int, default=config.OCR_DPI)
+    add.add_argument('--registry', help='Archivo del registro (por defecto config.LAYOUTS_PATH)')
+
+    sub.add_parser('list', help='Listar los formatos registrados')
+    args = ap.parse_args()
+
+    if args.command == 'add':
+        _add_layout(args)
+    else:
+        layouts, version = load_layouts()
+        print(f"{len(layouts)} formato(s) (versión {version})")
+        for layout in layouts:
+            print(f"- {layout.name}: {len(layout.receipts)} recibo(s) por página, hash={layout.hash}, anchors={layout.anchors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import importlib.util
+import sys
+import threading
+
+# Importaciones diferidas de las dependencias pesadas (fitz, pytesseract).
+#
+# Importar fitz cuesta ~150 ms y se pagaba en cada arranque del servidor,
+# en cada worker y en cualquier script que usara un módulo del proyecto
+# aunque no abriera un PDF. lazy_module('fitz') devuelve el módulo sin
+# ejecutarlo: se carga de verdad la primera vez que se usa un atributo
+# (fitz.open, fitz.Rect, ...). Si ya estaba importado se devuelve tal cual.
+
+_lock = threading.Lock()
+
+
+def lazy_module(name):
+    """Módulo 'name' que se importa recién al usar uno de sus atributos."""
+    with _lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ImportError(f"No se encontró el módulo '{name}'", name=name)
+        loader = importlib.util.LazyLoader(spec.loader)
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+        return module
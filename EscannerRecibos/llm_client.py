@@ -0,0 +1,490 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import config
+import metrics
+from compactor import estimate_tokens
+
+# Capa de acceso al LLM: backends intercambiables y un planificador que
+# respeta los límites de la API.
+#
+# Backends (config.LLM_BACKEND):
+# - 'groq': la API de Groq con su SDK.
+# - 'openai': cualquier servidor compatible con OpenAI (llama.cpp, vLLM,
+#   Ollama, ...) en config.LLM_BASE_URL, por HTTP con httpx.
+# - 'stub': respuestas armadas en el proceso con el extractor local, con
+#   latencia y límite por minuto simulados. Sirve para probar la carga sin red.
+#
+# El cliente de cada backend se crea recién en el primer uso (el SDK de groq
+# es la importación más pesada del proyecto, ~230 ms), uno solo por proceso
+# y compartido por todos los hilos y lotes: así se reutiliza su pool de
+# conexiones HTTP. Tras un fork (workers) se crea otro, porque las conexiones
+# heredadas no se pueden compartir. Si una llamada falla por conexión o
+# timeout el cliente se descarta y la siguiente crea uno nuevo.
+#
+# LLMScheduler (una instancia por proceso: 'scheduler') pasa todas las
+# llamadas por:
+# 1. un límite de llamadas simultáneas que se adapta: se divide a la mitad
+#    con cada 429 y sube de a uno tras una racha de respuestas buenas;
+# 2. dos baldes de fichas, de pedidos y de tokens por minuto
+#    (LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE, 0 = sin límite);
+# 3. una pausa compartida cuando la API pide esperar (retry-after);
+# 4. reintentos con backoff exponencial con jitter para 429, timeouts,
+#    errores de conexión, 5xx y respuestas mal formadas. Los demás errores
+#    no se reintentan.
+# Los baldes y la pausa se esperan antes de ocupar un lugar del límite de
+# llamadas simultáneas, así una llamada que espera cupo no frena a otra.
+# Si se agotan los reintentos la llamada lanza LLMError: quien llama decide
+# qué hacer con la página (no se descarta en silencio).
+
+
+class LLMError(Exception):
+    """Error de una llamada al LLM. 'retryable' indica si tiene sentido reintentar."""
+
+    def __init__(self, message, retryable=False, retry_after=None, status=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.status = status
+
+
+class RateLimited(LLMError):
+    """La API rechazó el pedido por límite de uso (HTTP 429)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, retryable=True, retry_after=retry_after, status=429)
+
+
+def _retry_after(headers):
+    """Segundos de espera pedidos por la API (retry-after), o None."""
+    if not headers:
+        return None
+    value = headers.get('retry-after')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _status_error(status, message, headers=None):
+    if status == 429:
+        return RateLimited(message, retry_after=_retry_after(headers))
+    return LLMError(message, retryable=status >= 500 or status in (408, 409), status=status)
+
+
+# --- Clientes ---
+
+class ClientProvider:
+    """
+    Provee un cliente creado con 'factory' la primera vez que se pide.
+    'warm' (opcional) hace un pedido barato con el cliente para dejar
+    abierta la conexión antes del primer pedido de verdad.
+    """
+
+    def __init__(self, name, factory, warm=None):
+        self.name = name
+        self._factory = factory
+        self._warm = warm
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    def get(self):
+        """Devuelve el cliente de este proceso, creándolo si hace falta."""
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                start = time.perf_counter()
+                try:
+                    self._client = self._factory()
+                except Exception as e:
+                    metrics.inc('recibos_llm_clients_total', client=self.name, result='error')
+                    raise RuntimeError(f"No se pudo crear el cliente de {self.name}: {e}") from e
+                self._pid = os.getpid()
+                metrics.inc('recibos_llm_clients_total', client=self.name, result='ok')
+                print(f"Cliente de {self.name} listo en {(time.perf_counter() - start) * 1000:.0f} ms.")
+            return self._client
+
+    def reset(self):
+        """Descarta el cliente; el próximo get() crea uno nuevo."""
+        with self._lock:
+            client, self._client = self._client, None
+        close = getattr(client, 'close', None)
+        if close is not None and self._pid == os.getpid():
+            try:
+                close()
+            except Exception:
+                pass
+
+    def report_failure(self, error):
+        """Avisa que una llamada con el cliente falló; si fue de conexión se recrea."""
+        if _is_connection_error(error):
+            print(f"Error de conexión con {self.name} ({error}): se recrea el cliente.")
+            self.reset()
+
+    def warm_up(self):
+        """Crea el cliente y abre la conexión. Devuelve los ms que tardó (o None si falló)."""
+        start = time.perf_counter()
+        try:
+            client = self.get()
+            if self._warm is not None:
+                self._warm(client)
+        except Exception as e:
+            self.report_failure(e)
+            print(f"No se pudo precalentar el cliente de {self.name}: {e}")
+            return None
+        return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _is_connection_error(error):
+    if isinstance(error, OSError):
+        return True
+    # Si hubo un error del SDK o de httpx, ya están importados
+    try:
+        import httpx
+        if isinstance(error, httpx.TransportError):
+            return True
+        from groq import APIConnectionError
+    except ImportError:
+        return False
+    return isinstance(error, APIConnectionError)
+
+
+def _create_groq_client():
+    from groq import Groq
+    if not config.GROQ_API_KEY and not os.getenv('GROQ_API_KEY'):
+        raise RuntimeError("falta la API key: poné tu clave en la variable de entorno GROQ_API_KEY")
+    # La URL base se puede cambiar con GROQ_BASE_URL (la lee el SDK).
+    # Sin reintentos propios: los hace el planificador
+    return Groq(api_key=config.GROQ_API_KEY or os.getenv('GROQ_API_KEY'),
+                timeout=config.LLM_TIMEOUT, max_retries=0)
+
+
+def _create_http_client():
+    import httpx
+    headers = {'Authorization': f"Bearer {config.LLM_API_KEY}"} if config.LLM_API_KEY else {}
+    return httpx.Client(
+        base_url=config.LLM_BASE_URL.rstrip('/') + '/',
+        headers=headers,
+        timeout=config.LLM_TIMEOUT,
+        limits=httpx.Limits(max_connections=max(1, config.LLM_MAX_CONCURRENCY),
+                            max_keepalive_connections=max(1, config.LLM_MAX_CONCURRENCY)),
+    )
+
+
+groq_client = ClientProvider('Groq', _create_groq_client, warm=lambda client: client.models.list())
+http_client = ClientProvider('LLM HTTP', _create_http_client, warm=lambda client: client.get('models'))
+
+
+# --- Backends ---
+
+class GroqBackend:
+    name = 'groq'
+    provider = groq_client
+
+    def complete(self, prompt):
+        """Respuesta JSON (texto) del modelo y tokens usados (o None)."""
+        try:
+            client = self.provider.get()
+        except RuntimeError as e:
+            raise LLMError(str(e)) from e
+        try:
+            response = client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=config.LLM_MODEL,
+                # Forzamos la respuesta a ser un JSON
+                response_format={"type": "json_object"},
+                temperature=0.0
+            )
+        except Exception as e:
+            self.provider.report_failure(e)
+            raise self._error(e) from e
+        usage = getattr(response, 'usage', None)
+        try:
+            return response.choices[0].message.content, getattr(usage, 'total_tokens', None)
+        except (AttributeError, IndexError, TypeError) as e:
+            raise LLMError(f"respuesta inesperada de la API: {e}", retryable=True) from e
+
+    @staticmethod
+    def _error(e):
+        from groq import APIConnectionError, APIStatusError
+        if isinstance(e, APIStatusError):
+            return _status_error(e.status_code, str(e), e.response.headers)
+        if isinstance(e, APIConnectionError):
+            return LLMError(str(e), retryable=True)
+        return LLMError(str(e))
+
+
+class OpenAICompatibleBackend:
+    name = 'openai'
+    provider = http_client
+
+    def complete(self, prompt):
+        try:
+            client = self.provider.get()
+        except RuntimeError as e:
+            raise LLMError(str(e)) from e
+        body = {
+            'model': config.LLM_MODEL,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'response_format': {'type': 'json_object'},
+            'temperature': 0.0,
+        }
+        try:
+            response = client.post('chat/completions', json=body)
+        except Exception as e:
+            self.provider.report_failure(e)
+            raise LLMError(str(e), retryable=_is_connection_error(e)) from e
+        if response.status_code != 200:
+            raise _status_error(response.status_code, f"HTTP {response.status_code}: {response.text[:200]}",
+                                response.headers)
+        # Un 200 con un cuerpo que no es el esperado (proxy, corte) también es un LLMError:
+        # así pasa por los reintentos y las métricas del planificador
+        try:
+            data = response.json()
+            return data['choices'][0]['message']['content'], (data.get('usage') or {}).get('total_tokens')
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            raise LLMError(f"respuesta inesperada de la API: {e!r} ({response.text[:200]})",
+                           retryable=True) from e
+
+
+_RE_PAGINA = re.compile(r"=== PÁGINA (\S+) ===\s*```(.*?)```", re.DOTALL)
+_RE_TEXTO = re.compile(r"TEXTO DEL RECIBO:\s*```(.*?)```", re.DOTALL)
+
+
+def stub_answer(prompt):
+    """
+    Contenido JSON (texto) que respondería el modelo a este prompt, armado con
+    el extractor local: {"recibos": [...]} para el prompt de una página y
+    {"paginas": [{"id", "recibos"}]} para el prompt por lotes.
+    """
+    from local_extractor import extract_receipt
+    paginas = _RE_PAGINA.findall(prompt)
+    if paginas:
+        return json.dumps({'paginas': [
+            {'id': page_id, 'recibos': extract_receipt(text)[0]['recibos']}
+            for page_id, text in paginas
+        ]})
+    match = _RE_TEXTO.search(prompt)
+    recibos = extract_receipt(match.group(1))[0]['recibos'] if match else []
+    return json.dumps({'recibos': recibos})
+
+
+class StubBackend:
+    """
+    LLM simulado en el proceso: tarda LLM_STUB_LATENCY segundos y, si
+    LLM_STUB_REQUESTS_PER_MINUTE > 0, responde 429 (con retry-after) al
+    pasarse de ese ritmo. Como en la API real, el cupo se repone de a poco
+    (no por ventanas de un minuto).
+    """
+    name = 'stub'
+
+    def __init__(self, latency=None, requests_per_minute=None):
+        self.latency = config.LLM_STUB_LATENCY if latency is None else latency
+        self.quota = TokenBucket(config.LLM_STUB_REQUESTS_PER_MINUTE if requests_per_minute is None
+                                 else requests_per_minute)
+
+    def complete(self, prompt):
+        wait = self.quota.try_take(1)
+        if wait:
+            raise RateLimited("stub: límite de pedidos por minuto", retry_after=wait)
+        time.sleep(self.latency)
+        content = stub_answer(prompt)
+        return content, estimate_tokens(prompt) + estimate_tokens(content)
+
+
+BACKENDS = {
+    'groq': GroqBackend,
+    'openai': OpenAICompatibleBackend,
+    'stub': StubBackend,
+}
+
+
+def create_backend(name=None):
+    name = name or config.LLM_BACKEND
+    if name not in BACKENDS:
+        print(f"Aviso: backend de LLM '{name}' desconocido. Usando groq.")
+        name = 'groq'
+    return BACKENDS[name]()
+
+
+# --- Planificador ---
+
+class TokenBucket:
+    """
+    Balde de fichas que se repone a 'per_minute' por minuto (capacidad: un
+    minuto). reserve() descuenta siempre y devuelve cuánto hay que esperar,
+    así que los pedidos quedan en fila en el orden en que reservaron.
+    per_minute=0: sin límite.
+    """
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._lock = threading.Lock()
+        self._level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._level = min(self.per_minute, self._level + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def reserve(self, amount):
+        if not self.per_minute:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            # Un pedido más grande que el balde espera a tenerlo lleno
+            self._level -= min(amount, self.per_minute)
+            return max(0.0, -self._level * 60.0 / self.per_minute)
+
+    def try_take(self, amount):
+        """Toma las fichas si alcanzan (devuelve 0) o devuelve cuánto falta esperar, sin tomar nada."""
+        if not self.per_minute:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            amount = min(amount, self.per_minute)
+            if self._level >= amount:
+                self._level -= amount
+                return 0.0
+            return (amount - self._level) * 60.0 / self.per_minute
+
+    def adjust(self, amount):
+        """Devuelve (o descuenta, si es negativo) fichas tras conocer el uso real."""
+        if not self.per_minute:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.per_minute, self._level + amount)
+
+
+class LLMScheduler:
+    """Pasa las llamadas al backend respetando los límites (ver arriba)."""
+
+    def __init__(self, backend=None, max_concurrency=None, requests_per_minute=None, tokens_per_minute=None):
+        self._backend = backend
+        self.max_concurrency = max(1, max_concurrency or config.LLM_MAX_CONCURRENCY)
+        self.limit = self.max_concurrency
+        self.requests = TokenBucket(config.LLM_REQUESTS_PER_MINUTE if requests_per_minute is None
+                                    else requests_per_minute)
+        self.tokens = TokenBucket(config.LLM_TOKENS_PER_MINUTE if tokens_per_minute is None
+                                  else tokens_per_minute)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._streak = 0
+        self._paused_until = 0.0
+        self.counts = {'ok': 0, 'rate_limited': 0, 'retry': 0, 'error': 0}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counts, limit=self.limit, in_flight=self._in_flight)
+
+    def _count(self, result):
+        with self._cond:
+            self.counts[result] += 1
+        metrics.inc('recibos_llm_requests_total', result=result)
+
+    def _wait_turn(self, estimate):
+        """
+        Espera la pausa compartida (retry-after) y el cupo de los baldes antes
+        de ocupar un lugar de concurrencia: quien espera no frena a los demás.
+        """
+        with self._cond:
+            pause = max(0.0, self._paused_until - time.monotonic())
+        wait = max(pause, self.requests.reserve(1), self.tokens.reserve(estimate))
+        if wait:
+            with metrics.timed('llm_wait'):
+                time.sleep(wait)
+
+    def _acquire(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def _on_success(self):
+        with self._cond:
+            self._streak += 1
+            if self.limit < self.max_concurrency and self._streak >= self.limit * 2:
+                self.limit += 1
+                self._streak = 0
+                metrics.set_gauge('recibos_llm_concurrency_limit', self.limit)
+                self._cond.notify()
+
+    def _on_rate_limited(self, retry_after):
+        with self._cond:
+            self._streak = 0
+            new_limit = max(1, self.limit // 2)
+            if new_limit != self.limit:
+                print(f"LLM: límite de uso alcanzado, concurrencia {self.limit} -> {new_limit}.")
+                self.limit = new_limit
+                metrics.set_gauge('recibos_llm_concurrency_limit', self.limit)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    @staticmethod
+    def _backoff(attempt):
+        """Espera antes del reintento 'attempt' (0, 1, ...): exponencial con jitter completo."""
+        ceiling = min(config.LLM_RETRY_MAX_SECONDS, config.LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def complete(self, prompt):
+        """
+        Respuesta (texto) del modelo al prompt. Lanza LLMError si la llamada
+        no es reintentable o si se agotan los reintentos.
+        """
+        estimate = estimate_tokens(prompt) + config.LLM_COMPLETION_TOKENS
+        attempt = 0
+        while True:
+            self._wait_turn(estimate)
+            self._acquire()
+            try:
+                with metrics.timed('llm_call'):
+                    content, used = self.backend.complete(prompt)
+            except LLMError as e:
+                error = e
+            else:
+                if used:
+                    self.tokens.adjust(estimate - used)
+                self._count('ok')
+                self._on_success()
+                return content
+            finally:
+                self._release()
+
+            if isinstance(error, RateLimited):
+                self._count('rate_limited')
+                self._on_rate_limited(error.retry_after)
+            if not error.retryable or attempt >= config.LLM_MAX_RETRIES:
+                self._count('error')
+                raise error
+            delay = self._backoff(attempt)
+            if error.retry_after:
+                # La pausa compartida ya frena a todos; el jitter los desparrama al volver
+                delay = error.retry_after + delay / 4
+            self._count('retry')
+            print(f"LLM: {error} -- reintento {attempt + 1}/{config.LLM_MAX_RETRIES} en {delay:.1f} s.")
+            with metrics.timed('llm_wait'):
+                time.sleep(delay)
+            attempt += 1
+
+    def warm_up(self):
+        """Crea el cliente del backend y abre su conexión (ms, o None si no aplica o falló)."""
+        provider = getattr(self.backend, 'provider', None)
+        return provider.warm_up() if provider is not None else None
+
+
+scheduler = LLMScheduler()
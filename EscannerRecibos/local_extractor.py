@@ -0,0 +1,168 @@
+import re
+
+# Extractor local (sin LLM) para recibos de sueldo argentinos.
+# Busca el empleado después de "Apellido y nombre" y el neto después de
+# "Neto a cobrar" / "Total neto", y devuelve un puntaje de confianza para
+# decidir si hace falta consultar al LLM.
+
+_RE_ANCLA_NOMBRE = re.compile(r"apellidos?\s*y\s*nombres?\s*[:.\-]?\s*", re.IGNORECASE)
+_RE_ANCLA_NETO = re.compile(
+    r"(neto\s*a\s*cobrar|total\s*neto|neto\s*a\s*percibir|l[ií]quido\s*a\s*cobrar|importe\s*neto)",
+    re.IGNORECASE,
+)
+# Separador de miles: el punto o un espacio duro/fino (U+00A0, U+202F, U+2009).
+# Un espacio común no: separa columnas ("12 345" es cantidad e importe)
+_MILES = '.\u00a0\u202f\u2009'
+_RE_MONTO = re.compile(rf"\$?\s*(\d{{1,3}}(?:[{_MILES}]\d{{3}})+(?:,\d{{1,2}})?|\d+(?:[.,]\d{{1,2}})?)(?!\d)")
+# Números separados solo por espacios junto al neto: pueden ser un importe con
+# espacios como separador de miles o dos columnas; no se adivina
+_RE_NUMEROS_CONTIGUOS = re.compile(r"\d[ \t]+\$?\s*\d")
+# Etiquetas que suelen seguir al nombre en el mismo renglón
+_RE_CORTE_NOMBRE = re.compile(
+    r"\s{2,}|\b(legajo|cuil|cuit|c\.u\.i\.l|documento|dni|fecha|categor[ií]a|ingreso|sector|cargo)\b",
+    re.IGNORECASE,
+)
+_RE_PALABRA_NOMBRE = re.compile(r"^[A-Za-zÁÉÍÓÚÜÑáéíóúüñ'\-]{2,}$")
+
+
+def parse_amount_ar(value):
+    """
+    Convierte un monto en formato argentino a float.
+    '1.234.567,89' -> 1234567.89 ; '$ 45.000' -> 45000.0 ; '1234,5' -> 1234.5
+    Devuelve None si no es un número.
+    """
+    s = str(value).replace('$', '').strip()
+    for separador in _MILES[1:]:
+        s = s.replace(separador, '.')
+    # Un espacio común dentro del número no es un separador de miles
+    if not s or any(c.isspace() for c in s):
+        return None
+
+    if ',' in s and '.' in s:
+        # El último separador es el decimal
+        if s.rfind(',') > s.rfind('.'):
+            s = s.replace('.', '').replace(',', '.')
+        else:
+            s = s.replace(',', '')
+    elif ',' in s:
+        entero, _, decimales = s.rpartition(',')
+        if len(decimales) in (1, 2) and s.count(',') == 1:
+            s = f"{entero}.{decimales}"
+        else:
+            s = s.replace(',', '')
+    elif '.' in s:
+        grupos = s.split('.')
+        # '1.234' o '1.234.567' son miles; '1234.56' es decimal
+        if len(grupos) > 2 or len(grupos[-1]) == 3:
+            s = s.replace('.', '')
+
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def _clean_name(raw):
+    """Corta el renglón del nombre en la siguiente etiqueta y limpia símbolos."""
+    raw = _RE_CORTE_NOMBRE.split(raw, maxsplit=1)[0]
+    # Los dígitos se conservan: un nombre con dígitos es un error de OCR
+    # y baja la confianza para que lo corrija el LLM
+    raw = re.sub(r"[^A-Za-zÁÉÍÓÚÜÑáéíóúüñ0-9,'\- ]", " ", raw)
+    return " ".join(raw.split()).strip(" ,")
+
+
+def _split_name(full_name):
+    """
+    Separa 'APELLIDO, NOMBRE' en (nombre, apellido, separado_por_coma).
+    Sin coma se asume que la primera palabra es el apellido.
+    """
+    if ',' in full_name:
+        apellido, _, nombre = full_name.partition(',')
+        return nombre.strip().title(), apellido.strip().title(), True
+    partes = full_name.split()
+    if len(partes) < 2:
+        return '', full_name.title(), False
+    return " ".join(partes[1:]).title(), partes[0].title(), False
+
+
+def _find_names(lines):
+    """Nombres que aparecen después de cada etiqueta 'Apellido y nombre'."""
+    names = []
+    for i, line in enumerate(lines):
+        match = _RE_ANCLA_NOMBRE.search(line)
+        if not match:
+            continue
+        name = _clean_name(line[match.end():])
+        # A veces el nombre está en el renglón siguiente
+        if not name and i + 1 < len(lines):
+            name = _clean_name(lines[i + 1])
+        if name:
+            names.append(name)
+    return names
+
+
+def _find_net_amounts(lines):
+    """
+    Montos que aparecen junto a la etiqueta del neto (mismo renglón o el
+    siguiente). Devuelve (montos, ambiguo): ambiguo si junto al neto hay
+    números separados solo por espacios (ver _RE_NUMEROS_CONTIGUOS).
+    """
+    amounts = []
+    ambiguous = False
+    for i, line in enumerate(lines):
+        match = _RE_ANCLA_NETO.search(line)
+        if not match:
+            continue
+        segment = line[match.end():]
+        candidates = _RE_MONTO.findall(segment)
+        if not candidates and i + 1 < len(lines):
+            segment = lines[i + 1]
+            candidates = _RE_MONTO.findall(segment)
+        values = [parse_amount_ar(c) for c in candidates]
+        values = [v for v in values if v]
+        if values:
+            # El neto suele ser el último importe del renglón
+            amounts.append(values[-1])
+            ambiguous = ambiguous or bool(_RE_NUMEROS_CONTIGUOS.search(segment))
+    return amounts, ambiguous
+
+
+def extract_receipt(sueldo_text):
+    """
+    Extrae nombre, apellido y sueldo neto con reglas locales.
+    Devuelve (json_data, confianza) con json_data en el mismo formato que
+    parser.process_ticket ({'recibos': [...]}) y confianza entre 0 y 1.
+    """
+    lines = [line for line in (sueldo_text or '').splitlines() if line.strip()]
+    names = _find_names(lines)
+    amounts, ambiguous = _find_net_amounts(lines)
+
+    if not names or not amounts:
+        return {'recibos': []}, 0.0
+
+    # Copias idénticas del mismo recibo (ORIGINAL / DUPLICADO) cuentan como uno;
+    # varios empleados distintos en la misma página se dejan para el LLM.
+    distinct_names = {n.upper() for n in names}
+    distinct_amounts = set(amounts)
+    if len(distinct_names) > 1 or len(distinct_amounts) > 1:
+        return {'recibos': []}, 0.0
+
+    nombre, apellido, con_coma = _split_name(names[0])
+    sueldo = amounts[0]
+
+    # Base: se encontraron ambas etiquetas con un único empleado y monto
+    confidence = 0.85
+    if con_coma:
+        confidence += 0.1
+    palabras = (nombre + " " + apellido).split()
+    if not nombre or not all(_RE_PALABRA_NOMBRE.match(p) for p in palabras):
+        confidence -= 0.3
+    if sueldo <= 0 or sueldo > 1e10:
+        confidence -= 0.5
+    if ambiguous:
+        # "1 234 500,00" o "12 345": mejor que lo lea el LLM
+        confidence -= 0.3
+    confidence = max(0.0, min(1.0, round(confidence, 2)))
+
+    recibo = {'nombre': nombre, 'apellido': apellido, 'sueldo': sueldo}
+    return {'recibos': [recibo]}, confidence
@@ -0,0 +1,117 @@
+import threading
+from collections import deque
+import config
+import metrics
+
+# Control de admisión por memoria para el render y el OCR.
+#
+# Renderizar una página para OCR ocupa memoria proporcional a sus píxeles:
+# el pixmap en gris (1 byte por píxel) más las copias que hace el motor de
+# OCR. Antes de mandar una tarea al pool de OCR (ocr_parallel.py) se reserva
+# su costo estimado en un presupuesto global, compartido por todos los lotes
+# del proceso (config.MEMORY_BUDGET_MB), y se libera cuando la tarea termina.
+# Si no entra, el lote espera en una fila (primero en llegar, primero en
+# entrar) y se le informa su posición.
+#
+# Una página que sola supera el presupuesto se admite cuando no hay nada más
+# en curso, así un presupuesto chico no traba el lote para siempre.
+
+# Cada cuánto se revisa, mientras se espera, si el lote fue cancelado
+_POLL_SECONDS = 0.5
+
+
+def page_cost(width_pt, height_pt, dpi=None):
+    """
+    Bytes estimados para renderizar y pasar por OCR una página (o zona) de
+    width_pt x height_pt puntos a 'dpi' (por defecto config.OCR_DPI, el de la
+    página completa; las cajas de un formato usan el suyo, ver
+    ocr_parallel._page_cost).
+    """
+    dpi = dpi or config.OCR_DPI
+    pixels = (width_pt / 72 * dpi) * (height_pt / 72 * dpi)
+    return int(pixels * config.MEMORY_BYTES_PER_PIXEL)
+
+
+class MemoryBudget:
+    def __init__(self, limit_bytes):
+        # 0 = sin límite (igual se lleva la cuenta del uso)
+        self.limit = limit_bytes
+        self.in_use = 0
+        self.peak = 0
+        self.admitted = 0
+        self.waited = 0
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    def _fits(self, cost):
+        return not self.limit or self.in_use == 0 or self.in_use + cost <= self.limit
+
+    def acquire(self, cost, stop=None, on_wait=None):
+        """
+        Reserva 'cost' bytes; si no entran espera su turno. 'on_wait' se
+        llama con la posición en la fila (1 = la próxima) al empezar a
+        esperar y cada vez que cambia. Devuelve False si 'stop' (un
+        threading.Event) se activó mientras esperaba.
+        """
+        with self._cond:
+            if not self._waiters and self._fits(cost):
+                self._admit(cost)
+                return True
+
+            ticket = object()
+            self._waiters.append(ticket)
+            self.waited += 1
+            self._publish()
+            position = None
+            try:
+                while True:
+                    if stop is not None and stop.is_set():
+                        return False
+                    if self._waiters[0] is ticket and self._fits(cost):
+                        self._waiters.popleft()
+                        self._admit(cost)
+                        # El siguiente de la fila puede entrar también
+                        self._cond.notify_all()
+                        return True
+                    current = self._waiters.index(ticket) + 1
+                    if on_wait is not None and current != position:
+                        position = current
+                        on_wait(position)
+                    self._cond.wait(_POLL_SECONDS)
+            finally:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()
+                self._publish()
+
+    def _admit(self, cost):
+        self.in_use += cost
+        self.peak = max(self.peak, self.in_use)
+        self.admitted += 1
+        self._publish()
+
+    def release(self, cost):
+        with self._cond:
+            self.in_use = max(0, self.in_use - cost)
+            self._publish()
+            self._cond.notify_all()
+
+    def _publish(self):
+        metrics.set_gauge('recibos_memory_budget_bytes', self.in_use, kind='in_use')
+        metrics.set_gauge('recibos_memory_budget_bytes', self.peak, kind='peak')
+        metrics.set_gauge('recibos_memory_budget_bytes', self.limit, kind='limit')
+        metrics.set_gauge('recibos_memory_budget_waiting', len(self._waiters))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit_bytes': self.limit,
+                'in_use_bytes': self.in_use,
+                'peak_bytes': self.peak,
+                'waiting': len(self._waiters),
+                'admitted': self.admitted,
+                'waited': self.waited,
+            }
+
+
+memory_budget = MemoryBudget(config.MEMORY_BUDGET_MB * 1024 * 1024)
@@ -0,0 +1,167 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Instrumentación liviana: contadores, valores actuales (gauges) e histogramas en memoria con salida en
+# formato de texto de Prometheus (endpoint /metrics de app.py).
+#
+# Registrar una medición cuesta un perf_counter() y un lock; el texto solo
+# se arma cuando alguien consulta /metrics, así que si nadie lo hace el
+# costo es despreciable. No depende de prometheus_client.
+#
+# Además de los histogramas globales, timed() suma el tiempo a un dict de
+# tiempos "activo" del hilo (ver collecting()); así el pipeline puede saber
+# cuánto de una llamada fue red y cuánto parseo de JSON sin pasar dicts
+# por todas las funciones.
+
+# Límites de los buckets en segundos (de 1 ms a 2 minutos)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_counters = {}    # (nombre, labels) -> valor
+_gauges = {}      # (nombre, labels) -> valor actual
+_histograms = {}  # (nombre, labels) -> [cuentas por bucket, suma, total]
+_help = {}
+_local = threading.local()
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def describe(name, text):
+    """Texto de ayuda (# HELP) de una métrica."""
+    _help[name] = text
+
+
+def inc(name, value=1, **labels):
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Valor actual de una métrica que sube y baja (por ejemplo, un límite que se adapta)."""
+    with _lock:
+        _gauges[(name, _labels_key(labels))] = value
+
+
+def observe(name, seconds, **labels):
+    key = (name, _labels_key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                hist[0][i] += 1
+                break
+        hist[1] += seconds
+        hist[2] += 1
+
+
+def observe_stage(stage, seconds):
+    """Duración de una etapa (histograma recibos_stage_seconds{stage=...})."""
+    observe('recibos_stage_seconds', seconds, stage=stage)
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 1)
+
+
+@contextmanager
+def timed(stage):
+    """Mide el bloque como una etapa: histograma global y tiempos activos del hilo."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def collecting():
+    """
+    Junta en un dict {etapa: ms} los tiempos de timed() de este hilo
+    mientras dura el bloque.
+    """
+    previous = getattr(_local, 'timings', None)
+    timings = {}
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def add_timings(total, timings):
+    """Suma los ms de 'timings' a 'total' (ambos {etapa: ms})."""
+    for stage, ms in timings.items():
+        total[stage] = round(total.get(stage, 0.0) + ms, 1)
+    return total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def render_prometheus():
+    """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: ([*v[0]], v[1], v[2]) for k, v in _histograms.items()}
+
+    lines = []
+    for name in sorted({n for n, _ in counters}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({n for n, _ in gauges}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        for (n, labels), value in sorted(gauges.items()):
+            if n == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({n for n, _ in histograms}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), (buckets, total_sum, count) in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(DEFAULT_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {round(total_sum, 6)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+describe('recibos_stage_seconds', 'Duración de cada etapa del procesamiento (por página o por lote)')
+describe('recibos_pages_total', 'Páginas procesadas por camino (text_layer / ocr / error)')
+describe('recibos_pages_skipped_total', 'Páginas o mitades de hoja omitidas por duplicadas antes del OCR, por motivo')
+describe('recibos_extraction_total', 'Páginas por camino de extracción (local / llm / none / error)')
+describe('recibos_prompt_tokens_total', 'Tokens estimados del texto de las páginas enviadas al LLM (raw = OCR, compact = enviado)')
+describe('recibos_batches_total', 'Lotes terminados por estado')
+describe('recibos_ocr_pixels_total', 'Píxeles pasados por OCR (roi = regiones de un formato conocido, full = página completa)')
+describe('recibos_emails_total', 'Emails de la bandeja de salida por resultado')
+describe('recibos_llm_requests_total', 'Llamadas al LLM por resultado (ok / rate_limited / retry / error)')
+describe('recibos_llm_clients_total', 'Clientes del LLM creados (al primer uso o tras un error de conexión)')
+describe('recibos_llm_concurrency_limit', 'Llamadas simultáneas al LLM permitidas ahora (baja ante 429)')
+describe('recibos_memory_budget_bytes', 'Presupuesto de memoria del render/OCR: en uso, pico y límite (bytes)')
+describe('recibos_memory_budget_waiting', 'Tareas de OCR esperando lugar en el presupuesto de memoria')
@@ -1,18 +1,370 @@
-import fitz
-import pytesseract
+from lazy_imports import lazy_module
 from PIL import Image
 import os
-import io
+import re
+import json
+import hashlib
+import time
+import config
+from cache_store import DiskCache
+from ocr_engines import get_engine, take_init_report, engine_version
+from layouts import FIELDS, match_layout, page_rect_for_box, layouts_version
+from local_extractor import extract_receipt
 
-def process_pdf_pages(pdf_path):
+fitz = lazy_module('fitz')
+
+# Palabras frecuentes en recibos de sueldo. Sirven para decidir si la capa de
+# texto embebida del PDF es legible o si está "rota" (fuentes sin mapa de
+# caracteres, texto basura, etc.).
+PALABRAS_RECIBO = {
+    'apellido', 'nombre', 'nombres', 'legajo', 'cuil', 'cuit', 'fecha', 'ingreso',
+    'periodo', 'período', 'mes', 'año', 'sueldo', 'basico', 'básico', 'neto',
+    'bruto', 'total', 'totales', 'cobrar', 'haberes', 'descuentos', 'remunerativo',
+    'remunerativos', 'jubilacion', 'jubilación', 'obra', 'social', 'ley', 'ley:',
+    'sindicato', 'antiguedad', 'antigüedad', 'presentismo', 'categoria', 'categoría',
+    'empleado', 'empleador', 'recibo', 'liquidacion', 'liquidación', 'pago', 'banco',
+    'firma', 'son', 'pesos', 'importe', 'concepto', 'cantidad', 'unidades',
+    'de', 'del', 'la', 'el', 'los', 'las', 'y', 'en', 'por', 'a', 'con', 'para',
+}
+
+ANCLA_EMPLEADO = 'apellido y nombre'
+
+_RE_PALABRA = re.compile(r"^[A-Za-zÁÉÍÓÚÜÑáéíóúüñ]+$")
+_RE_NUMERICO = re.compile(r"^[\d.,$%/:\-()]+$")
+_RE_CONSONANTES = re.compile(r"[bcdfghjklmnñpqrstvwxyz]{5,}")
+_RE_VOCAL = re.compile(r"[aeiouáéíóúü]")
+
+
+def _text_from_words(words):
+    """
+    Reconstruye el texto de la página a partir de las palabras con posición
+    de page.get_text("words"), agrupándolas en renglones visuales
+    (arriba-abajo, izquierda-derecha) como lo haría Tesseract.
+    """
+    if not words:
+        return ""
+
+    # Ordenar por el centro vertical de cada palabra
+    palabras = sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+
+    renglones = []
+    renglon = [palabras[0]]
+    centro = (palabras[0][1] + palabras[0][3]) / 2
+    for w in palabras[1:]:
+        centro_w = (w[1] + w[3]) / 2
+        alto = max(w[3] - w[1], 1)
+        if abs(centro_w - centro) <= alto / 2:
+            renglon.append(w)
+        else:
+            renglones.append(renglon)
+            renglon = [w]
+            centro = centro_w
+    renglones.append(renglon)
+
+    return "\n".join(
+        " ".join(w[4] for w in sorted(r, key=lambda w: w[0])) for r in renglones
+    )
+
+
+def extract_text_layer(page, clip=None):
+    """
+    Extrae la capa de texto embebida de una página (sin OCR), o solo de la
+    zona 'clip'. Devuelve (texto, palabras) donde 'palabras' son las tuplas
+    de page.get_text("words") con su posición.
     """
-    Generador que procesa un PDF página por página y 'yields' 
+    words = page.get_text("words", clip=clip)
+    return _text_from_words(words), words
+
+
+def _is_recognizable(token):
+    """Indica si un token parece una palabra o un número legible."""
+    lower = token.lower().strip('.,;:()"\'')
+    if not lower:
+        return False
+    if lower in PALABRAS_RECIBO or _RE_NUMERICO.match(lower):
+        return True
+    return (
+        bool(_RE_PALABRA.match(lower))
+        and len(lower) <= 25
+        and (len(lower) == 1 or bool(_RE_VOCAL.search(lower)))
+        and not _RE_CONSONANTES.search(lower)
+    )
+
+
+def text_layer_quality(text, words):
+    """
+    Heurística de calidad de la capa de texto de una página.
+    Devuelve un dict con las métricas y la decisión final en 'ok'.
+    """
+    tokens = [w[4] for w in words]
+    chars = sum(1 for c in text if not c.isspace())
+    reconocibles = sum(1 for t in tokens if _is_recognizable(t))
+    en_diccionario = sum(1 for t in tokens if t.lower().strip('.,;:()') in PALABRAS_RECIBO)
+    word_ratio = reconocibles / len(tokens) if tokens else 0.0
+    ancla = ANCLA_EMPLEADO in " ".join(text.lower().split())
+
+    ok = (
+        chars >= config.OCR_TEXT_LAYER_MIN_CHARS
+        and word_ratio >= config.OCR_TEXT_LAYER_MIN_WORD_RATIO
+        and (ancla or en_diccionario >= 3)
+    )
+
+    return {
+        'chars': chars,
+        'word_ratio': round(word_ratio, 3),
+        'dictionary_words': en_diccionario,
+        'anchor': ancla,
+        'ok': ok,
+    }
+
+
+def ocr_dpi_steps():
+    """
+    DPIs a probar en orden: primero config.OCR_LOW_DPI (más rápido) y, si la
+    confianza de Tesseract queda baja, config.OCR_DPI.
+    """
+    if config.OCR_LOW_DPI and config.OCR_LOW_DPI < config.OCR_DPI:
+        return [config.OCR_LOW_DPI, config.OCR_DPI]
+    return [config.OCR_DPI]
+
+
+def render_page_image(page, dpi, clip=None):
+    """
+    Renderiza la página (o la zona 'clip') directamente en escala de grises y arma la imagen PIL
+    sobre el buffer del pixmap (sin pasar por PNG).
+    Devuelve (imagen, pixmap): el pixmap debe seguir vivo mientras se use la imagen.
+    """
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False, clip=clip)
+    image = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+    return image, pix
+
+
+def _field_value(text):
+    """Texto de una caja en un renglón, sin la etiqueta si la caja la incluye."""
+    text = " ".join(text.split())
+    return text.split(':', 1)[1].strip() if ':' in text else text
+
+
+def _ocr_regions(page, layout, engine, timeout):
+    """
+    OCR solo de las cajas de nombre y neto del formato, a su DPI.
+    Arma un texto con las etiquetas que esperan el extractor local y el LLM.
+    Cada recibo de la página se valida por separado con el extractor local
+    (que lee un solo recibo por texto). Devuelve (texto, detalles) o None si
+    algún recibo no es plausible (entonces se hace el OCR de la página completa).
+    """
+    bloques, confidences = [], []
+    pixels = 0
+    render_seconds = 0.0
+    for receipt in layout.receipts:
+        values = {}
+        for field in FIELDS:
+            render_start = time.perf_counter()
+            pix = page.get_pixmap(dpi=layout.dpi, clip=page_rect_for_box(page, receipt[field]),
+                                  colorspace=fitz.csGRAY, alpha=False)
+            image = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+            render_seconds += time.perf_counter() - render_start
+            pixels += pix.width * pix.height
+            text, confidence = engine.recognize(image, timeout=timeout)
+            del image, pix
+            values[field] = _field_value(text)
+            confidences.append(confidence)
+        bloque = f"Apellido y nombre: {values['nombre']}\nNeto a cobrar: {values['neto']}"
+        json_data, confidence = extract_receipt(bloque)
+        if confidence < config.OCR_ROI_MIN_CONFIDENCE or len(json_data['recibos']) != 1:
+            print(f"  Formato '{layout.name}': las regiones del recibo {len(bloques) + 1} no dieron un "
+                  f"recibo válido. OCR de página completa.")
+            return None
+        bloques.append(bloque)
+
+    text = "\n\n".join(bloques)
+    return text, {
+        'dpi': layout.dpi,
+        'confidence': round(sum(confidences) / len(confidences), 1),
+        'layout': layout.name,
+        'ocr_pixels': pixels,
+        'render_ms': round(render_seconds * 1000, 1),
+    }
+
+
+def _ocr_full_page(page, engine, timeout, clip=None):
+    """OCR de la página completa (o de la zona 'clip') con DPI adaptativo."""
+    best = None
+    pixels = 0
+    render_seconds = 0.0
+    for dpi in ocr_dpi_steps():
+        # Renderizar la página en grises y pasarla a PIL sin copias intermedias
+        render_start = time.perf_counter()
+        page_image, pix = render_page_image(page, dpi, clip)
+        render_seconds += time.perf_counter() - render_start
+        pixels += pix.width * pix.height
+
+        # Aplicar OCR con el motor configurado (texto + confianza media)
+        text, confidence = engine.recognize(page_image, timeout=timeout)
+        del page_image, pix
+
+        if best is None or confidence > best[1]['confidence']:
+            best = (text, {'dpi': dpi, 'confidence': round(confidence, 1)})
+        if confidence >= config.OCR_MIN_CONFIDENCE:
+            break
+
+    text, details = best
+    details['ocr_pixels'] = pixels
+    details['render_ms'] = round(render_seconds * 1000, 1)
+    return text, details
+
+
+def _ocr_page(page, timeout=0, clip=None):
+    """
+    Renderiza la página y le aplica OCR con Tesseract.
+
+    Si la página coincide con un formato registrado (layouts.py) solo se
+    procesan las cajas de nombre y neto. Si no, se hace el OCR de la página
+    completa con DPI adaptativo: se empieza con la resolución baja y solo se
+    re-renderiza a la alta si la confianza media queda por debajo de
+    config.OCR_MIN_CONFIDENCE.
+    Con timeout > 0 se corta el proceso de Tesseract si tarda más de esos segundos.
+    Con 'clip' (fitz.Rect) solo se procesa esa zona, siempre completa.
+    Devuelve (texto, {'dpi', 'confidence', 'engine', 'ocr_pixels', 'render_ms', 'ocr_ms'
+    [, 'layout', 'engine_init_ms']}).
+    """
+    engine = get_engine()
+    ocr_start_ms = engine.total_seconds * 1000
+
+    result = None
+    layout = None
+    if clip is None:
+        layout = match_layout(page, lambda image: engine.recognize(image, timeout=timeout))
+    if layout is not None:
+        result = _ocr_regions(page, layout, engine, timeout)
+    if result is None:
+        result = _ocr_full_page(page, engine, timeout, clip)
+
+    text, details = result
+    details['ocr_ms'] = round(engine.total_seconds * 1000 - ocr_start_ms, 1)
+    init_ms = take_init_report()
+    if init_ms is not None:
+        details['engine_init_ms'] = init_ms
+    return text, details
+
+
+# Caché persistente de texto OCR, compartida por todos los lotes y workers
+ocr_cache = DiskCache(config.OCR_CACHE_PATH, config.OCR_CACHE_MAX_MB * 1024 * 1024)
+
+
+def _page_content_digest(page, clip=None):
+    """Hash (sha256) del contenido de la página: stream de dibujo, imágenes, fuentes, tamaño y rotación."""
+    doc = page.parent
+    h = hashlib.sha256()
+    h.update(page.read_contents())
+    h.update(repr((tuple(page.rect), page.rotation)).encode())
+    if clip is not None:
+        h.update(repr(tuple(clip)).encode())
+    for font in page.get_fonts(full=True):
+        h.update(repr(font[1:5]).encode())
+    for img in page.get_images(full=True):
+        h.update(doc.xref_stream_raw(img[0]) or b'')
+    return h
+
+
+def page_content_hash(page):
+    """Hash del contenido de la página: dos páginas con el mismo hash se ven igual."""
+    return _page_content_digest(page).hexdigest()
+
+
+def page_cache_key(page, clip=None):
+    """
+    Clave de caché de una página: hash de su contenido más la configuración
+    del OCR. Dos páginas iguales en PDFs distintos comparten la misma clave.
+    Con 'clip' la clave es la de esa zona de la página.
+    """
+    h = _page_content_digest(page, clip)
+    dpis = ",".join(str(d) for d in ocr_dpi_steps())
+    h.update(
+        f"|v2|dpi={dpis}|conf={config.OCR_MIN_CONFIDENCE}"
+        f"|lang={config.OCR_LANG}|engine={engine_version()}|layouts={layouts_version()}".encode()
+    )
+    return h.hexdigest()
+
+
+def _ocr_page_cached(page, timeout=0, clip=None):
+    """
+    OCR de la página pasando por la caché.
+    Devuelve (texto, detalles) donde detalles incluye 'dpi', 'confidence' y
+    'cache' ('hit' / 'miss'; no está si la caché está desactivada).
+    """
+    if not config.OCR_CACHE_ENABLED:
+        return _ocr_page(page, timeout=timeout, clip=clip)
+
+    key = page_cache_key(page, clip)
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        entry = json.loads(cached)
+        return entry['text'], dict(entry['details'], cache='hit')
+
+    text, details = _ocr_page(page, timeout=timeout, clip=clip)
+    # Los tiempos son de esta corrida: no se guardan en la caché
+    stored = {k: v for k, v in details.items() if k not in ('ocr_pixels', 'render_ms', 'ocr_ms', 'engine_init_ms')}
+    ocr_cache.set(key, json.dumps({'text': text, 'details': stored}))
+    return text, dict(details, cache='miss')
+
+
+def page_count(pdf_path):
+    """Devuelve la cantidad de páginas del PDF (0 si no se puede abrir)."""
+    try:
+        with fitz.open(pdf_path) as doc:
+            return len(doc)
+    except Exception as e:
+        print(f"Error al contar páginas de '{pdf_path}': {e}")
+        return 0
+
+
+def page_sizes(pdf_path, pages=None, clips=None):
+    """
+    Tamaño en puntos (ancho, alto) de las páginas del PDF (todas o las de
+    'pages'), o de su zona si están en 'clips'. Solo lee la estructura del
+    PDF, no renderiza. Devuelve {} si no se puede abrir.
+    """
+    try:
+        with fitz.open(pdf_path) as doc:
+            sizes = {}
+            for page_num in (pages if pages is not None else range(1, len(doc) + 1)):
+                rect = doc[page_num - 1].rect
+                if clips and page_num in clips:
+                    rect = fitz.Rect(clips[page_num]) & rect
+                sizes[page_num] = (rect.width, rect.height)
+            return sizes
+    except Exception as e:
+        print(f"Error al leer el tamaño de las páginas de '{pdf_path}': {e}")
+        return {}
+
+
+def process_pdf_pages(pdf_path, use_text_layer=None, detailed=False, pages=None, page_timeout=0, clips=None):
+    """
+    Generador que procesa un PDF página por página y 'yields'
     (devuelve) el texto de cada página junto con su número.
+
+    'pages' limita el proceso a esos números de página (base 1), en el orden
+    dado; por defecto se procesan todas. 'page_timeout' corta el OCR de una
+    página que tarde más de esos segundos (0 = sin límite). 'clips'
+    ({página: (x0, y0, x1, y1)} en puntos) limita esas páginas a una zona,
+    por ejemplo la mitad izquierda de una hoja con dos copias lado a lado.
+
+    Si use_text_layer está activo (por defecto config.OCR_USE_TEXT_LAYER),
+    primero intenta usar la capa de texto embebida del PDF y solo aplica
+    OCR a las páginas escaneadas o con texto ilegible.
+
+    Con detailed=True devuelve (texto, página, info), donde info indica el
+    camino usado ('source': 'text_layer' u 'ocr'), la calidad medida y, para
+    las páginas con OCR, el DPI usado, la confianza media de Tesseract y si
+    el texto salió de la caché ('cache': 'hit'/'miss').
     """
+    if use_text_layer is None:
+        use_text_layer = config.OCR_USE_TEXT_LAYER
 
     if not os.path.exists(pdf_path):
         print(f"Error: El archivo PDF '{pdf_path}' no fue encontrado.")
-        return 
+        return
 
     doc = None
     try:
@@ -20,44 +372,65 @@ def process_pdf_pages(pdf_path):
         doc = fitz.open(pdf_path)
         print(f"PDF abierto. Se encontraron {len(doc)} páginas. Procesando...")
 
+        if pages is None:
+            pages = range(1, len(doc) + 1)
+
         # 2. Iterar por cada página
-        for i, page in enumerate(doc):
-            page_num = i + 1
+        for page_num in pages:
             print(f"Procesando Página {page_num}...")
-            text = "" 
+            text = ""
+            info = {'source': 'ocr'}
             try:
-                # 3. Renderizar la página a una imagen (pixmap)
-                pix = page.get_pixmap(dpi=300)
-
-                # 4. Convertir a bytes de imagen (PNG)
-                img_bytes = pix.tobytes("png")
+                page = doc[page_num - 1]
+                clip = None
+                if clips and page_num in clips:
+                    clip = fitz.Rect(clips[page_num])
+                    info['clip'] = list(clips[page_num])
 
-                # 5. Abrir como imagen PIL
-                page_image = Image.open(io.BytesIO(img_bytes))
+                # 3. Camino rápido: capa de texto embebida (PDF digital)
+                if use_text_layer:
+                    layer_start = time.perf_counter()
+                    layer_text, words = extract_text_layer(page, clip)
+                    quality = text_layer_quality(layer_text, words)
+                    info['text_layer_ms'] = round((time.perf_counter() - layer_start) * 1000, 1)
+                    info['quality'] = quality
+                    if quality['ok']:
+                        text = layer_text
+                        info['source'] = 'text_layer'
 
-                # 6. Aplicar OCR con Tesseract
-                text = pytesseract.image_to_string(page_image, lang='spa')
+                # 4. Camino lento: renderizar y aplicar OCR
+                if info['source'] == 'ocr':
+                    text, details = _ocr_page_cached(page, timeout=page_timeout, clip=clip)
+                    info.update(details)
 
                 if not text.strip():
                     print(f"  Página {page_num} no generó texto (posiblemente en blanco).")
 
-                # 7. 'yield' (devolver) el texto y el número de página
+                # 5. 'yield' (devolver) el texto y el número de página
                 # La ejecución de la función se pausa aquí y vuelve en el siguiente
                 # ciclo del 'for' en app.py
-                yield text, page_num
+                if detailed:
+                    yield text, page_num, info
+                else:
+                    yield text, page_num
 
             except Exception as e:
                 print(f"  Error procesando la página {page_num}: {e}")
                 # Devolvemos un error para esta página
-                yield f"ERROR_PROCESANDO_PAGINA_{page_num}: {e}", page_num
-    
+                error_text = f"ERROR_PROCESANDO_PAGINA_{page_num}: {e}"
+                if detailed:
+                    info['source'] = 'error'
+                    yield error_text, page_num, info
+                else:
+                    yield error_text, page_num
+
     except Exception as e:
         print(f"--- ¡FALLO CRÍTICO al abrir PDF! ---: {e}")
         # Si el PDF no se puede abrir, simplemente no 'yield' nada
         return
-    
+
     finally:
-        # 8. Cerrar el documento al terminar
+        # 6. Cerrar el documento al terminar
         if doc:
             doc.close()
-            print("Documento PDF cerrado.")
\ No newline at end of file
+            print("Documento PDF cerrado.")
@@ -0,0 +1,203 @@
+import abc
+import importlib.util
+import threading
+import time
+import functools
+import config
+from lazy_imports import lazy_module
+
+pytesseract = lazy_module('pytesseract')
+
+# Backends de OCR intercambiables.
+#
+# - 'tesserocr': API de Tesseract dentro del proceso. Carga spa.traineddata
+#   una sola vez y reutiliza el handle en todas las páginas y lotes
+#   (uno por hilo; con el pool de OCR queda uno por núcleo).
+# - 'pytesseract': lanza un proceso 'tesseract' por página. Es el camino
+#   original y queda como respaldo si tesserocr no está instalado.
+#
+# config.OCR_ENGINE elige el backend ('auto' = tesserocr si está disponible).
+
+# tesserocr es opcional y su import carga libtesseract: solo se comprueba
+# que esté instalado, y se importa al crear el primer TesserocrEngine
+HAS_TESSEROCR = importlib.util.find_spec('tesserocr') is not None
+
+
+def _text_from_data(data):
+    """Arma el texto a partir de la salida de image_to_data (renglón por renglón)."""
+    renglones = {}
+    for i, word in enumerate(data['text']):
+        if not word or not word.strip():
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        renglones.setdefault(key, []).append(word)
+
+    lines = []
+    last_block = None
+    for key in sorted(renglones):
+        if last_block is not None and key[0] != last_block:
+            lines.append("")
+        lines.append(" ".join(renglones[key]))
+        last_block = key[0]
+    return "\n".join(lines)
+
+
+def _mean_confidence(data):
+    confs = [float(c) for c, w in zip(data['conf'], data['text']) if w and w.strip() and float(c) >= 0]
+    return sum(confs) / len(confs) if confs else 0.0
+
+
+class OcrEngine(abc.ABC):
+    """
+    Interfaz común de los backends. Cada motor mide cuánto tardó en
+    inicializarse y cuánto tarda cada página.
+    """
+    name = 'base'
+
+    def __init__(self, lang):
+        self.lang = lang
+        start = time.perf_counter()
+        self._init()
+        self.init_seconds = time.perf_counter() - start
+        self.pages = 0
+        self.total_seconds = 0.0
+        self.last_page_seconds = 0.0
+
+    def _init(self):
+        pass
+
+    @abc.abstractmethod
+    def _recognize(self, image, timeout):
+        """OCR de la imagen: (texto, confianza media 0-100)."""
+
+    def recognize(self, image, timeout=0):
+        """OCR de una imagen PIL. Devuelve (texto, confianza media 0-100)."""
+        start = time.perf_counter()
+        try:
+            return self._recognize(image, timeout)
+        finally:
+            self.last_page_seconds = time.perf_counter() - start
+            self.pages += 1
+            self.total_seconds += self.last_page_seconds
+
+    def stats(self):
+        return {
+            'engine': self.name,
+            'init_ms': round(self.init_seconds * 1000, 1),
+            'pages': self.pages,
+            'avg_page_ms': round(self.total_seconds * 1000 / self.pages, 1) if self.pages else 0.0,
+        }
+
+    @staticmethod
+    @abc.abstractmethod
+    def version():
+        """Versión del motor (entra en la clave de la caché de OCR)."""
+
+
+class PytesseractEngine(OcrEngine):
+    """Un proceso 'tesseract' por página (vuelve a cargar el modelo cada vez)."""
+    name = 'pytesseract'
+
+    def _recognize(self, image, timeout):
+        data = pytesseract.image_to_data(
+            image, lang=self.lang, timeout=timeout, output_type=pytesseract.Output.DICT
+        )
+        return _text_from_data(data), _mean_confidence(data)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def version():
+        try:
+            return f"pytesseract-{pytesseract.get_tesseract_version()}"
+        except Exception:
+            return 'pytesseract-desconocida'
+
+
+class TesserocrEngine(OcrEngine):
+    """Handle persistente de la API de Tesseract: el modelo se carga una vez."""
+    name = 'tesserocr'
+
+    def _init(self):
+        import tesserocr
+        self.api = tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    def _recognize(self, image, timeout):
+        try:
+            self.api.SetImage(image)
+            # Recognize acepta un timeout en milisegundos (0 = sin límite)
+            if not self.api.Recognize(int(timeout * 1000)):
+                raise RuntimeError("Tesseract no pudo reconocer la página (timeout o error)")
+            text = self.api.GetUTF8Text()
+            confidence = self.api.MeanTextConf()
+        finally:
+            # El handle se reutiliza en la página siguiente: no debe quedar con esta imagen
+            self.api.Clear()
+        return text, float(confidence)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def version():
+        import tesserocr
+        return f"tesserocr-{tesserocr.tesseract_version().splitlines()[0]}"
+
+
+ENGINES = {
+    'pytesseract': PytesseractEngine,
+    'tesserocr': TesserocrEngine,
+}
+
+
+def engine_class():
+    """Clase del motor configurado en config.OCR_ENGINE (con respaldo a pytesseract)."""
+    name = config.OCR_ENGINE
+    if name == 'auto':
+        name = 'tesserocr' if HAS_TESSEROCR else 'pytesseract'
+    if name == 'tesserocr' and not HAS_TESSEROCR:
+        print("Aviso: OCR_ENGINE=tesserocr pero 'tesserocr' no está instalado. Usando pytesseract.")
+        name = 'pytesseract'
+    if name not in ENGINES:
+        print(f"Aviso: motor de OCR '{name}' desconocido. Usando pytesseract.")
+        name = 'pytesseract'
+    return ENGINES[name]
+
+
+# Un motor por hilo: los handles de Tesseract no son seguros entre hilos
+_local = threading.local()
+
+
+def get_engine():
+    """
+    Devuelve el motor de OCR de este hilo, creándolo la primera vez.
+    Si el motor persistente falla al iniciar se usa pytesseract.
+    """
+    engine = getattr(_local, 'engine', None)
+    if engine is None:
+        cls = engine_class()
+        try:
+            engine = cls(config.OCR_LANG)
+        except Exception as e:
+            if cls is PytesseractEngine:
+                raise
+            print(f"Error iniciando motor de OCR '{cls.name}': {e}. Usando pytesseract.")
+            engine = PytesseractEngine(config.OCR_LANG)
+        print(f"Motor de OCR '{engine.name}' listo en {engine.init_seconds * 1000:.0f} ms.")
+        _local.engine = engine
+        _local.init_reported = False
+    return engine
+
+
+def take_init_report():
+    """
+    Devuelve el tiempo de inicio del motor de este hilo (ms) la primera vez
+    que se llama después de crearlo, y None las siguientes.
+    """
+    engine = getattr(_local, 'engine', None)
+    if engine is None or _local.init_reported:
+        return None
+    _local.init_reported = True
+    return round(engine.init_seconds * 1000, 1)
+
+
+def engine_version():
+    """Versión del motor configurado, sin inicializarlo (para claves de caché)."""
+    return engine_class().version()
@@ -0,0 +1,393 @@
+import os
+import queue
+import time
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import config
+from lazy_imports import lazy_module
+from ocr import process_pdf_pages, page_count, page_sizes
+from ocr_engines import get_engine
+from memory_budget import memory_budget, page_cost
+from layouts import FIELDS, load_layouts
+
+fitz = lazy_module('fitz')
+
+# Pool de procesos compartido por todos los lotes del proceso.
+# Se crea la primera vez que se usa y se recrea si algún worker muere o si
+# una tarea se traba (se matan sus procesos: ver _kill_executor).
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+# Pools que se mataron por una tarea trabada (ver _kill_executor): sus demás
+# tareas, de este lote o de otros, se vuelven a mandar sin gastar su reintento
+_timed_out_executors = weakref.WeakSet()
+
+# Cada cuánto se revisa si alguna tarea superó su tiempo máximo
+_POLL_SECONDS = 1.0
+
+
+def worker_count():
+    """Cantidad de workers configurada (config.OCR_WORKERS, 0 = uno por núcleo)."""
+    return config.OCR_WORKERS or os.cpu_count() or 1
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            print(f"Iniciando pool de OCR con {workers} proceso(s)...")
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _kill_executor(executor, timed_out=False):
+    """
+    Mata los procesos de 'executor' y, si es el pool actual, lo descarta (el
+    próximo uso crea uno nuevo). future.cancel() no corta una tarea que ya
+    está corriendo: sin esto un worker trabado en Tesseract ocupa su lugar
+    en el pool hasta que termine. Las demás tareas de ese pool terminan con
+    BrokenProcessPool (o canceladas) y se reintentan; con timed_out=True
+    (se mató por una tarea trabada) sin gastar su único reintento.
+    """
+    global _executor
+    with _executor_lock:
+        if timed_out:
+            _timed_out_executors.add(executor)
+        if _executor is executor:
+            _executor = None
+    # ProcessPoolExecutor no expone sus procesos de otra forma
+    for process in list((getattr(executor, '_processes', None) or {}).values()):
+        try:
+            process.kill()
+        except Exception as e:
+            print(f"No se pudo terminar el worker de OCR {process.pid}: {e}")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _warm_worker():
+    """Tarea de precalentamiento: carga fitz y el motor de OCR en el worker."""
+    start = time.perf_counter()
+    fitz.Rect()
+    try:
+        get_engine()
+    except Exception as e:
+        print(f"No se pudo iniciar el motor de OCR al precalentar: {e}")
+    return os.getpid(), round((time.perf_counter() - start) * 1000, 1)
+
+
+def warm_up(workers=None):
+    """
+    Arranca el pool de OCR y deja cargados fitz y el motor de OCR en sus
+    procesos, para que la primera página no pague esos tiempos.
+    Devuelve [(pid, ms)] de los workers que respondieron.
+    """
+    workers = workers or worker_count()
+    if workers <= 1:
+        return [_warm_worker()]
+    executor = _get_executor(workers)
+    # Una tarea por worker: el pool los arranca todos al recibir la primera
+    futures = [executor.submit(_warm_worker) for _ in range(workers)]
+    return [f.result() for f in futures]
+
+
+def _ocr_pages(pdf_path, pages, clips, page_timeout):
+    """
+    Tarea de un worker: abre el PDF por su cuenta y procesa (renderiza + OCR)
+    las páginas indicadas ('clips': zona de algunas de ellas, ver process_pdf_pages).
+    """
+    return list(process_pdf_pages(pdf_path, detailed=True, pages=pages, page_timeout=page_timeout, clips=clips))
+
+
+def _error_results(pages, message):
+    return [
+        (f"ERROR_PROCESANDO_PAGINA_{page_num}: {message}", page_num, {'source': 'error', 'error': message})
+        for page_num in pages
+    ]
+
+
+def _pdf_pages(pdf_path, pages):
+    """Páginas a procesar de un PDF: las de 'pages' (ver process_pdfs_parallel) o todas."""
+    if pages is not None and pages.get(pdf_path) is not None:
+        return list(pages[pdf_path])
+    return list(range(1, page_count(pdf_path) + 1))
+
+
+def _split_tasks(pdf_paths, pages_per_task, pages=None):
+    """Divide las páginas de cada PDF en grupos, en orden de documento."""
+    tasks = []
+    for pdf_path in pdf_paths:
+        pdf_pages = _pdf_pages(pdf_path, pages)
+        for i in range(0, len(pdf_pages), pages_per_task):
+            tasks.append((pdf_path, pdf_pages[i:i + pages_per_task]))
+    return tasks
+
+
+def _page_cost(width, height, clipped, layouts):
+    """
+    Memoria estimada de una página: el render completo a config.OCR_DPI o,
+    si puede coincidir con un formato registrado (las que tienen zona nunca
+    se comparan), la caja más grande de ese formato a su DPI, que puede ser
+    más alto. Qué formato le toca recién se sabe en el worker, así que se
+    reserva para el peor.
+    """
+    cost = page_cost(width, height)
+    if not clipped:
+        for layout in layouts:
+            for receipt in layout.receipts:
+                for field in FIELDS:
+                    x0, y0, x1, y1 = receipt[field]
+                    cost = max(cost, page_cost(width * (x1 - x0), height * (y1 - y0), layout.dpi))
+    return cost
+
+
+def _task_costs(tasks, clips):
+    """
+    Memoria estimada de cada tarea (ver _page_cost): la de su página más
+    grande, porque el worker las procesa de a una.
+    """
+    layouts, _ = load_layouts()
+    sizes = {}
+    costs = []
+    for pdf_path, task_pages in tasks:
+        pdf_clips = clips.get(pdf_path) or {}
+        if pdf_path not in sizes:
+            sizes[pdf_path] = page_sizes(pdf_path, clips=pdf_clips)
+        pdf_sizes = sizes[pdf_path]
+        costs.append(max((_page_cost(*pdf_sizes[p], p in pdf_clips, layouts)
+                          for p in task_pages if p in pdf_sizes), default=0))
+    return costs
+
+
+def _acquire(semaphore, stop):
+    while not stop.is_set():
+        if semaphore.acquire(timeout=_POLL_SECONDS):
+            return True
+    return False
+
+
+def _process_sequential(pdf_paths, page_timeout, pages, clips, on_wait, stop):
+    tasks = _split_tasks(pdf_paths, config.OCR_PAGES_PER_TASK, pages)
+    for (pdf_path, task_pages), cost in zip(tasks, _task_costs(tasks, clips)):
+        # Un lote cancelado deja la fila del presupuesto (y no traba a los que esperan detrás)
+        if not memory_budget.acquire(cost, stop=stop, on_wait=on_wait):
+            return
+        try:
+            # La reserva se libera antes de entregar las páginas (ya no ocupan memoria)
+            results = list(process_pdf_pages(pdf_path, detailed=True, pages=task_pages,
+                                             page_timeout=page_timeout, clips=clips.get(pdf_path)))
+        finally:
+            memory_budget.release(cost)
+        for text, page_num, info in results:
+            yield pdf_path, text, page_num, info
+
+
+def process_pdfs_parallel(pdf_paths, workers=None, ordered=True, page_timeout=None, pages_per_task=None,
+                          pages=None, clips=None, on_wait=None, stop=None):
+    """
+    Generador que aplica OCR a varios PDFs en paralelo usando un pool de
+    procesos y 'yields' (pdf_path, texto, página, info) por cada página.
+
+    - ordered=True: las páginas salen en orden de documento (PDF por PDF).
+      ordered=False: salen a medida que terminan.
+    - workers: cantidad de procesos (por defecto config.OCR_WORKERS).
+    - page_timeout: segundos máximos por página (por defecto config.OCR_PAGE_TIMEOUT).
+      Una página que lo supera se devuelve como ERROR_PROCESANDO_PAGINA.
+    - pages: {pdf_path: [páginas]} para procesar solo esas (por ejemplo las
+      que quedaron tras dedup.plan_batch); un PDF sin entrada va completo.
+    - clips: {pdf_path: {página: (x0, y0, x1, y1)}} zona a procesar de esas páginas.
+    - on_wait: se llama con la posición en la fila cuando una tarea tiene
+      que esperar lugar en el presupuesto de memoria (memory_budget.py).
+    - stop: threading.Event del lote; si se activa, se deja de esperar
+      memoria y de mandar tareas, y el generador termina.
+
+    Cada tarea reserva su memoria estimada antes de ir al pool y la libera
+    al terminar; como mucho hay workers + 1 tareas del lote en el pool, así
+    un lote grande no reserva memoria para páginas que todavía no empezaron.
+    """
+    clips = clips or {}
+    workers = workers or worker_count()
+    if page_timeout is None:
+        page_timeout = config.OCR_PAGE_TIMEOUT
+    pages_per_task = max(1, pages_per_task or config.OCR_PAGES_PER_TASK)
+
+    # Con un solo worker no vale la pena el pool: se procesa en este proceso
+    if workers <= 1:
+        yield from _process_sequential(pdf_paths, page_timeout, pages, clips, on_wait, stop)
+        return
+
+    tasks = _split_tasks(pdf_paths, pages_per_task, pages)
+    if not tasks:
+        return
+    costs = _task_costs(tasks, clips)
+
+    # Las tareas se mandan al pool desde un hilo aparte: si esperan memoria,
+    # este generador sigue entregando los resultados de las que ya están.
+    # 'todo' tiene los índices por mandar (y los que se reintentan)
+    todo = queue.Queue()
+    for index in range(len(tasks)):
+        todo.put(index)
+    submitted = queue.Queue()
+    slots = threading.Semaphore(workers + 1)
+    # Se activa al salir del generador (terminó, se abandonó o se canceló el lote)
+    finished = threading.Event()
+
+    def submit_tasks():
+        while not finished.is_set():
+            try:
+                index = todo.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            pdf_path, task_pages = tasks[index]
+            cost = costs[index]
+            if not _acquire(slots, finished):
+                return
+            if not memory_budget.acquire(cost, stop=finished, on_wait=on_wait):
+                slots.release()
+                return
+            executor = None
+            try:
+                executor = _get_executor(workers)
+                future = executor.submit(_ocr_pages, pdf_path, task_pages,
+                                         {p: clips[pdf_path][p] for p in task_pages if p in clips.get(pdf_path, {})},
+                                         page_timeout)
+            except Exception as e:
+                memory_budget.release(cost)
+                slots.release()
+                if executor is not None and executor in _timed_out_executors:
+                    # Otro lote mató el pool entre que se tomó y se usó: se manda al nuevo
+                    todo.put(index)
+                    continue
+                if isinstance(e, BrokenProcessPool):
+                    _reset_executor()
+                # Esta tarea sale con error; la siguiente prueba con un pool nuevo
+                submitted.put((index, e))
+                continue
+
+            def release(_=None, cost=cost, once=threading.Lock()):
+                # Una sola vez: al terminar o al abandonar la tarea (lo que pase primero)
+                if once.acquire(blocking=False):
+                    memory_budget.release(cost)
+                    slots.release()
+
+            future.add_done_callback(release)
+            submitted.put((index, (future, executor, release)))
+
+    threading.Thread(target=submit_tasks, daemon=True).start()
+
+    # Límite por tarea (red de seguridad además del timeout de Tesseract)
+    task_limit = page_timeout * pages_per_task * 2 if page_timeout else None
+
+    # {future: (índice, pool, liberar su lugar y su memoria)}
+    futures = {}
+    results = {}
+    started = {}
+    # Tareas que ya se reintentaron porque su pool se cayó solo
+    retried = set()
+    next_index = 0
+    resolved = 0
+
+    try:
+        while resolved < len(tasks):
+            if stop is not None and stop.is_set():
+                return
+            # Tareas que ya se mandaron al pool (si no hay ninguna en curso, esperar la próxima)
+            block = not futures
+            while True:
+                try:
+                    index, item = submitted.get(timeout=_POLL_SECONDS) if block else submitted.get_nowait()
+                except queue.Empty:
+                    break
+                block = False
+                if isinstance(item, Exception):
+                    results[index] = _error_results(tasks[index][1], f"no se pudo enviar al pool de OCR: {item}")
+                    resolved += 1
+                else:
+                    future, executor, release = item
+                    futures[future] = (index, executor, release)
+
+            done = set()
+            if futures:
+                done, _ = wait(futures, timeout=_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+
+            for future in done:
+                index, executor, _ = futures.pop(future)
+                pdf_path, task_pages = tasks[index]
+                try:
+                    results[index] = future.result()
+                except (BrokenProcessPool, CancelledError) as e:
+                    if executor in _timed_out_executors:
+                        # Se mató el pool por una tarea trabada (de este lote o de
+                        # otro): la tarea no tuvo la culpa, se vuelve a mandar
+                        todo.put(index)
+                        continue
+                    # El pool se cayó solo: la culpable puede ser esta, se reintenta una vez
+                    _kill_executor(executor)
+                    if index not in retried:
+                        retried.add(index)
+                        todo.put(index)
+                        continue
+                    results[index] = _error_results(task_pages, f"worker de OCR caído: {e!r}")
+                except Exception as e:
+                    results[index] = _error_results(task_pages, str(e))
+                resolved += 1
+
+            # Las tareas que quedaron en cola en un pool que se descartó están canceladas
+            # y wait() no las devuelve nunca; las de un pool que se mató por una tarea
+            # trabada tampoco se espera a que el pool las dé por perdidas. No tuvieron
+            # la culpa: se vuelven a mandar sin gastar su reintento
+            for future in list(futures):
+                index, executor, release = futures[future]
+                if future.cancelled() or (executor in _timed_out_executors and not future.done()):
+                    del futures[future]
+                    release()
+                    todo.put(index)
+
+            # Detectar tareas trabadas
+            if task_limit:
+                for future in list(futures):
+                    if not future.running():
+                        continue
+                    start = started.setdefault(future, now)
+                    if now - start > task_limit:
+                        index, executor, release = futures.pop(future)
+                        pdf_path, task_pages = tasks[index]
+                        print(f"Timeout de OCR en {pdf_path} páginas {task_pages[0]}-{task_pages[-1]}. "
+                              f"Se reinicia el pool de OCR.")
+                        results[index] = _error_results(task_pages, "timeout de OCR")
+                        resolved += 1
+                        # Liberar el worker trabado; las demás tareas del pool se reintentan
+                        _kill_executor(executor, timed_out=True)
+                        release()
+
+            # Entregar resultados
+            if ordered:
+                while next_index in results:
+                    pdf_path = tasks[next_index][0]
+                    for text, page_num, info in results.pop(next_index):
+                        yield pdf_path, text, page_num, info
+                    next_index += 1
+            else:
+                for index in list(results):
+                    pdf_path = tasks[index][0]
+                    for text, page_num, info in results.pop(index):
+                        yield pdf_path, text, page_num, info
+    finally:
+        # Si el consumidor abandona el generador, no dejar tareas en cola
+        # (las canceladas liberan su memoria en el callback)
+        finished.set()
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,211 @@
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+import config
+import metrics
+from email_sender import SmtpConnection, build_report_message, email_configured
+
+# Bandeja de salida de emails.
+#
+# Cada reporte a enviar se guarda como un archivo JSON en config.OUTBOX_DIR
+# (escritura atómica), así que sobrevive a un reinicio del servidor. Un solo
+# hilo trabajador los envía reutilizando una conexión SMTP persistente
+# (email_sender.SmtpConnection), que se cierra tras OUTBOX_IDLE_SECONDS sin
+# uso. Si un envío falla se reintenta con backoff exponencial (con jitter);
+# después de OUTBOX_MAX_ATTEMPTS el mensaje pasa a <outbox>/failed.
+#
+# Con OUTBOX_DIGEST_SECONDS > 0 los reportes se juntan: se espera a que el
+# más viejo tenga esa antigüedad y se envían todos en un solo email.
+
+
+def _failed_dir(directory):
+    return os.path.join(directory, 'failed')
+
+
+class Outbox:
+    def __init__(self, directory, connection_factory=SmtpConnection):
+        self.directory = directory
+        self.connection_factory = connection_factory
+        self._cond = threading.Condition()
+        self._thread = None
+        self._connection = None
+        self._last_used = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    # --- Cola en disco ---
+
+    def _write(self, item):
+        path = os.path.join(self.directory, f"{item['id']}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump(item, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _load_pending(self):
+        items = []
+        if not os.path.isdir(self.directory):
+            return items
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as fh:
+                    items.append(json.load(fh))
+            except (OSError, ValueError) as e:
+                print(f"[Outbox] No se pudo leer {name}: {e}")
+        items.sort(key=lambda item: item['created_at'])
+        return items
+
+    def _remove(self, item):
+        try:
+            os.remove(os.path.join(self.directory, f"{item['id']}.json"))
+        except OSError:
+            pass
+
+    def _mark_failed(self, item):
+        os.makedirs(_failed_dir(self.directory), exist_ok=True)
+        shutil.move(os.path.join(self.directory, f"{item['id']}.json"),
+                    os.path.join(_failed_dir(self.directory), f"{item['id']}.json"))
+        self.failed += 1
+
+    def enqueue(self, filepath, month_name, year):
+        """Encola un reporte para enviar y despierta al trabajador."""
+        if not email_configured():
+            print("Error: Configuración de email no encontrada en config.py. Omitiendo envío.")
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        item = {
+            'id': f"{int(now * 1000)}-{uuid.uuid4().hex[:8]}",
+            'report': [filepath, month_name, year],
+            'created_at': now,
+            'attempts': 0,
+            'next_attempt_at': now,
+            'last_error': None,
+        }
+        self._write(item)
+        print(f"[Outbox] Reporte encolado para envío: {os.path.basename(filepath)}")
+        self.start()
+        with self._cond:
+            self._cond.notify()
+        return item['id']
+
+    # --- Trabajador ---
+
+    def start(self):
+        """Arranca el hilo trabajador (una sola vez). Retoma lo que quedó en disco."""
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+                self._thread.start()
+
+    def _due_items(self, now):
+        """Mensajes listos para enviar ahora (y cuándo revisar de nuevo)."""
+        pending = self._load_pending()
+        if not pending:
+            return [], None
+        ready = [item for item in pending if item['next_attempt_at'] <= now]
+        next_check = min(item['next_attempt_at'] for item in pending)
+
+        if config.OUTBOX_DIGEST_SECONDS > 0 and ready:
+            # Modo resumen: esperar a que el más viejo cumpla la ventana
+            digest_at = min(item['created_at'] for item in ready) + config.OUTBOX_DIGEST_SECONDS
+            if digest_at > now:
+                return [], digest_at
+            return ready, None
+        return ready[:1], next_check if not ready else None
+
+    def _backoff(self, attempts):
+        delay = min(config.OUTBOX_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), config.OUTBOX_RETRY_MAX_SECONDS)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _send(self, items):
+        """Envía un grupo de mensajes como un solo email. Devuelve True si salió."""
+        reports = [tuple(item['report']) for item in items]
+        missing = [r for r in reports if not os.path.exists(r[0])]
+        for item in items:
+            if tuple(item['report']) in missing:
+                # Sin el archivo no tiene sentido reintentar
+                print(f"[Outbox] El reporte {item['report'][0]} ya no existe. Se descarta.")
+                item['last_error'] = 'archivo inexistente'
+                self._write(item)
+                self._mark_failed(item)
+        items = [item for item in items if tuple(item['report']) not in missing]
+        if not items:
+            return False
+
+        try:
+            with metrics.timed('email'):
+                msg = build_report_message([tuple(item['report']) for item in items])
+                if self._connection is None:
+                    self._connection = self.connection_factory()
+                self._connection.send(msg)
+        except Exception as e:
+            print(f"[Outbox] Error al enviar email ({len(items)} reporte(s)): {e}")
+            metrics.inc('recibos_emails_total', result='error')
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            for item in items:
+                item['attempts'] += 1
+                item['last_error'] = str(e)
+                if item['attempts'] >= config.OUTBOX_MAX_ATTEMPTS:
+                    print(f"[Outbox] Se agotaron los reintentos de {item['id']}.")
+                    self._write(item)
+                    self._mark_failed(item)
+                else:
+                    item['next_attempt_at'] = time.time() + self._backoff(item['attempts'])
+                    self._write(item)
+            return False
+
+        self._last_used = time.time()
+        metrics.inc('recibos_emails_total', result='sent')
+        for item in items:
+            self._remove(item)
+        self.sent += len(items)
+        print(f"[Outbox] Email enviado ({len(items)} reporte(s)).")
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                now = time.time()
+                items, next_check = self._due_items(now)
+                if items:
+                    self._send(items)
+                    continue
+
+                # Cerrar la conexión si quedó ociosa
+                if self._connection is not None and now - self._last_used > config.OUTBOX_IDLE_SECONDS:
+                    self._connection.close()
+                    self._connection = None
+
+                timeout = config.OUTBOX_IDLE_SECONDS
+                if next_check is not None:
+                    timeout = min(timeout, max(next_check - now, 0.05))
+                with self._cond:
+                    self._cond.wait(timeout)
+            except Exception as e:
+                print(f"[Outbox] Error en el trabajador: {e}")
+                time.sleep(1)
+
+    def pending_reports(self):
+        """Rutas absolutas de los reportes que todavía falta enviar."""
+        return {os.path.abspath(item['report'][0]) for item in self._load_pending()}
+
+    def stats(self):
+        pending = self._load_pending()
+        return {
+            'pending': len(pending),
+            'retrying': sum(1 for item in pending if item['attempts']),
+            'sent': self.sent,
+            'failed': self.failed,
+        }
+
+
+outbox = Outbox(config.OUTBOX_DIR)
@@ -1,15 +1,19 @@
-import os
+import re
 import json
-from groq import Groq
-from config import GROQ_API_KEY
-os.environ["GROQ_API_KEY"] = GROQ_API_KEY
+import hashlib
+import config
+import metrics
+from config import LLM_BATCH_TOKEN_BUDGET, LLM_BATCH_MAX_PAGES
+from cache_store import DiskCache
+from compactor import estimate_tokens
+from llm_client import scheduler, LLMError
 
-try:
-    client = Groq()
-except Exception as e:
-    print(f"Error: {e}")
-    print("Asegurate de poner tu API Key en la variable de entorno GROQ_API_KEY")
-    exit()
+LLM_MODEL = config.LLM_MODEL
+# Subir este número cada vez que cambien los prompts: invalida la caché
+PROMPT_VERSION = 1
+
+# Caché persistente de extracciones exitosas
+llm_cache = DiskCache(config.LLM_CACHE_PATH, config.LLM_CACHE_MAX_MB * 1024 * 1024, ttl=config.LLM_CACHE_TTL)
 
 def create_prompt(sueldo_text):
     return f"""
@@ -50,40 +54,249 @@ def create_prompt(sueldo_text):
 
 
 
+def create_batch_prompt(pages):
+    """
+    Prompt para varias páginas en una sola llamada.
+    'pages' es una lista de dicts {'id': ..., 'text': ...}.
+    """
+    bloques = "\n".join(
+        f"""
+    === PÁGINA {page['id']} ===
+    ```
+    {page['text']}
+    ```"""
+        for page in pages
+    )
+    return f"""
+    Eres un experto en interpretar recibos de sueldo y CORREGIR NOMBRES MAL ESCRITOS. Vas a recibir VARIAS páginas, cada una identificada con un id. Analiza cada página por separado y devuelve EXCLUSIVAMENTE un único objeto JSON.
+
+    PÁGINAS:
+    {bloques}
+
+    EXTRAE DE CADA PÁGINA:
+    1. "nombre": Nombre del empleado.
+    2. "apellido": Apellido del empleado.
+    3. "sueldo": Monto total del sueldo (como número, no string).
+
+    CONSIDERACIONES:
+    INSTRUCCIONES CLAVE:
+    IMPORTANTE: Es posible que el nombre esté con algún error ortigráfico o alguna letra mal puesta, en tal caso arreglalo al nombre correcto
+    0. Pueden haber nombres compuestos y apellidos mal escritos, por ejemplo, Rsm0n Feronandez en lugar de Ramon Fernandez, tenelo en cuenta y arregalos 
+    1. Solo extrae el empleado/trabajador, no el empleador. 
+    2. El empleado casi siempre aparece después de la etiqueta "Apellido y nombre:.
+    3. Si una página tiene varios recibos, devuelve todos en su lista "recibos".
+    4. Corrige errores ortográficos menores en nombres y apellidos.
+    5. El sueldo debe ser el monto líquido final si aparece; si no, usa el bruto.
+    6. No incluyas datos del empleador ni otros nombres.
+    7. Devuelve UNA entrada en "paginas" por CADA id recibido, aunque su lista "recibos" quede vacía. No mezcles datos entre páginas.
+
+    Formato de salida:
+    ```json
+    {{
+      "paginas": [
+        {{"id": "P1", "recibos": [{{"nombre": "...", "apellido": "...", "sueldo": 123456.78}}]}}
+      ]
+    }}
+    ```
+
+    DESPUÉS DEL OUTPUT JSON NO ESCRIBAS NADA MÁS.
+    """
+
+
+# Tokens fijos de las instrucciones del prompt por lotes (sin páginas)
+BATCH_PROMPT_OVERHEAD = estimate_tokens(create_batch_prompt([]))
+# Tokens de la envoltura de cada página dentro del prompt por lotes
+_BATCH_PAGE_OVERHEAD = 20
+
+
+def batch_page_tokens(page_text):
+    """Tokens estimados que ocupa una página dentro del prompt por lotes."""
+    return estimate_tokens(page_text) + _BATCH_PAGE_OVERHEAD
+
+
+def pack_batches(pages, token_budget, max_pages=None):
+    """
+    Agrupa las páginas (en orden) en lotes cuyo prompt estimado no supere
+    token_budget ni max_pages páginas. Una página que sola ya supera el
+    presupuesto va en un lote propio.
+    """
+    max_pages = max_pages or LLM_BATCH_MAX_PAGES
+    batches = []
+    current = []
+    current_tokens = BATCH_PROMPT_OVERHEAD
+    for page in pages:
+        page_tokens = batch_page_tokens(page['text'])
+        if current and (current_tokens + page_tokens > token_budget or len(current) >= max_pages):
+            batches.append(current)
+            current = []
+            current_tokens = BATCH_PROMPT_OVERHEAD
+        current.append(page)
+        current_tokens += page_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _chat_json(prompt):
+    """
+    Llama al LLM forzando respuesta JSON y devuelve el objeto parseado.
+    Los límites de la API y los reintentos los maneja llm_client.scheduler.
+    """
+    response_content = scheduler.complete(prompt)
+
+    # OBTENER EL JSON
+    with metrics.timed('json_parse'):
+        return json.loads(response_content)
+
+
+# Marcas de copia que no cambian el contenido del recibo
+_RE_MARCAS_COPIA = re.compile(r"\b(original|duplicado|triplicado|copia)\b")
+
+
+def normalize_text(sueldo_text):
+    """
+    Forma normalizada del texto OCR para la caché: minúsculas, espacios
+    colapsados y sin las marcas ORIGINAL/DUPLICADO de cada copia.
+    """
+    text = _RE_MARCAS_COPIA.sub(" ", sueldo_text.casefold())
+    return " ".join(text.split())
+
+
+def llm_cache_key(sueldo_text):
+    """Clave de caché: texto normalizado + modelo + versión del prompt."""
+    base = f"{LLM_MODEL}|v{PROMPT_VERSION}|{normalize_text(sueldo_text)}"
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def is_valid_result(json_data):
+    """Indica si la respuesta cumple el esquema {'recibos': [{nombre, apellido, sueldo}]}."""
+    if not isinstance(json_data, dict) or 'error' in json_data:
+        return False
+    recibos = json_data.get('recibos')
+    if not isinstance(recibos, list):
+        return False
+    for recibo in recibos:
+        if not isinstance(recibo, dict):
+            return False
+        if not isinstance(recibo.get('nombre'), str) or not isinstance(recibo.get('apellido'), str):
+            return False
+        sueldo = recibo.get('sueldo')
+        if isinstance(sueldo, bool) or not isinstance(sueldo, (int, float)):
+            return False
+    return True
+
+
+def _cache_get(sueldo_text):
+    if not config.LLM_CACHE_ENABLED:
+        return None
+    cached = llm_cache.get(llm_cache_key(sueldo_text))
+    return json.loads(cached) if cached is not None else None
+
+
+def _cache_set(sueldo_text, json_data):
+    # Solo se guardan resultados válidos, nunca el dict de error
+    if config.LLM_CACHE_ENABLED and is_valid_result(json_data):
+        llm_cache.set(llm_cache_key(sueldo_text), json.dumps(json_data))
+
+
+def _parse_batch_response(parsed_json, pages):
+    """
+    Mapea la respuesta por lotes a {id: {'recibos': [...]}}.
+    Lanza ValueError si la respuesta está incompleta o mal formada.
+    """
+    paginas = parsed_json.get('paginas') if isinstance(parsed_json, dict) else None
+    if not isinstance(paginas, list):
+        raise ValueError("la respuesta no tiene la lista 'paginas'")
+
+    ids = {str(page['id']) for page in pages}
+    results = {}
+    for pagina in paginas:
+        if not isinstance(pagina, dict) or str(pagina.get('id')) not in ids:
+            continue
+        recibos = pagina.get('recibos', [])
+        if not isinstance(recibos, list):
+            raise ValueError(f"'recibos' inválido en la página {pagina.get('id')}")
+        results[str(pagina['id'])] = {'recibos': recibos}
+
+    faltantes = ids - set(results)
+    if faltantes:
+        raise ValueError(f"faltan páginas en la respuesta: {sorted(faltantes)}")
+    return results
+
+
+def error_result(error):
+    """Resultado de una página que el LLM no pudo procesar (tiene la clave 'error')."""
+    return {
+        'error': str(error),
+        'nombre': 'Error',
+        'apellido': 'Error',
+        'sueldo': 0
+    }
+
+
+def _process_batch(pages):
+    """Procesa un lote; si la respuesta falla lo divide a la mitad y reintenta."""
+    if len(pages) == 1:
+        page = pages[0]
+        return {str(page['id']): process_ticket(page['text'])}
+
+    try:
+        results = _parse_batch_response(_chat_json(create_batch_prompt(pages)), pages)
+        for page in pages:
+            _cache_set(page['text'], results[str(page['id'])])
+        return results
+    except LLMError as e:
+        # La API no respondió (ya se reintentó): dividir solo multiplicaría las llamadas
+        print(f"Lote de {len(pages)} páginas sin respuesta del LLM: {e}")
+        return {str(page['id']): error_result(e) for page in pages}
+    except Exception as e:
+        print(f"Lote de {len(pages)} páginas con respuesta inválida ({e}). Dividiendo y reintentando...")
+        mitad = len(pages) // 2
+        results = _process_batch(pages[:mitad])
+        results.update(_process_batch(pages[mitad:]))
+        return results
+
+
+def process_tickets_batch(pages, token_budget=None):
+    """
+    Procesa muchas páginas agrupándolas en pocas llamadas al LLM.
+
+    'pages' es una lista de dicts {'id': ..., 'text': ...}; el id identifica
+    la página (y por ende su archivo) en la respuesta. Devuelve un dict
+    {id: json_data} donde json_data tiene el mismo formato que process_ticket.
+    """
+    if token_budget is None:
+        token_budget = LLM_BATCH_TOKEN_BUDGET
+
+    # Las páginas ya extraídas antes no se vuelven a enviar
+    results = {}
+    pending = []
+    for page in pages:
+        cached = _cache_get(page['text'])
+        if cached is not None:
+            results[str(page['id'])] = cached
+        else:
+            pending.append(page)
+
+    for batch in pack_batches(pending, token_budget):
+        results.update(_process_batch(batch))
+    return results
+
+
 def process_ticket(sueldo_text):
     """Procesa recibo de sueldo y devuelve el JSON parseado"""
+    cached = _cache_get(sueldo_text)
+    if cached is not None:
+        return cached
+
     prompt = create_prompt(sueldo_text)
 
     try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model="llama-3.1-8b-instant", 
-            
-            # Forzamos la respuesta a ser un JSON
-            response_format={"type": "json_object"},
-            
-            temperature=0.0
-        )
-
-        # OBTENER EL JSON
-        response_content = chat_completion.choices[0].message.content
-        parsed_json = json.loads(response_content)
-        
+        parsed_json = _chat_json(prompt)
+        _cache_set(sueldo_text, parsed_json)
         return parsed_json
 
     except Exception as e:
-        return {
-            'error': str(e),
-            'nombre': 'Error',
-            'apellido': 'Error',
-            'sueldo': 0
-        }
-
-    except Exception as e:
-        print(f"Error procesando: {e}")
+        print(f"Error procesando recibo con el LLM: {e}")
+        return error_result(e)
     
\ No newline at end of file
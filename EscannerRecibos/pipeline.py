@@ -0,0 +1,338 @@
+import queue
+import threading
+import time
+import config
+import metrics
+import ocr_parallel
+from ocr_parallel import process_pdfs_parallel
+from llm_client import scheduler
+from memory_budget import memory_budget
+from parser import process_ticket, process_tickets_batch, batch_page_tokens, BATCH_PROMPT_OVERHEAD
+from local_extractor import extract_receipt
+from dedup import plan_batch
+from compactor import compact_for_prompt
+
+# Marca de fin para los consumidores de la cola LLM
+_FIN = object()
+
+# Cada cuánto los hilos revisan si el lote fue cancelado
+_POLL_SECONDS = 0.5
+
+
+# Páginas procesadas por cada camino de extracción desde que arrancó el proceso
+_extraction_stats = {'local': 0, 'llm': 0, 'none': 0, 'error': 0}
+_stats_lock = threading.Lock()
+
+
+def _count_extraction(path):
+    with _stats_lock:
+        _extraction_stats[path] = _extraction_stats.get(path, 0) + 1
+    metrics.inc('recibos_extraction_total', path=path)
+
+
+# Tiempos que informa ocr.py en el info de cada página -> nombre de la etapa
+_OCR_TIMINGS = {'text_layer_ms': 'text_layer', 'render_ms': 'render', 'ocr_ms': 'ocr'}
+
+
+def _page_timings(info):
+    """
+    Tiempos de OCR de la página ({etapa: ms}). Se miden en el proceso del
+    pool, así que los histogramas se registran acá, en el proceso principal.
+    """
+    timings = {}
+    for key, stage in _OCR_TIMINGS.items():
+        if key in info:
+            timings[stage] = info[key]
+            metrics.observe_stage(stage, info[key] / 1000)
+    metrics.inc('recibos_pages_total', source=info.get('source', 'error'))
+    if 'ocr_pixels' in info:
+        metrics.inc('recibos_ocr_pixels_total', info['ocr_pixels'], mode='roi' if 'layout' in info else 'full')
+    return timings
+
+
+def extraction_stats():
+    """Copia de los contadores globales de páginas por camino de extracción."""
+    with _stats_lock:
+        return dict(_extraction_stats)
+
+
+def warm_up():
+    """
+    Precalienta lo que de otro modo paga el primer lote: el pool de OCR
+    (fitz y el motor de OCR cargados en cada worker) y el cliente del LLM
+    con su conexión abierta. Devuelve los ms de cada parte.
+    """
+    start = time.perf_counter()
+    ocr_parallel.warm_up()
+    timings = {'ocr': round((time.perf_counter() - start) * 1000, 1), 'llm': scheduler.warm_up()}
+    print(f"Precalentamiento listo: OCR {timings['ocr']} ms, LLM {timings['llm']} ms.")
+    return timings
+
+
+def _is_page_error(page_text):
+    return not page_text or page_text.startswith("ERROR_PROCESANDO_PAGINA")
+
+
+def _put(q, item, stop):
+    """put() bloqueante que se corta si se canceló el lote."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _acquire(semaphore, stop):
+    while not stop.is_set():
+        if semaphore.acquire(timeout=_POLL_SECONDS):
+            return True
+    return False
+
+
+def _ocr_producer(pdf_paths, pages, llm_queue, out_queue, window, stop, llm_workers):
+    """Etapa 1: OCR de todas las páginas; cada página va a la cola del LLM."""
+    seq = 0
+    try:
+        # Antes del OCR: omitir páginas (y mitades de hoja) duplicadas
+        clips = None
+        if config.DEDUP_ENABLED:
+            with metrics.timed('dedup'):
+                plan = plan_batch(pdf_paths, pages)
+            pages, clips = plan.pages, plan.clips
+            for skip in plan.skips:
+                metrics.inc('recibos_pages_skipped_total', reason=skip['reason'])
+                out_queue.put(('skip', skip))
+
+        # Si el presupuesto de memoria del OCR está lleno, el lote espera en la fila
+        def on_wait(position):
+            out_queue.put(('wait', {'position': position}))
+
+        for pdf_path, page_text, page_num, page_info in process_pdfs_parallel(pdf_paths, pages=pages, clips=clips,
+                                                                              on_wait=on_wait, stop=stop):
+            # Contrapresión: no más de 'window' páginas en vuelo
+            if not _acquire(window, stop):
+                return
+            item = {
+                'seq': seq,
+                'pdf': pdf_path,
+                'page': page_num,
+                'info': page_info,
+                'text': page_text,
+                'timings': _page_timings(page_info),
+            }
+            seq += 1
+            out_queue.put(('page', dict(item, timings=dict(item['timings']))))
+
+            if _is_page_error(page_text):
+                # Nada que extraer: pasa directo al resultado
+                out_queue.put(('result', dict(item, json_data=None, extractor='none')))
+                continue
+
+            # Extractor local: si tiene confianza suficiente no se consulta al LLM
+            with metrics.collecting() as timings, metrics.timed('local_extract'):
+                json_data, confidence = extract_receipt(page_text)
+            metrics.add_timings(item['timings'], timings)
+            item['local_confidence'] = confidence
+            if confidence >= config.LOCAL_EXTRACTOR_MIN_CONFIDENCE:
+                out_queue.put(('result', dict(item, json_data=json_data, extractor='local')))
+                continue
+            # Si el LLM falla se usa esto (ver _llm_result)
+            item['local_result'] = json_data
+
+            # Al LLM va el texto compactado (sin tabla de conceptos, texto legal ni basura)
+            with metrics.collecting() as timings, metrics.timed('compact'):
+                item['prompt_text'], item['prompt_tokens'] = compact_for_prompt(page_text)
+            metrics.add_timings(item['timings'], timings)
+            metrics.inc('recibos_prompt_tokens_total', item['prompt_tokens']['before'], text='raw')
+            metrics.inc('recibos_prompt_tokens_total', item['prompt_tokens']['after'], text='compact')
+            item['queued_at'] = time.perf_counter()
+            if not _put(llm_queue, item, stop):
+                return
+    except Exception as e:
+        out_queue.put(('error', e))
+    finally:
+        out_queue.put(('ocr_done', seq))
+        for _ in range(llm_workers):
+            _put(llm_queue, _FIN, stop)
+
+
+def _take_batch(llm_queue, first):
+    """
+    Junta, sin esperar, las páginas que ya están en la cola mientras entren
+    en el presupuesto de tokens de una llamada agrupada ('first' va siempre,
+    aunque sola lo supere).
+    Devuelve (items, fin, resto): fin indica que se tomó la marca de fin y
+    resto es la página que se sacó de la cola pero no entraba (o None); va
+    primera en la llamada siguiente.
+    """
+    items = [first]
+    tokens = BATCH_PROMPT_OVERHEAD + batch_page_tokens(first['prompt_text'])
+    while len(items) < config.LLM_BATCH_MAX_PAGES:
+        try:
+            item = llm_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _FIN:
+            return items, True, None
+        item_tokens = batch_page_tokens(item['prompt_text'])
+        if tokens + item_tokens > config.LLM_BATCH_TOKEN_BUDGET:
+            return items, False, item
+        items.append(item)
+        tokens += item_tokens
+    return items, False, None
+
+
+def _record_queue_wait(item):
+    wait = time.perf_counter() - item.pop('queued_at')
+    metrics.observe_stage('llm_queue_wait', wait)
+    item['timings']['llm_queue_wait'] = round(wait * 1000, 1)
+
+
+def _llm_result(item, json_data):
+    """
+    Resultado de una página que pasó por el LLM. Si el LLM falló (ya con los
+    reintentos de llm_client) se usa lo que encontró el extractor local; si
+    no encontró nada la página sale con extractor 'error' y el motivo en
+    json_data['error'], para que el lote la informe.
+    """
+    local = item.pop('local_result', None)
+    if isinstance(json_data, dict) and 'error' in json_data:
+        if local and local.get('recibos'):
+            return dict(item, json_data=local, extractor='local', llm_error=json_data['error'])
+        return dict(item, json_data=json_data, extractor='error')
+    return dict(item, json_data=json_data, extractor='llm')
+
+
+def _llm_consumer(llm_queue, out_queue, stop):
+    """Etapa 2: extracción con el LLM (varios hilos en paralelo)."""
+    # Página que no entró en la llamada agrupada anterior
+    carry = None
+    try:
+        while not stop.is_set():
+            if carry is not None:
+                item, carry = carry, None
+            else:
+                try:
+                    item = llm_queue.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                if item is _FIN:
+                    return
+
+            if not config.LLM_BATCH_TOKEN_BUDGET:
+                _record_queue_wait(item)
+                with metrics.collecting() as timings:
+                    json_data = process_ticket(item['prompt_text'])
+                metrics.add_timings(item['timings'], timings)
+                out_queue.put(('result', _llm_result(item, json_data)))
+                continue
+
+            # Varias páginas por llamada: el id de cada una es su número de secuencia
+            items, fin, carry = _take_batch(llm_queue, item)
+            for i in items:
+                _record_queue_wait(i)
+            with metrics.collecting() as timings:
+                results = process_tickets_batch([{'id': str(i['seq']), 'text': i['prompt_text']} for i in items])
+            # Cada página se lleva su parte de la llamada agrupada (así las sumas por lote cierran)
+            share = {stage: ms / len(items) for stage, ms in timings.items()}
+            for i in items:
+                metrics.add_timings(i['timings'], share)
+                out_queue.put(('result', _llm_result(i, results[str(i['seq'])])))
+            if fin:
+                return
+    except Exception as e:
+        # Como en _ocr_producer: el error llega al generador en lugar de dejarlo esperando
+        out_queue.put(('error', e))
+
+
+def run_pipeline(pdf_paths, llm_workers=None, queue_size=None, pages=None):
+    """
+    Procesa un lote de PDFs como un pipeline de dos etapas:
+    OCR (pool de procesos) -> cola acotada -> extracción LLM (pool de hilos).
+    'pages' ({pdf: [páginas]}) limita el proceso a esas páginas de cada PDF
+    (por defecto todas).
+
+    Es un generador de eventos (dicts):
+    - {'type': 'skip', 'pdf', 'page', 'half', 'duplicate_of', 'reason', ...}:
+      una página (o su mitad derecha, half='derecha') omitida por duplicada
+      antes del OCR (ver dedup.plan_batch). Llegan antes que las páginas.
+    - {'type': 'wait', 'position', 'memory'}: el OCR del lote espera lugar en
+      el presupuesto de memoria (memory_budget.py); 'position' es su lugar
+      en la fila (1 = el próximo) y 'memory' el estado del presupuesto.
+    - {'type': 'page', ...}: una página terminó el OCR (en orden de documento).
+    - {'type': 'result', ..., 'json_data': ..., 'extractor': ...}: resultado
+      de la extracción, siempre en orden de página. 'extractor' es 'local'
+      (reglas, sin red), 'llm', 'none' (la página falló en OCR y json_data es None)
+      o 'error' (el LLM no respondió tras los reintentos; json_data['error'] dice por qué).
+      Las páginas que van al LLM traen además 'prompt_tokens'
+      ({'before', 'after'}: tokens estimados del texto antes y después de
+      compactarlo, ver compactor.py).
+
+    Ambos traen 'timings' ({etapa: ms}): en 'page' los de OCR (text_layer,
+    render, ocr) y en 'result' además local_extract, compact, llm_queue_wait,
+    llm_call y json_parse.
+
+    Las colas acotadas aplican contrapresión: como máximo hay
+    queue_size + llm_workers páginas en vuelo, así la memoria no crece con
+    el tamaño del lote y el OCR no se adelanta indefinidamente al LLM.
+    """
+    llm_workers = llm_workers or config.LLM_WORKERS
+    queue_size = queue_size or config.PIPELINE_QUEUE_SIZE
+
+    stop = threading.Event()
+    llm_queue = queue.Queue(maxsize=queue_size)
+    out_queue = queue.Queue()
+    window = threading.BoundedSemaphore(queue_size + llm_workers)
+
+    threads = [threading.Thread(
+        target=_ocr_producer,
+        args=(pdf_paths, pages, llm_queue, out_queue, window, stop, llm_workers),
+        daemon=True,
+    )]
+    threads += [
+        threading.Thread(target=_llm_consumer, args=(llm_queue, out_queue, stop), daemon=True)
+        for _ in range(llm_workers)
+    ]
+    for t in threads:
+        t.start()
+
+    pending = {}
+    next_seq = 0
+    total = None
+
+    try:
+        while total is None or next_seq < total:
+            try:
+                kind, payload = out_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                # Los hilos avisan sus errores por la cola; si murieron todos sin
+                # terminar el lote (y no queda nada por leer) no hay nada que esperar
+                if not any(t.is_alive() for t in threads) and out_queue.empty():
+                    raise RuntimeError("El pipeline terminó sin entregar todas las páginas del lote")
+                continue
+
+            if kind == 'page':
+                yield dict(payload, type='page')
+            elif kind == 'skip':
+                yield dict(payload, type='skip')
+            elif kind == 'wait':
+                yield dict(payload, type='wait', memory=memory_budget.stats())
+            elif kind == 'result':
+                pending[payload['seq']] = payload
+            elif kind == 'ocr_done':
+                total = payload
+            elif kind == 'error':
+                raise payload
+
+            # Reordenar: entregar resultados en orden de página
+            while next_seq in pending:
+                result = pending.pop(next_seq)
+                _count_extraction(result['extractor'])
+                yield dict(result, type='result')
+                window.release()
+                next_seq += 1
+    finally:
+        # Si el cliente se desconecta (o termina el lote) se frenan los hilos
+        stop.set()
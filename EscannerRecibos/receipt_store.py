@@ -0,0 +1,234 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import config
+from dedup import normalize_name
+
+# Almacén persistente de recibos extraídos.
+#
+# Cada recibo de un lote (web o cli.py) se guarda en un archivo SQLite con su
+# empleado (nombre y apellido normalizados: sin tildes, signos ni orden),
+# su período (AAAA-MM) y el sha256 del PDF del que salió. El período sale del
+# texto del recibo ("Período: 03/2024", "Mes liquidado: Marzo 2024"); si no
+# figura se usa el indicado al subir el lote y, si tampoco, el mes en curso. Procesar de nuevo
+# el mismo PDF actualiza sus filas en lugar de duplicarlas (upsert por PDF,
+# página y empleado), así un reporte mensual se arma con una consulta sobre
+# todo lo subido en el mes, sin volver a pasar por el OCR ni el LLM.
+#
+# Índices: (período, empleado) para los reportes y las búsquedas del mes, y
+# (empleado, período) para el historial de un empleado.
+
+
+def current_period(now=None):
+    """Período (AAAA-MM) del mes actual: el último recurso para un recibo sin período."""
+    return (now or datetime.now()).strftime('%Y-%m')
+
+
+_MONTHS = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7,
+    'agosto': 8, 'septiembre': 9, 'setiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12,
+}
+# Solo se busca junto a una etiqueta: el recibo tiene otras fechas (ingreso, pago)
+_PERIOD_LABEL = r'(?:per[ií]odo(?:\s+(?:abonado|liquidado|de\s+pago))?|mes(?:\s+liquidado)?|liquidaci[oó]n(?:\s+de)?)'
+_PERIOD_NUMERIC = re.compile(_PERIOD_LABEL + r'\s*:?\s*(\d{1,2})\s*[/.-]\s*(\d{4})', re.IGNORECASE)
+_PERIOD_NAMED = re.compile(
+    _PERIOD_LABEL + r'\s*:?\s*(' + '|'.join(_MONTHS) + r')\s*(?:de\s+|del\s+|[/.-]\s*)?(\d{4})',
+    re.IGNORECASE,
+)
+
+
+def period_from_text(text):
+    """
+    Período (AAAA-MM) que declara el texto de un recibo ("Período: 03/2024",
+    "Mes liquidado: Marzo de 2024"), o None si no figura.
+    """
+    for pattern in (_PERIOD_NUMERIC, _PERIOD_NAMED):
+        for match in pattern.finditer(text or ''):
+            month, year = match.groups()
+            month = _MONTHS[month.lower()] if month.isalpha() else int(month)
+            if 1 <= month <= 12 and 1990 <= int(year) <= 2100:
+                return f"{year}-{month:02d}"
+    return None
+
+
+def parse_period(value):
+    """
+    Valida un período 'AAAA-MM' y lo devuelve normalizado.
+    Lanza ValueError si no tiene ese formato.
+    """
+    parsed = datetime.strptime(str(value).strip(), '%Y-%m')
+    return parsed.strftime('%Y-%m')
+
+
+def employee_key(recibo):
+    """Clave del empleado de un recibo (None si no tiene nombre)."""
+    return normalize_name(f"{recibo.get('nombre', '')} {recibo.get('apellido', '')}") or None
+
+
+class ReceiptStore:
+    """
+    Recibos guardados en SQLite, seguros entre hilos y procesos como
+    DiskCache (una conexión por hilo/proceso y journal WAL).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Tras un fork la conexión heredada no se puede reutilizar
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recibos (
+                    id INTEGER PRIMARY KEY,
+                    employee TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    pdf_sha256 TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    nombre TEXT,
+                    apellido TEXT,
+                    sueldo REAL,
+                    filename TEXT,
+                    extractor TEXT,
+                    batch_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (pdf_sha256, page, employee)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recibos_period_employee ON recibos(period, employee)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recibos_employee_period ON recibos(employee, period)")
+            self._schema_ready = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def upsert(self, rows, period, batch_id=None, period_in_text=False):
+        """
+        Guarda los recibos de 'rows' (dicts con nombre, apellido, sueldo,
+        pdf_sha256, page y opcionalmente filename y extractor) en 'period'.
+        Si ya hay un recibo del mismo empleado en esa página del mismo PDF
+        se actualiza; los de otros empleados guardados antes para esa página
+        (una lectura anterior distinta) se borran. Devuelve cuántos se guardaron.
+
+        El período es de la página, se lea igual o distinto el nombre:
+        'period_in_text' indica que salió del texto de la página y entonces
+        reemplaza al guardado; si no (período del lote o mes en curso), la
+        página conserva el que ya tenía.
+        """
+        now = time.time()
+        pages = {}
+        for row in rows:
+            key = employee_key(row)
+            if key is None:
+                continue
+            sueldo = row.get('sueldo')
+            if isinstance(sueldo, bool) or not isinstance(sueldo, (int, float)):
+                sueldo = None
+            pages.setdefault((row['pdf_sha256'], row['page']), []).append(
+                (key, row.get('nombre'), row.get('apellido'), sueldo, row.get('filename'), row.get('extractor'))
+            )
+        if not pages:
+            return 0
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            values = []
+            for (pdf_sha256, page), page_rows in pages.items():
+                page_period = period
+                if not period_in_text:
+                    stored = conn.execute(
+                        "SELECT period FROM recibos WHERE pdf_sha256 = ? AND page = ? ORDER BY id LIMIT 1",
+                        (pdf_sha256, page),
+                    ).fetchone()
+                    if stored is not None:
+                        page_period = stored[0]
+                keys = [r[0] for r in page_rows]
+                conn.execute(
+                    f"DELETE FROM recibos WHERE pdf_sha256 = ? AND page = ? "
+                    f"AND employee NOT IN ({', '.join('?' * len(keys))})",
+                    [pdf_sha256, page] + keys,
+                )
+                for key, nombre, apellido, sueldo, filename, extractor in page_rows:
+                    values.append((key, page_period, pdf_sha256, page, nombre, apellido, sueldo,
+                                   filename, extractor, batch_id, now, now))
+            conn.executemany("""
+                INSERT INTO recibos (employee, period, pdf_sha256, page, nombre, apellido, sueldo,
+                                     filename, extractor, batch_id, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (pdf_sha256, page, employee) DO UPDATE SET
+                    period = excluded.period,
+                    nombre = excluded.nombre,
+                    apellido = excluded.apellido,
+                    sueldo = excluded.sueldo,
+                    filename = excluded.filename,
+                    extractor = excluded.extractor,
+                    batch_id = excluded.batch_id,
+                    updated_at = excluded.updated_at
+            """, values)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return len(values)
+
+    def find(self, employee=None, period=None):
+        """
+        Recibos de un empleado (nombre y apellido en cualquier orden, con o
+        sin tildes) y/o de un período, en el orden en que se guardaron.
+        """
+        where, params = [], []
+        if employee is not None:
+            where.append("employee = ?")
+            params.append(normalize_name(employee))
+        if period is not None:
+            where.append("period = ?")
+            params.append(period)
+        sql = "SELECT * FROM recibos"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY period, created_at, id"
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def last_update(self, period):
+        """Momento (epoch) del último cambio en los recibos del período, o None si no hay."""
+        return self._connect().execute(
+            "SELECT MAX(updated_at) FROM recibos WHERE period = ?", (period,)
+        ).fetchone()[0]
+
+    def periods(self):
+        """Períodos guardados, con cantidad de recibos y de empleados."""
+        rows = self._connect().execute("""
+            SELECT period, COUNT(*) AS recibos, COUNT(DISTINCT employee) AS employees
+            FROM recibos GROUP BY period ORDER BY period DESC
+        """)
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        try:
+            recibos, employees = self._connect().execute(
+                "SELECT COUNT(*), COUNT(DISTINCT employee) FROM recibos"
+            ).fetchone()
+            return {'recibos': recibos, 'employees': employees}
+        except sqlite3.Error as e:
+            print(f"[Recibos {self.path}] Error al leer estadísticas: {e}")
+            return {'recibos': 0, 'employees': 0}
+
+
+receipt_store = ReceiptStore(config.RECEIPT_STORE_PATH)
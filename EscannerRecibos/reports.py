@@ -0,0 +1,104 @@
+import os
+import time
+from datetime import datetime
+import config
+from dedup import dedupe_key
+from outbox import outbox
+from receipt_store import receipt_store
+
+# Reportes mensuales armados desde el almacén de recibos (receipt_store.py)
+# y política de retención de la carpeta de reportes.
+
+# La misma carpeta que excel_generator.TEMP_REPORTS_DIR (se sirve en /download)
+REPORTS_DIR = 'temp_reports'
+
+
+def monthly_report_path(period, directory=None):
+    return os.path.join(directory or REPORTS_DIR, f"Reporte_Mensual_{period}.xlsx")
+
+
+def monthly_report(period, directory=None):
+    """
+    Reporte de Excel con los recibos guardados del período (AAAA-MM), sin
+    repetir el mismo recibo (nombre y monto) subido en lotes distintos.
+
+    Si el reporte del período ya existe y no cambió ningún recibo desde que
+    se generó, se devuelve el mismo archivo. Devuelve (ruta, cantidad de
+    recibos) o (None, 0) si el período no tiene recibos.
+    """
+    last_update = receipt_store.last_update(period)
+    if last_update is None:
+        return None, 0
+
+    path = monthly_report_path(period, directory)
+    rows = receipt_store.find(period=period)
+    seen = set()
+    recibos = []
+    for row in rows:
+        key = dedupe_key(row) if config.DEDUP_RECIBOS else None
+        if key is not None and key in seen:
+            continue
+        if key is not None:
+            seen.add(key)
+        recibos.append(row)
+
+    if os.path.exists(path) and os.path.getmtime(path) >= last_update:
+        return path, len(recibos)
+
+    # openpyxl se importa recién acá: no demora el arranque del servidor
+    from excel_generator import ReportWriter
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    writer = ReportWriter(now=datetime.strptime(period, '%Y-%m'))
+    for recibo in recibos:
+        writer.add(recibo)
+    # Se escribe aparte y se reemplaza: una descarga en curso no ve un archivo a medias
+    tmp_path = path + '.tmp.xlsx'
+    writer.close(filepath=tmp_path, final_path=path)
+    os.replace(tmp_path, path)
+    return path, len(recibos)
+
+
+def prune_reports(directory=None):
+    """
+    Retención de la carpeta de reportes: borra los que tienen más de
+    config.REPORTS_RETENTION_DAYS días y, si la carpeta supera
+    config.REPORTS_MAX_MB, los más viejos primero. Nunca borra los que la
+    bandeja de salida todavía tiene que enviar ni los de la última hora
+    (pueden estar descargándose). Devuelve cuántos borró.
+    """
+    directory = directory or REPORTS_DIR
+    if not os.path.isdir(directory):
+        return 0
+    pending = outbox.pending_reports()
+    entries = []
+    total = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if not os.path.isfile(path):
+            continue
+        total += st.st_size
+        entries.append((st.st_mtime, st.st_size, path))
+
+    now = time.time()
+    expired = now - config.REPORTS_RETENTION_DAYS * 24 * 3600
+    limit = config.REPORTS_MAX_MB * 1024 * 1024
+    recent = now - 3600
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if mtime > recent or (mtime > expired and total <= limit):
+            break
+        if os.path.abspath(path) in pending:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError as e:
+            print(f"No se pudo borrar el reporte {path}: {e}")
+    if removed:
+        print(f"Reportes borrados por retención: {removed}")
+    return removed
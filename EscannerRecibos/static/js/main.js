@@ -184,17 +184,28 @@ function startProcessingStream(batchId) {
     eventSource.onmessage = function(event) {
         const data = JSON.parse(event.data);
 
-        if (data.status === 'progress') {
-            // Muestra el progreso
+        if (data.status === 'progress' || data.status === 'queued') {
+            // Muestra el progreso (o la posición en la cola)
             progressText.textContent = data.message;
+            if (data.recibo) {
+                // Cada recibo llega apenas se extrae: se agrega su fila a la tabla
+                appendResult(data.recibo);
+                resultsSection.style.display = 'block';
+            }
         
         } else if (data.status === 'complete') {
     console.log('Status complete recibido. Datos:', data);
     loading.style.display = 'none';
     resultsSection.style.display = 'block';
-    displayResults(data.data);
+    displayTotals(data.totals);
 
-    showMessage('PDFs procesados y extraídos con éxito.', 'success');
+    if (data.failed_pages && data.failed_pages.length > 0) {
+        // Páginas que el LLM no pudo procesar: no están en el reporte
+        const pages = data.failed_pages.map(p => `${p.file} (página ${p.page})`).join(', ');
+        showMessage(`Atención: no se pudieron extraer ${data.failed_pages.length} página(s): ${pages}. Volvé a procesarlas en unos minutos.`, 'error');
+    } else {
+        showMessage('PDFs procesados y extraídos con éxito.', 'success');
+    }
 
     // Botón de descarga
     console.log('download_filename:', data.download_filename);
@@ -235,6 +246,12 @@ function startProcessingStream(batchId) {
 
     // Maneja errores de conexión
     eventSource.onerror = function(err) {
+        // Si el navegador está reintentando, el servidor retoma el stream
+        // desde el último evento recibido (Last-Event-ID): no hay que resetear
+        if (eventSource && eventSource.readyState === EventSource.CONNECTING) {
+            progressText.textContent = 'Conexión perdida. Reconectando...';
+            return;
+        }
         console.error('Error de EventSource (conexión perdida):', err);
         loading.style.display = 'none';
         showMessage('Error: Se perdió la conexión con el servidor.', 'error');
@@ -274,28 +291,40 @@ function resetUpload() {
 }
 
 /**
- * Muestra los datos JSON en una tabla HTML
+ * Agrega la fila de un recibo a la tabla de resultados (la crea con el primero)
  */
-function displayResults(data) {
-    const recibos = data.recibos;
-    if (!recibos || recibos.length === 0) {
+function appendResult(recibo) {
+    let tbody = resultsTableContainer.querySelector('.results-table tbody');
+    if (!tbody) {
+        resultsTableContainer.innerHTML = '<table class="results-table">' +
+            '<thead><tr><th>Nombre</th><th>Apellido</th><th>Sueldo</th></tr></thead>' +
+            '<tbody></tbody></table>';
+        tbody = resultsTableContainer.querySelector('.results-table tbody');
+    }
+    const row = document.createElement('tr');
+    row.innerHTML = `
+        <td>${recibo.nombre || 'N/A'}</td>
+        <td>${recibo.apellido || 'N/A'}</td>
+        <td class="currency">${formatCurrency(recibo.sueldo)}</td>
+    `;
+    tbody.appendChild(row);
+}
+
+/**
+ * Agrega la fila de totales al final de la tabla
+ */
+function displayTotals(totals) {
+    const tbody = resultsTableContainer.querySelector('.results-table tbody');
+    if (!tbody || !totals || totals.recibos === 0) {
         resultsTableContainer.innerHTML = '<p>No se encontraron recibos en el documento.</p>';
         return;
     }
-    let tableHTML = '<table class="results-table">';
-    tableHTML += '<thead><tr><th>Nombre</th><th>Apellido</th><th>Sueldo</th></tr></thead>';
-    tableHTML += '<tbody>';
-    recibos.forEach(recibo => {
-        tableHTML += `
-            <tr>
-                <td>${recibo.nombre || 'N/A'}</td>
-                <td>${recibo.apellido || 'N/A'}</td>
-                <td class="currency">${formatCurrency(recibo.sueldo)}</td>
-            </tr>
-        `;
-    });
-    tableHTML += '</tbody></table>';
-    resultsTableContainer.innerHTML = tableHTML;
+    const row = document.createElement('tr');
+    row.innerHTML = `
+        <td colspan="2"><strong>Total (${totals.recibos} recibos)</strong></td>
+        <td class="currency"><strong>${formatCurrency(totals.sueldo)}</strong></td>
+    `;
+    tbody.appendChild(row);
 }
 
 /**
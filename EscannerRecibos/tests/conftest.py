@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+# Los módulos de la app son planos (import config, import ocr, ...): se
+# importan desde la carpeta EscannerRecibos, como al correr app.py.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config.py lee el entorno al importarse: las pruebas no usan las cachés ni
+# tocan el estado de la app (recibos guardados, bandeja de salida)
+_STATE_DIR = tempfile.mkdtemp(prefix='recibos-tests-')
+os.environ.update({
+    'OCR_CACHE_ENABLED': '0',
+    'LLM_CACHE_ENABLED': '0',
+    'OCR_CACHE_PATH': os.path.join(_STATE_DIR, 'ocr_cache.sqlite3'),
+    'LLM_CACHE_PATH': os.path.join(_STATE_DIR, 'llm_cache.sqlite3'),
+    'RECEIPT_STORE_PATH': os.path.join(_STATE_DIR, 'recibos.sqlite3'),
+    'OUTBOX_DIR': os.path.join(_STATE_DIR, 'outbox'),
+    'LAYOUTS_PATH': os.path.join(_STATE_DIR, 'layouts.json'),
+    'LLM_BACKEND': 'stub',
+    'LLM_STUB_LATENCY': '0',
+    'WARMUP_ON_START': '0',
+})
@@ -0,0 +1,56 @@
+import pytest
+
+import batch_processor
+import config
+from receipt_store import ReceiptStore
+from uploads import write_manifest
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.enqueued = []
+
+    def enqueue(self, filepath, month_name, year):
+        self.enqueued.append(filepath)
+
+
+def _result(pdf_path, page, text, recibos):
+    return {'type': 'result', 'pdf': pdf_path, 'page': page, 'text': text, 'extractor': 'local',
+            'timings': {}, 'json_data': {'recibos': recibos}}
+
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(config, 'DEDUP_RECIBOS', True)
+    monkeypatch.setattr(config, 'RECEIPT_STORE_ENABLED', True)
+    store = ReceiptStore(str(tmp_path / 'recibos.sqlite3'))
+    monkeypatch.setattr(batch_processor, 'receipt_store', store)
+    monkeypatch.setattr(batch_processor, 'outbox', FakeOutbox())
+    batch_dir = tmp_path / 'uploads' / 'lote'
+    batch_dir.mkdir(parents=True)
+    write_manifest(str(batch_dir), [{'filename': 'sueldos.pdf', 'sha256': 'a' * 64, 'duplicate_of': None}])
+    return str(batch_dir), store
+
+
+def test_same_pay_in_two_months_is_not_a_duplicate(batch, monkeypatch):
+    batch_dir, store = batch
+    juan = {'nombre': 'Juan', 'apellido': 'Pérez', 'sueldo': 123456.78}
+
+    def run_pipeline(pdf_paths):
+        pdf_path = pdf_paths[0]
+        yield _result(pdf_path, 1, "Período: 03/2024\nApellido y nombre: PEREZ, JUAN", [juan])
+        yield _result(pdf_path, 2, "Período: 04/2024\nApellido y nombre: PEREZ, JUAN", [juan])
+        # La copia de marzo sí es un duplicado
+        yield _result(pdf_path, 3, "Período: 03/2024\nApellido y nombre: PEREZ, JUAN", [juan])
+    monkeypatch.setattr(batch_processor, 'run_pipeline', run_pipeline)
+
+    events = list(batch_processor.process_batch('lote', batch_dir))
+
+    final = events[-1]
+    assert final['status'] == 'complete'
+    assert final['totals']['recibos'] == 2
+    assert final['duplicates']['recibos'] == 1
+    assert final['periods'] == ['2024-03', '2024-04']
+    assert [r['period'] for r in store.find(employee='Juan Pérez')] == ['2024-03', '2024-04']
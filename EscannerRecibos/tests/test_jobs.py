@@ -0,0 +1,101 @@
+import json
+import threading
+
+import pytest
+
+from jobs import JobManager
+
+
+def _wait_finished(job, timeout=5):
+    index = 0
+    while not job.finished:
+        index += len(job.wait_events(index, timeout))
+    return job
+
+
+def _events(*statuses):
+    return lambda: iter([{'status': s, 'message': f"evento {i}"} for i, s in enumerate(statuses)])
+
+
+@pytest.fixture
+def manager():
+    return JobManager(max_workers=1, retention_seconds=3600)
+
+
+def test_job_log_keeps_every_event_in_order(manager):
+    job = _wait_finished(manager.submit('lote-1', _events('progress', 'progress', 'complete')))
+
+    assert [e['status'] for e in job.events] == ['queued', 'progress', 'progress', 'progress', 'complete']
+    assert job.status == 'complete'
+    assert job.result == job.events[-1]
+    # Un lector que se reconecta lee desde donde quedó, sin esperar
+    assert job.wait_events(3, timeout=5) == job.events[3:]
+    assert job.wait_events(len(job.events), timeout=5) == []
+
+
+def test_failures_end_the_job_with_an_error_event(manager):
+    def fails():
+        yield {'status': 'progress', 'message': 'Procesando...'}
+        raise RuntimeError("se cortó el OCR")
+
+    failed = _wait_finished(manager.submit('lote-error', fails))
+    assert failed.result == {'status': 'error', 'message': 'se cortó el OCR'}
+
+    # Un generador que termina sin evento terminal también cierra el trabajo
+    unfinished = _wait_finished(manager.submit('lote-sin-fin', _events('progress')))
+    assert unfinished.status == 'error'
+
+
+def test_queue_position_while_the_pool_is_busy(manager):
+    release = threading.Event()
+
+    def blocked():
+        release.wait(5)
+        yield {'status': 'complete'}
+
+    first = manager.submit('primero', blocked)
+    second = manager.submit('segundo', _events('complete'))
+    third = manager.submit('tercero', _events('complete'))
+    while first.status != 'running':
+        first.wait_events(0, 0.05)
+
+    assert [manager.queue_position(j.id) for j in (first, second, third)] == [None, 1, 2]
+
+    release.set()
+    for job in (first, second, third):
+        _wait_finished(job)
+    assert manager.queue_position('tercero') is None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # app.py crea sus carpetas (uploads, temp_reports) en el directorio actual
+    monkeypatch.chdir(tmp_path)
+    import app
+    return app.app.test_client(), app.job_manager
+
+
+def _sse(response):
+    """[(id, evento)] de un stream SSE (sin los comentarios de keep-alive)."""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'data' in fields:
+            events.append((int(fields['id']), json.loads(fields['data'])))
+    return events
+
+
+def test_stream_resumes_after_last_event_id(client):
+    client, job_manager = client
+    _wait_finished(job_manager.submit('lote-sse', _events('progress', 'progress', 'complete')))
+
+    full = _sse(client.get('/process_stream/lote-sse'))
+    assert [i for i, _ in full] == [0, 1, 2, 3, 4]
+    assert full[-1][1]['status'] == 'complete'
+
+    resumed = _sse(client.get('/process_stream/lote-sse', headers={'Last-Event-ID': '2'}))
+    assert resumed == full[3:]
+    # Sin la cabecera (EventSource nuevo) también vale el parámetro
+    assert _sse(client.get('/process_stream/lote-sse?last_event_id=3')) == full[4:]
+
+    assert client.get('/process_stream/no-existe').status_code == 404
@@ -0,0 +1,201 @@
+import json
+
+import pytest
+
+import config
+import llm_client
+from llm_client import LLMError, LLMScheduler, RateLimited, StubBackend, TokenBucket
+
+
+class FakeClock:
+    """Reemplazo del módulo time en llm_client: el tiempo avanza solo con sleep()."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_client, 'time', clock)
+    return clock
+
+
+def test_reserve_queues_requests_in_order(clock):
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0.0
+    # Sin fichas: cada pedido espera detrás del anterior (1 ficha por segundo)
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    clock.sleep(2)
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+
+def test_try_take_does_not_take_when_short(clock):
+    bucket = TokenBucket(60)
+    assert bucket.try_take(50) == 0.0
+    assert bucket.try_take(20) == pytest.approx(10.0)
+    # No descontó nada: alcanza con esperar lo que faltaba
+    clock.sleep(10)
+    assert bucket.try_take(20) == 0.0
+
+
+def test_adjust_returns_unused_tokens_up_to_capacity(clock):
+    bucket = TokenBucket(100)
+    bucket.reserve(80)
+    bucket.adjust(30)
+    assert bucket.try_take(50) == 0.0
+    bucket.adjust(500)
+    assert bucket.try_take(100) == 0.0
+    assert bucket.try_take(1) > 0
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket(0)
+    assert bucket.reserve(10 ** 6) == 0.0
+    assert bucket.try_take(10 ** 6) == 0.0
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after': '2.5'}, 2.5),
+    ({'retry-after': '-3'}, 0.0),
+    ({'retry-after': 'Wed, 21 Oct 2026 07:28:00 GMT'}, None),
+    ({}, None),
+    (None, None),
+])
+def test_retry_after_header(headers, expected):
+    assert llm_client._retry_after(headers) == expected
+
+
+def test_status_errors():
+    limited = llm_client._status_error(429, "límite", {'retry-after': '4'})
+    assert isinstance(limited, RateLimited) and limited.retry_after == 4.0 and limited.retryable
+    assert llm_client._status_error(503, "caído").retryable
+    assert not llm_client._status_error(400, "pedido inválido").retryable
+
+
+class ScriptedBackend:
+    """Backend que lanza (o devuelve) lo que diga el guion, una entrada por llamada."""
+    name = 'guion'
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def complete(self, prompt):
+        self.calls += 1
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step, 0
+
+
+@pytest.fixture
+def retries(monkeypatch):
+    monkeypatch.setattr(config, 'LLM_MAX_RETRIES', 2)
+    monkeypatch.setattr(config, 'LLM_RETRY_BASE_SECONDS', 1.0)
+    monkeypatch.setattr(config, 'LLM_RETRY_MAX_SECONDS', 8.0)
+
+
+def _scheduler(backend):
+    return LLMScheduler(backend, max_concurrency=4, requests_per_minute=0, tokens_per_minute=0)
+
+
+def test_rate_limit_waits_retry_after_and_halves_concurrency(clock, retries):
+    backend = ScriptedBackend([RateLimited("429", retry_after=5.0), '{"recibos": []}'])
+    scheduler = _scheduler(backend)
+
+    assert scheduler.complete("prompt") == '{"recibos": []}'
+    assert backend.calls == 2
+    # Espera al menos lo pedido por la API (más un jitter de hasta un cuarto del backoff)
+    assert 5.0 <= clock.slept[0] <= 5.0 + 1.0 / 4
+    stats = scheduler.stats()
+    assert (stats['rate_limited'], stats['retry'], stats['ok'], stats['error']) == (1, 1, 1, 0)
+    assert stats['limit'] == 2
+
+
+def test_next_call_respects_the_shared_pause(clock, retries):
+    scheduler = _scheduler(ScriptedBackend([]))
+    scheduler._on_rate_limited(retry_after=3.0)
+    scheduler._backend = ScriptedBackend(['ok'])
+    assert scheduler.complete("prompt") == 'ok'
+    assert clock.slept == [pytest.approx(3.0)]
+
+
+def test_non_retryable_errors_are_raised_at_once(clock, retries):
+    backend = ScriptedBackend([LLMError("pedido inválido", status=400)])
+    with pytest.raises(LLMError):
+        _scheduler(backend).complete("prompt")
+    assert backend.calls == 1 and clock.slept == []
+
+
+def test_retries_are_bounded(clock, retries):
+    backend = ScriptedBackend([LLMError("caído", retryable=True, status=503)] * 3)
+    scheduler = _scheduler(backend)
+    with pytest.raises(LLMError):
+        scheduler.complete("prompt")
+    assert backend.calls == 3
+    assert scheduler.stats()['retry'] == 2
+    # Backoff exponencial con jitter completo: cada espera por debajo de su techo
+    assert clock.slept[0] <= 1.0 and clock.slept[1] <= 2.0
+
+
+def test_stub_backend_answers_429_with_retry_after(clock):
+    stub = StubBackend(latency=0, requests_per_minute=2)
+    stub.complete("Texto del recibo:\nApellido y nombre: PEREZ, JUAN")
+    stub.complete("Texto del recibo:\nApellido y nombre: PEREZ, JUAN")
+    with pytest.raises(RateLimited) as error:
+        stub.complete("Texto del recibo:\nApellido y nombre: PEREZ, JUAN")
+    # Una ficha cada 30 s
+    assert error.value.retry_after == pytest.approx(30.0)
+
+
+def test_bucket_wait_does_not_hold_a_concurrency_slot(clock, retries):
+    scheduler = LLMScheduler(ScriptedBackend(['ok', 'ok']), max_concurrency=1,
+                             requests_per_minute=1, tokens_per_minute=0)
+    in_flight_while_sleeping = []
+    sleep = clock.sleep
+
+    def recording_sleep(seconds):
+        in_flight_while_sleeping.append(scheduler.stats()['in_flight'])
+        sleep(seconds)
+    clock.sleep = recording_sleep
+
+    assert scheduler.complete("prompt") == 'ok'
+    assert scheduler.complete("prompt") == 'ok'
+    assert clock.slept == [pytest.approx(60.0)]
+    assert in_flight_while_sleeping == [0]
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.text = body
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+@pytest.mark.parametrize('body', ['<html>Bad gateway</html>', '{"error": "sin choices"}', '{"choices": []}'])
+def test_malformed_response_is_a_retryable_llm_error(body, monkeypatch):
+    class Provider:
+        def get(self):
+            return type('Client', (), {'post': lambda self, url, json: FakeResponse(body)})()
+
+    backend = llm_client.OpenAICompatibleBackend()
+    monkeypatch.setattr(backend, 'provider', Provider())
+    with pytest.raises(LLMError) as error:
+        backend.complete("prompt")
+    assert error.value.retryable
@@ -0,0 +1,61 @@
+import pytest
+
+import config
+from local_extractor import extract_receipt, parse_amount_ar
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1.234.567,89', 1234567.89),
+    ('$ 1234,5', 1234.5),
+    ('$ 45.000', 45000.0),
+    ('1234.56', 1234.56),
+    ('1,234.56', 1234.56),
+    # Espacio duro como separador de miles (así lo exportan algunos sistemas de sueldos)
+    ('1\u00a0234\u00a0567,89', 1234567.89),
+    ('12 345', None),
+    ('', None),
+    ('abc', None),
+])
+def test_parse_amount_ar(value, expected):
+    assert parse_amount_ar(value) == expected
+
+
+def _receipt(net_line, name_line="Apellido y nombre: PEREZ, JUAN CARLOS"):
+    return f"RECIBO DE HABERES\n{name_line}\nLegajo: 123\n{net_line}\n"
+
+
+def test_extracts_name_and_net_pay():
+    json_data, confidence = extract_receipt(_receipt("Neto a cobrar: $ 1.234.567,89"))
+    assert json_data == {'recibos': [{'nombre': 'Juan Carlos', 'apellido': 'Perez', 'sueldo': 1234567.89}]}
+    assert confidence >= config.LOCAL_EXTRACTOR_MIN_CONFIDENCE
+
+
+def test_net_pay_on_the_next_line():
+    json_data, _ = extract_receipt(_receipt("TOTAL NETO\n$ 1234,5"))
+    assert json_data['recibos'][0]['sueldo'] == 1234.5
+
+
+@pytest.mark.parametrize('net_line', [
+    # Cantidad e importe en columnas vecinas
+    "Neto a cobrar 12 345",
+    # Miles separados con espacios comunes: no se sabe si es un importe o varios
+    "Neto a cobrar 1 234 500,00",
+])
+def test_adjacent_numbers_are_not_merged_and_go_to_the_llm(net_line):
+    json_data, confidence = extract_receipt(_receipt(net_line))
+    assert json_data['recibos'][0]['sueldo'] not in (12345.0, 1234500.0)
+    assert confidence < config.LOCAL_EXTRACTOR_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize('text', [
+    "Apellido y nombre: PEREZ, JUAN\nSueldo básico 100.000,00",
+    "Empleado: PEREZ, JUAN\nNeto a cobrar: 123.456,78",
+    "",
+])
+def test_missing_labels_give_no_receipt(text):
+    assert extract_receipt(text) == ({'recibos': []}, 0.0)
+
+
+def test_two_employees_on_one_page_are_left_to_the_llm():
+    text = _receipt("Neto a cobrar: 1.000,00") + _receipt("Neto a cobrar: 2.000,00", "Apellido y nombre: GOMEZ, ANA")
+    assert extract_receipt(text) == ({'recibos': []}, 0.0)
@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+
+import fitz
+
+import config
+import ocr_parallel
+from memory_budget import MemoryBudget, page_cost
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "no se cumplió a tiempo"
+        time.sleep(0.01)
+
+
+def _start_waiter(budget, cost, admitted, name, positions=None, stop=None):
+    def run():
+        on_wait = (lambda p: positions.append(p)) if positions is not None else None
+        if budget.acquire(cost, stop=stop, on_wait=on_wait):
+            admitted.append(name)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_page_cost_grows_with_dpi():
+    a4 = (595, 842)
+    assert page_cost(*a4, dpi=300) == 4 * page_cost(*a4, dpi=150)
+
+
+def test_peak_and_release_accounting():
+    budget = MemoryBudget(100)
+    assert budget.acquire(60)
+    assert budget.acquire(40)
+    budget.release(60)
+    assert budget.acquire(10)
+    stats = budget.stats()
+    assert stats['in_use_bytes'] == 50
+    assert stats['peak_bytes'] == 100
+    assert stats['admitted'] == 3
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    budget = MemoryBudget(100)
+    assert budget.acquire(100)
+    admitted = []
+    positions = {'big': [], 'small': []}
+    big = _start_waiter(budget, 80, admitted, 'big', positions['big'])
+    _wait_until(lambda: budget.stats()['waiting'] == 1)
+    small = _start_waiter(budget, 10, admitted, 'small', positions['small'])
+    _wait_until(lambda: budget.stats()['waiting'] == 2)
+
+    # 'small' entraría con 20 libres, pero espera detrás de 'big'
+    budget.release(20)
+    time.sleep(0.2)
+    assert admitted == []
+
+    budget.release(80)
+    big.join(5)
+    small.join(5)
+    assert admitted == ['big', 'small']
+    # 'small' entra junto con 'big' (hay lugar para los dos): nunca llega a ser el primero
+    assert positions == {'big': [1], 'small': [2]}
+    assert budget.stats()['peak_bytes'] == 100
+
+
+def test_oversized_request_runs_alone():
+    budget = MemoryBudget(100)
+    assert budget.acquire(500)
+    assert budget.stats()['in_use_bytes'] == 500
+    admitted = []
+    waiter = _start_waiter(budget, 1, admitted, 'next')
+    time.sleep(0.1)
+    assert admitted == []
+    budget.release(500)
+    waiter.join(5)
+    assert admitted == ['next']
+
+
+def test_stopped_waiter_leaves_the_queue():
+    budget = MemoryBudget(100)
+    assert budget.acquire(100)
+    stop = threading.Event()
+    admitted = []
+    first = _start_waiter(budget, 50, admitted, 'cancelled', stop=stop)
+    _wait_until(lambda: budget.stats()['waiting'] == 1)
+    second = _start_waiter(budget, 50, admitted, 'next')
+    _wait_until(lambda: budget.stats()['waiting'] == 2)
+
+    stop.set()
+    first.join(5)
+    budget.release(60)
+    second.join(5)
+    assert admitted == ['next']
+    assert budget.stats()['waiting'] == 0
+
+
+def test_sequential_ocr_stops_while_waiting_for_memory(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / 'recibo.pdf')
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Apellido y nombre: PEREZ, JUAN")
+    doc.save(pdf_path)
+    doc.close()
+
+    budget = MemoryBudget(1)
+    monkeypatch.setattr(ocr_parallel, 'memory_budget', budget)
+    assert budget.acquire(1)
+
+    stop = threading.Event()
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.extend(ocr_parallel.process_pdfs_parallel([pdf_path], workers=1, stop=stop)),
+        daemon=True,
+    )
+    thread.start()
+    _wait_until(lambda: budget.stats()['waiting'] == 1)
+
+    stop.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert results == []
+    stats = budget.stats()
+    assert (stats['in_use_bytes'], stats['waiting']) == (1, 0)
+
+
+def test_layout_regions_are_costed_at_their_own_dpi(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / 'recibos.pdf')
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page(width=600, height=800)
+    doc.save(pdf_path)
+    doc.close()
+
+    # La caja del neto ocupa media página y se lee a 4 veces el DPI del OCR completo
+    registry = tmp_path / 'layouts.json'
+    registry.write_text(json.dumps({'layouts': [{
+        'name': 'sistema_x',
+        'fingerprint': {'hash': '0' * 64},
+        'dpi': 4 * config.OCR_DPI,
+        'receipts': [{'nombre': [0, 0, 1, 0.1], 'neto': [0, 0.5, 1, 1]}],
+    }]}))
+    monkeypatch.setattr(config, 'LAYOUTS_PATH', str(registry))
+    monkeypatch.setattr(config, 'OCR_ROI_ENABLED', True)
+
+    tasks = [(pdf_path, [1]), (pdf_path, [2])]
+    costs = ocr_parallel._task_costs(tasks, {pdf_path: {2: (0, 0, 300, 800)}})
+    assert costs[0] == page_cost(600, 400, dpi=4 * config.OCR_DPI) > page_cost(600, 800)
+    # Una página con zona nunca se compara con los formatos
+    assert costs[1] == page_cost(300, 800)
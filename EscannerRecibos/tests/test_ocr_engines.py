@@ -0,0 +1,74 @@
+import pytest
+
+import config
+import ocr_engines
+
+
+def test_engines_must_implement_recognize_and_version():
+    with pytest.raises(TypeError):
+        ocr_engines.OcrEngine('spa')
+
+    class SinVersion(ocr_engines.OcrEngine):
+        def _recognize(self, image, timeout):
+            return '', 0.0
+
+    with pytest.raises(TypeError):
+        SinVersion('spa')
+
+
+@pytest.mark.parametrize('configured, installed, expected', [
+    ('auto', True, ocr_engines.TesserocrEngine),
+    ('auto', False, ocr_engines.PytesseractEngine),
+    ('tesserocr', False, ocr_engines.PytesseractEngine),
+    ('pytesseract', True, ocr_engines.PytesseractEngine),
+    ('desconocido', True, ocr_engines.PytesseractEngine),
+])
+def test_engine_class_falls_back_to_pytesseract(configured, installed, expected, monkeypatch):
+    monkeypatch.setattr(config, 'OCR_ENGINE', configured)
+    monkeypatch.setattr(ocr_engines, 'HAS_TESSEROCR', installed)
+    assert ocr_engines.engine_class() is expected
+
+
+class FakeApi:
+    """Reemplazo de tesserocr.PyTessBaseAPI que falla o no reconoce según se pida."""
+
+    def __init__(self, recognize):
+        self.recognize = recognize
+        self.image = None
+
+    def SetImage(self, image):
+        self.image = image
+
+    def Recognize(self, timeout_ms):
+        return self.recognize()
+
+    def GetUTF8Text(self):
+        return f"texto de {self.image}"
+
+    def MeanTextConf(self):
+        return 91
+
+    def Clear(self):
+        self.image = None
+
+
+def _tesserocr_engine(recognize):
+    engine = ocr_engines.TesserocrEngine.__new__(ocr_engines.TesserocrEngine)
+    engine.api = FakeApi(recognize)
+    return engine
+
+
+def _raise():
+    raise RuntimeError("error interno de Tesseract")
+
+
+@pytest.mark.parametrize('recognize', [lambda: False, _raise])
+def test_tesserocr_handle_is_cleared_when_recognition_fails(recognize):
+    engine = _tesserocr_engine(recognize)
+    with pytest.raises(RuntimeError):
+        engine._recognize('pagina 1', timeout=1)
+    assert engine.api.image is None
+
+    engine.api.recognize = lambda: True
+    assert engine._recognize('pagina 2', timeout=1) == ('texto de pagina 2', 91.0)
+    assert engine.api.image is None
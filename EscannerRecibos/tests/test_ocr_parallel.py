@@ -0,0 +1,94 @@
+import threading
+import time
+
+import fitz
+import pytest
+
+import ocr_parallel
+
+HANGING_PAGES = (2, 3)
+
+
+def _fake_ocr_pages(pdf_path, pages, clips, page_timeout):
+    """
+    Reemplazo de ocr_parallel._ocr_pages: se traba (como Tesseract colgado)
+    en HANGING_PAGES de 'lote.pdf' y en todas las de 'colgado.pdf'; las de
+    'lento.pdf' tardan medio segundo.
+    """
+    if pdf_path.endswith('colgado.pdf') or (pdf_path.endswith('lote.pdf') and any(p in HANGING_PAGES for p in pages)):
+        time.sleep(30)
+    elif pdf_path.endswith('lento.pdf'):
+        time.sleep(0.5)
+    return [(f"texto {p}", p, {'source': 'ocr'}) for p in pages]
+
+
+def _make_pdf(path, pages=4):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    return _make_pdf(str(tmp_path / 'lote.pdf'))
+
+
+@pytest.fixture
+def fresh_pool():
+    ocr_parallel._reset_executor()
+    yield
+    ocr_parallel._reset_executor()
+
+
+def test_hanging_worker_is_killed_and_pending_tasks_resubmitted(pdf_path, fresh_pool, monkeypatch):
+    # Con fork los workers heredan el reemplazo
+    monkeypatch.setattr(ocr_parallel, '_ocr_pages', _fake_ocr_pages)
+
+    start = time.monotonic()
+    results = list(ocr_parallel.process_pdfs_parallel(
+        [pdf_path], workers=2, pages_per_task=1, page_timeout=0.5,
+    ))
+    elapsed = time.monotonic() - start
+
+    by_page = {page_num: info for _, _, page_num, info in results}
+    assert sorted(by_page) == [1, 2, 3, 4]
+    assert by_page[1]['source'] == by_page[4]['source'] == 'ocr'
+    assert by_page[2]['error'] == by_page[3]['error'] == 'timeout de OCR'
+    # Los workers trabados se mataron: no se esperó a que terminaran
+    assert elapsed < 20
+
+
+def test_pool_is_usable_after_killing_a_stuck_worker(pdf_path, fresh_pool, monkeypatch):
+    monkeypatch.setattr(ocr_parallel, '_ocr_pages', _fake_ocr_pages)
+    list(ocr_parallel.process_pdfs_parallel([pdf_path], workers=2, pages_per_task=1, page_timeout=0.5,
+                                            pages={pdf_path: [2]}))
+
+    results = list(ocr_parallel.process_pdfs_parallel([pdf_path], workers=2, pages_per_task=1, page_timeout=0.5,
+                                                      pages={pdf_path: [1, 4]}))
+    assert [(page_num, info['source']) for _, _, page_num, info in results] == [(1, 'ocr'), (4, 'ocr')]
+
+
+def test_timeout_in_one_batch_does_not_fail_another(tmp_path, fresh_pool, monkeypatch):
+    monkeypatch.setattr(ocr_parallel, '_ocr_pages', _fake_ocr_pages)
+    hanging = _make_pdf(str(tmp_path / 'colgado.pdf'), pages=6)
+    slow = _make_pdf(str(tmp_path / 'lento.pdf'), pages=8)
+    results = {}
+
+    def run(name, pdf, page_timeout):
+        results[name] = list(ocr_parallel.process_pdfs_parallel(
+            [pdf], workers=3, pages_per_task=1, page_timeout=page_timeout,
+        ))
+    # Cada página trabada del primer lote mata el pool compartido mientras el segundo tiene tareas en curso
+    threads = [threading.Thread(target=run, args=('colgado', hanging, 0.5), daemon=True),
+               threading.Thread(target=run, args=('lento', slow, 0), daemon=True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+
+    assert [info.get('error') for _, _, _, info in results['colgado']] == ['timeout de OCR'] * 6
+    assert [(page_num, info['source']) for _, _, page_num, info in results['lento']] == \
+        [(p, 'ocr') for p in range(1, 9)]
@@ -0,0 +1,61 @@
+import fitz
+import pytest
+
+import config
+import ocr
+from layouts import Layout
+
+
+class FakeEngine:
+    """Motor de OCR que devuelve los textos dados, en orden, uno por caja."""
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.calls = 0
+
+    def recognize(self, image, timeout=0):
+        self.calls += 1
+        return self.texts.pop(0), 90.0
+
+
+TWO_RECEIPTS = Layout({
+    'name': 'dos_por_hoja',
+    'fingerprint': {'hash': '0' * 64},
+    'dpi': 100,
+    'receipts': [
+        {'nombre': [0.05, 0.05, 0.9, 0.1], 'neto': [0.05, 0.3, 0.6, 0.35]},
+        {'nombre': [0.05, 0.55, 0.9, 0.6], 'neto': [0.05, 0.8, 0.6, 0.85]},
+    ],
+})
+
+
+@pytest.fixture
+def page():
+    doc = fitz.open()
+    yield doc.new_page(width=595, height=842)
+    doc.close()
+
+
+def test_two_receipt_layout_is_accepted(page):
+    engine = FakeEngine([
+        'Apellido y nombre: PEREZ, JUAN CARLOS', 'Neto a cobrar: 123.456,78',
+        'Apellido y nombre: GOMEZ, ANA MARIA', 'Neto a cobrar: 99.000,00',
+    ])
+    text, details = ocr._ocr_regions(page, TWO_RECEIPTS, engine, timeout=0)
+
+    assert engine.calls == 4
+    assert details['layout'] == 'dos_por_hoja'
+    assert 'PEREZ, JUAN CARLOS' in text and 'GOMEZ, ANA MARIA' in text
+    # Solo se renderizaron las cajas, no la página completa
+    full_page = (595 / 72 * 100) * (842 / 72 * 100)
+    assert details['ocr_pixels'] < full_page / 4
+
+
+def test_invalid_receipt_falls_back_without_reading_the_rest(page, monkeypatch):
+    monkeypatch.setattr(config, 'OCR_ROI_MIN_CONFIDENCE', 0.8)
+    engine = FakeEngine([
+        'Apellido y nombre: ', 'Neto a cobrar: ilegible',
+        'Apellido y nombre: GOMEZ, ANA MARIA', 'Neto a cobrar: 99.000,00',
+    ])
+    assert ocr._ocr_regions(page, TWO_RECEIPTS, engine, timeout=0) is None
+    assert engine.calls == 2
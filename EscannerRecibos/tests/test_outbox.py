@@ -0,0 +1,178 @@
+import os
+import smtplib
+
+import pytest
+
+import config
+import email_sender
+from outbox import Outbox
+
+
+class FakeConnection:
+    """Conexión SMTP falsa: guarda los mensajes o falla las primeras 'failures' veces."""
+
+    def __init__(self, log, failures):
+        self.log = log
+        self.failures = failures
+        self.closed = False
+
+    def send(self, msg):
+        if self.failures:
+            self.failures.pop(0)
+            raise smtplib.SMTPServerDisconnected("el servidor cerró la conexión")
+        self.log['sent'].append(msg)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    monkeypatch.setattr(config, 'MAIL_USERNAME', 'recibos@example.com')
+    monkeypatch.setattr(config, 'EMAIL_RECIPIENT_HARDCODED', 'rrhh@example.com')
+    monkeypatch.setattr(config, 'OUTBOX_DIGEST_SECONDS', 0)
+    monkeypatch.setattr(config, 'OUTBOX_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(config, 'OUTBOX_RETRY_BASE_SECONDS', 30)
+    # El trabajador se maneja a mano (ver _drain): nada corre en otro hilo
+    monkeypatch.setattr(Outbox, 'start', lambda self: None)
+    log = {'sent': [], 'connections': [], 'failures': []}
+
+    def connection_factory():
+        connection = FakeConnection(log, log['failures'])
+        log['connections'].append(connection)
+        return connection
+    log['factory'] = connection_factory
+    return log
+
+
+@pytest.fixture
+def box(tmp_path, smtp):
+    return Outbox(str(tmp_path / 'outbox'), connection_factory=smtp['factory'])
+
+
+def _report(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b'PK excel de prueba')
+    return str(path)
+
+
+def _drain(box, now):
+    """Lo que haría el trabajador en 'now': enviar todo lo que esté listo."""
+    while True:
+        items, _ = box._due_items(now)
+        if not items or not box._send(items):
+            return
+
+
+def _attachments(msg):
+    return [part.get_filename() for part in msg.walk() if part.get_filename()]
+
+
+def test_one_connection_for_several_reports(box, smtp, tmp_path):
+    for i in range(3):
+        box.enqueue(_report(tmp_path, f"reporte{i}.xlsx"), 'MARZO', 2024)
+    _drain(box, now=float('inf'))
+
+    assert len(smtp['sent']) == 3
+    assert len(smtp['connections']) == 1
+    assert box.stats() == {'pending': 0, 'retrying': 0, 'sent': 3, 'failed': 0}
+
+
+def test_failed_send_is_retried_with_backoff(box, smtp, tmp_path):
+    smtp['failures'].append(1)
+    box.enqueue(_report(tmp_path, 'reporte.xlsx'), 'MARZO', 2024)
+    now = box._load_pending()[0]['created_at'] + 1
+    _drain(box, now)
+
+    [item] = box._load_pending()
+    assert item['attempts'] == 1 and 'cerró' in item['last_error']
+    # Backoff: la base con ±20 % de jitter
+    assert 0.8 * 30 <= item['next_attempt_at'] - now <= 1.2 * 30 + 1
+    # La conexión que falló se descarta
+    assert smtp['connections'][0].closed
+    assert box._due_items(now)[0] == []
+
+    _drain(box, item['next_attempt_at'])
+    assert len(smtp['sent']) == 1
+    assert len(smtp['connections']) == 2
+    assert box.stats()['pending'] == 0
+
+
+def test_gives_up_after_max_attempts(box, smtp, tmp_path):
+    smtp['failures'].extend([1] * 3)
+    item_id = box.enqueue(_report(tmp_path, 'reporte.xlsx'), 'MARZO', 2024)
+    for _ in range(3):
+        _drain(box, now=float('inf'))
+
+    assert box._load_pending() == []
+    assert os.path.exists(os.path.join(box.directory, 'failed', f"{item_id}.json"))
+    assert box.stats()['failed'] == 1
+    assert smtp['sent'] == []
+
+
+def test_missing_report_is_not_retried(box, smtp, tmp_path):
+    path = _report(tmp_path, 'reporte.xlsx')
+    item_id = box.enqueue(path, 'MARZO', 2024)
+    os.remove(path)
+    _drain(box, now=float('inf'))
+
+    assert smtp['connections'] == []
+    assert os.path.exists(os.path.join(box.directory, 'failed', f"{item_id}.json"))
+
+
+def test_digest_waits_for_the_window_and_sends_one_email(box, smtp, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'OUTBOX_DIGEST_SECONDS', 60)
+    box.enqueue(_report(tmp_path, 'marzo.xlsx'), 'MARZO', 2024)
+    box.enqueue(_report(tmp_path, 'abril.xlsx'), 'ABRIL', 2024)
+    created = min(item['created_at'] for item in box._load_pending())
+
+    items, digest_at = box._due_items(created + 30)
+    assert items == [] and digest_at == pytest.approx(created + 60)
+
+    _drain(box, created + 61)
+    [msg] = smtp['sent']
+    assert msg['Subject'] == "Reportes de Sueldos Procesados (2) - MARZO 2024, ABRIL 2024"
+    assert sorted(_attachments(msg)) == ['abril.xlsx', 'marzo.xlsx']
+
+
+class FakeSMTP:
+    """Reemplazo de smtplib.SMTP: el primer servidor se desconecta en el segundo envío."""
+    created = []
+
+    def __init__(self, *args, **kwargs):
+        self.sent = 0
+        self.number = len(FakeSMTP.created)
+        FakeSMTP.created.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, sender, recipient, message):
+        if self.number == 0 and self.sent == 1:
+            raise smtplib.SMTPServerDisconnected("timeout del servidor")
+        self.sent += 1
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_smtp_connection_is_reused_and_reconnects_once(smtp, tmp_path, monkeypatch):
+    FakeSMTP.created = []
+    monkeypatch.setattr(email_sender.smtplib, 'SMTP', FakeSMTP)
+    connection = email_sender.SmtpConnection()
+    msg = email_sender.build_report_message([(_report(tmp_path, 'reporte.xlsx'), 'MARZO', 2024)])
+
+    connection.send(msg)
+    connection.send(msg)
+    connection.send(msg)
+
+    # El primer servidor se cae en el segundo envío: se reconecta una vez y el nuevo queda en uso
+    assert [server.sent for server in FakeSMTP.created] == [1, 2]
+    connection.close()
+    assert connection.server is None
@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+
+import pytest
+
+import config
+import pipeline
+
+
+def _fake_ocr(count, produced=None):
+    """Reemplazo de process_pdfs_parallel: 'count' páginas de texto, sin PDF."""
+    def process_pdfs_parallel(pdf_paths, pages=None, clips=None, on_wait=None, stop=None):
+        for page_num in range(1, count + 1):
+            if produced is not None:
+                produced.append(page_num)
+            yield 'lote.pdf', f"Recibo pagina {page_num}", page_num, {'source': 'ocr'}
+    return process_pdfs_parallel
+
+
+@pytest.fixture(autouse=True)
+def llm_per_page(monkeypatch):
+    # Todas las páginas van al LLM, de a una por llamada
+    monkeypatch.setattr(config, 'DEDUP_ENABLED', False)
+    monkeypatch.setattr(config, 'LLM_BATCH_TOKEN_BUDGET', 0)
+    monkeypatch.setattr(pipeline, 'extract_receipt', lambda text: ({'recibos': []}, 0.0))
+
+
+def _page_number(prompt_text):
+    return int(prompt_text.split()[-1])
+
+
+def _run_in_thread(events, **kwargs):
+    error = []
+
+    def run():
+        try:
+            events.extend(pipeline.run_pipeline(['lote.pdf'], **kwargs))
+        except Exception as e:
+            error.append(e)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, error
+
+
+def test_results_come_in_page_order(monkeypatch):
+    monkeypatch.setattr(pipeline, 'process_pdfs_parallel', _fake_ocr(6))
+
+    def process_ticket(prompt_text):
+        # Las primeras páginas tardan más: el LLM termina en otro orden
+        time.sleep((6 - _page_number(prompt_text)) * 0.03)
+        return {'recibos': [{'pagina': _page_number(prompt_text)}]}
+    monkeypatch.setattr(pipeline, 'process_ticket', process_ticket)
+
+    results = [e for e in pipeline.run_pipeline(['lote.pdf'], llm_workers=3, queue_size=6)
+               if e['type'] == 'result']
+
+    assert [r['page'] for r in results] == [1, 2, 3, 4, 5, 6]
+    assert [r['json_data']['recibos'][0]['pagina'] for r in results] == [1, 2, 3, 4, 5, 6]
+    assert all(r['extractor'] == 'llm' for r in results)
+
+
+def test_ocr_waits_for_the_llm(monkeypatch):
+    produced = []
+    monkeypatch.setattr(pipeline, 'process_pdfs_parallel', _fake_ocr(10, produced))
+    llm_free = threading.Event()
+
+    def process_ticket(prompt_text):
+        llm_free.wait(10)
+        return {'recibos': []}
+    monkeypatch.setattr(pipeline, 'process_ticket', process_ticket)
+
+    events = []
+    thread, error = _run_in_thread(events, llm_workers=1, queue_size=1)
+    time.sleep(0.5)
+    # Ventana de queue_size + llm_workers páginas en vuelo, más la que espera lugar
+    assert len(produced) == 3
+
+    llm_free.set()
+    thread.join(10)
+    assert not error
+    assert len([e for e in events if e['type'] == 'result']) == 10
+
+
+def test_llm_error_reaches_the_caller(monkeypatch):
+    monkeypatch.setattr(pipeline, 'process_pdfs_parallel', _fake_ocr(3))
+
+    def process_ticket(prompt_text):
+        raise ValueError("respuesta inesperada")
+    monkeypatch.setattr(pipeline, 'process_ticket', process_ticket)
+
+    events = []
+    thread, error = _run_in_thread(events, llm_workers=2, queue_size=2)
+    thread.join(10)
+    assert not thread.is_alive()
+    assert [str(e) for e in error] == ["respuesta inesperada"]
+
+
+def _queued(*items):
+    q = queue.Queue()
+    for item in items:
+        q.put(item)
+    return q
+
+
+def test_take_batch_never_goes_over_the_token_budget(monkeypatch):
+    pages = [{'seq': i, 'prompt_text': f"Apellido y nombre: EMPLEADO {i}\n" * 20} for i in range(4)]
+    page_tokens = pipeline.batch_page_tokens(pages[0]['prompt_text'])
+    # Entran dos páginas y media
+    budget = pipeline.BATCH_PROMPT_OVERHEAD + int(page_tokens * 2.5)
+    monkeypatch.setattr(config, 'LLM_BATCH_TOKEN_BUDGET', budget)
+    monkeypatch.setattr(config, 'LLM_BATCH_MAX_PAGES', 20)
+
+    llm_queue = _queued(*pages[1:], pipeline._FIN)
+    items, fin, carry = pipeline._take_batch(llm_queue, pages[0])
+    assert [i['seq'] for i in items] == [0, 1]
+    assert not fin and carry is pages[2]
+
+    # La que quedó afuera encabeza la llamada siguiente
+    items, fin, carry = pipeline._take_batch(llm_queue, carry)
+    assert [i['seq'] for i in items] == [2, 3]
+    assert fin and carry is None
+
+
+def test_batched_llm_calls_keep_every_page_in_order(monkeypatch):
+    monkeypatch.setattr(pipeline, 'process_pdfs_parallel', _fake_ocr(7))
+    text = "Recibo pagina 1"
+    budget = pipeline.BATCH_PROMPT_OVERHEAD + int(pipeline.batch_page_tokens(text) * 2.5)
+    monkeypatch.setattr(config, 'LLM_BATCH_TOKEN_BUDGET', budget)
+    monkeypatch.setattr(config, 'LLM_BATCH_MAX_PAGES', 20)
+    monkeypatch.setattr(pipeline, 'compact_for_prompt', lambda t: (t, {'before': 1, 'after': 1}))
+    calls = []
+
+    def process_tickets_batch(pages):
+        calls.append([p['id'] for p in pages])
+        time.sleep(0.05)
+        return {p['id']: {'recibos': [{'pagina': _page_number(p['text'])}]} for p in pages}
+    monkeypatch.setattr(pipeline, 'process_tickets_batch', process_tickets_batch)
+
+    results = [e for e in pipeline.run_pipeline(['lote.pdf'], llm_workers=1, queue_size=8)
+               if e['type'] == 'result']
+
+    assert [r['json_data']['recibos'][0]['pagina'] for r in results] == list(range(1, 8))
+    assert all(len(call) <= 2 for call in calls)
+    assert sorted(int(i) for call in calls for i in call) == list(range(7))
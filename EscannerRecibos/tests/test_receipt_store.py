@@ -0,0 +1,61 @@
+import pytest
+
+from receipt_store import ReceiptStore, period_from_text
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ReceiptStore(str(tmp_path / 'recibos.sqlite3'))
+
+
+def _row(nombre, apellido, sueldo, page=1, sha='a' * 64):
+    return {'nombre': nombre, 'apellido': apellido, 'sueldo': sueldo, 'pdf_sha256': sha, 'page': page}
+
+
+def test_upsert_is_idempotent_per_pdf_page_and_employee(store):
+    rows = [_row('Juan', 'Pérez', 1000.0), _row('Ana', 'Gómez', 2000.0, page=2)]
+    assert store.upsert(rows, '2024-03', batch_id='lote-1') == 2
+    assert store.upsert(rows, '2024-03', batch_id='lote-2') == 2
+    # El mismo empleado escrito distinto (orden, tildes) es la misma fila
+    store.upsert([_row('PEREZ', 'JUAN', 1500.0)], '2024-03', batch_id='lote-3')
+
+    saved = store.find(period='2024-03')
+    assert len(saved) == 2
+    juan = store.find(employee='juan perez')[0]
+    assert (juan['sueldo'], juan['batch_id'], juan['page']) == (1500.0, 'lote-3', 1)
+    assert store.stats() == {'recibos': 2, 'employees': 2}
+
+
+def test_page_keeps_its_period_unless_the_text_declares_one(store):
+    store.upsert([_row('Juan', 'Pérez', 1000.0)], '2024-03')
+    # Otra subida sin período en el texto: el nombre se lee distinto y la fila se
+    # reemplaza, pero la página sigue en su mes (igual que si se leyera igual)
+    store.upsert([_row('Juan', 'Peres', 1000.0)], '2024-04')
+    assert [(r['apellido'], r['period']) for r in store.find()] == [('Peres', '2024-03')]
+    store.upsert([_row('Juan', 'Peres', 1100.0)], '2024-05')
+    assert [(r['sueldo'], r['period']) for r in store.find()] == [(1100.0, '2024-03')]
+
+    # El período del texto corrige el guardado, por cualquiera de los dos caminos
+    store.upsert([_row('Juan', 'Peres', 1100.0)], '2024-02', period_in_text=True)
+    assert [r['period'] for r in store.find()] == ['2024-02']
+    store.upsert([_row('Juan', 'Pérez', 1100.0)], '2024-01', period_in_text=True)
+    assert [(r['apellido'], r['period']) for r in store.find()] == [('Pérez', '2024-01')]
+
+
+def test_same_receipt_in_another_pdf_is_another_row(store):
+    store.upsert([_row('Juan', 'Pérez', 1000.0)], '2024-03')
+    store.upsert([_row('Juan', 'Pérez', 1000.0, sha='b' * 64)], '2024-03')
+    assert len(store.find(employee='Juan Pérez', period='2024-03')) == 2
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("Período: 03/2024\nApellido y nombre: PEREZ, JUAN", '2024-03'),
+    ("PERIODO ABONADO: MARZO DE 2024", '2024-03'),
+    ("Fecha de ingreso: 01/2015\nMes liquidado: Setiembre 2025", '2025-09'),
+    ("Liquidación de octubre/2026", '2026-10'),
+    ("Fecha de pago: 05/11/2026", None),
+    ("Período: 13/2024", None),
+    ("", None),
+])
+def test_period_from_text(text, expected):
+    assert period_from_text(text) == expected
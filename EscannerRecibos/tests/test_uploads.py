@@ -0,0 +1,117 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+import config
+import uploads
+from uploads import UploadError, save_streaming_upload
+
+BOUNDARY = 'limite-de-prueba'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def _multipart(parts):
+    """Cuerpo multipart con partes (campo, nombre de archivo o None, contenido)."""
+    body = b''
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += (f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n').encode() + content + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+
+@pytest.fixture(autouse=True)
+def upload_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    # Bloques chicos: los archivos llegan en varios pedazos
+    monkeypatch.setattr(config, 'UPLOAD_CHUNK_SIZE', 1024)
+    return tmp_path / 'uploads'
+
+
+def _upload(parts):
+    body = _multipart(parts)
+    return save_streaming_upload(io.BytesIO(body), CONTENT_TYPE, len(body))
+
+
+def _store_files():
+    return sorted(os.listdir(uploads.store_dir()))
+
+
+def test_identical_files_are_stored_once():
+    a = b'%PDF-1.4 recibo a' * 500
+    b = b'%PDF-1.4 recibo b' * 500
+    files = _upload([
+        ('files[]', 'a.pdf', a),
+        ('files[]', 'b.pdf', b),
+        ('files[]', 'copia.pdf', a),
+        ('otro', 'ignorado.pdf', b'x'),
+        ('files[]', 'notas.txt', b'no es pdf'),
+    ])
+
+    assert [f['filename'] for f in files] == ['a.pdf', 'b.pdf', 'copia.pdf']
+    assert files[0]['sha256'] == hashlib.sha256(a).hexdigest()
+    assert files[0]['size'] == len(a)
+    assert [f['duplicate_of'] for f in files] == [None, None, 'a.pdf']
+    assert files[2]['seen_before']
+    assert _store_files() == sorted(f"{hashlib.sha256(c).hexdigest()}.pdf" for c in (a, b))
+
+
+def test_file_seen_in_an_earlier_batch():
+    content = b'%PDF-1.4 recibo'
+    assert not _upload([('files[]', 'a.pdf', content)])[0]['seen_before']
+    again = _upload([('files[]', 'otro_nombre.pdf', content)])[0]
+    assert again['seen_before'] and again['duplicate_of'] is None
+
+
+def test_file_over_the_limit_is_rejected_and_discarded(monkeypatch):
+    monkeypatch.setattr(config, 'UPLOAD_MAX_FILE_MB', 1)
+    with pytest.raises(UploadError) as error:
+        _upload([('files[]', 'chico.pdf', b'%PDF ok'), ('files[]', 'grande.pdf', b'0' * (1024 * 1024 + 1))])
+    assert error.value.status_code == 413
+    # No queda el temporal del archivo cortado
+    assert _store_files() == [f"{hashlib.sha256(b'%PDF ok').hexdigest()}.pdf"]
+
+
+def test_batch_over_the_limit_is_rejected(monkeypatch):
+    monkeypatch.setattr(config, 'UPLOAD_MAX_BATCH_MB', 1)
+    half = 600 * 1024
+    body = _multipart([('files[]', 'a.pdf', b'a' * half), ('files[]', 'b.pdf', b'b' * half)])
+    # Sin Content-Length se corta al superar el límite mientras se lee
+    with pytest.raises(UploadError) as error:
+        save_streaming_upload(io.BytesIO(body), CONTENT_TYPE, None)
+    assert error.value.status_code == 413
+    # Con Content-Length se rechaza antes de leer
+    stream = io.BytesIO(body)
+    with pytest.raises(UploadError):
+        save_streaming_upload(stream, CONTENT_TYPE, len(body))
+    assert stream.tell() == 0
+
+
+def test_not_multipart_is_rejected():
+    with pytest.raises(UploadError) as error:
+        save_streaming_upload(io.BytesIO(b'{}'), 'application/json', 2)
+    assert error.value.status_code == 400
+
+
+def test_prune_keeps_files_of_unfinished_batches(upload_folder, monkeypatch):
+    monkeypatch.setattr(config, 'UPLOAD_STORE_MAX_MB', 0)
+    files = _upload([('files[]', 'pendiente.pdf', b'%PDF pendiente'), ('files[]', 'viejo.pdf', b'%PDF viejo')])
+    pending, old = files
+    # El lote de 'pendiente.pdf' sigue en cola (su carpeta tiene manifest)
+    batch_dir = upload_folder / 'lote-en-cola'
+    batch_dir.mkdir()
+    uploads.write_manifest(str(batch_dir), [pending])
+    # Los dos se usaron hace más de una hora
+    long_ago = time.time() - 2 * 3600
+    for f in files:
+        os.utime(uploads.store_path(f['sha256']), (long_ago, long_ago))
+
+    uploads.prune_store()
+
+    assert os.path.exists(uploads.store_path(pending['sha256']))
+    assert not os.path.exists(uploads.store_path(old['sha256']))
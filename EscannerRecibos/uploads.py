@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Epilogue, Field, File, NeedData
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+import config
+
+# Subida de lotes en streaming.
+#
+# El cuerpo multipart se lee en bloques de tamaño fijo y cada PDF se escribe
+# a disco a medida que llega, calculando su SHA-256 al mismo tiempo. Los
+# PDFs se guardan por contenido (<store>/<sha256>.pdf): un archivo idéntico,
+# en el mismo lote o en otro, se guarda y procesa una sola vez. La carpeta
+# del lote solo tiene un manifest.json que asocia cada nombre con su hash.
+
+MANIFEST_NAME = 'manifest.json'
+ALLOWED_EXTENSIONS = {'pdf'}
+
+
+class UploadError(Exception):
+    """Error de subida con el código HTTP a devolver."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def store_dir():
+    return os.path.join(config.UPLOAD_FOLDER, 'store')
+
+
+def store_path(sha256):
+    return os.path.join(store_dir(), f"{sha256}.pdf")
+
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+class _FileWriter:
+    """Escribe una parte del multipart a un temporal, con hash y tamaño."""
+
+    def __init__(self, filename, batch_total):
+        self.filename = filename
+        self.size = 0
+        self.batch_total = batch_total
+        self.hash = hashlib.sha256()
+        os.makedirs(store_dir(), exist_ok=True)
+        self.tmp_path = os.path.join(store_dir(), f".tmp-{uuid.uuid4().hex}")
+        self.fh = open(self.tmp_path, 'wb')
+
+    def write(self, data):
+        self.size += len(data)
+        self.batch_total += len(data)
+        # Se cortan los límites apenas se superan, sin esperar al final
+        if self.size > config.UPLOAD_MAX_FILE_MB * 1024 * 1024:
+            raise UploadError(f"El archivo {self.filename} supera {config.UPLOAD_MAX_FILE_MB} MB", 413)
+        if self.batch_total > config.UPLOAD_MAX_BATCH_MB * 1024 * 1024:
+            raise UploadError(f"El lote supera {config.UPLOAD_MAX_BATCH_MB} MB", 413)
+        self.hash.update(data)
+        self.fh.write(data)
+
+    def finish(self):
+        """Mueve el temporal al almacén. Devuelve (sha256, ya_existía)."""
+        self.fh.close()
+        sha256 = self.hash.hexdigest()
+        final_path = store_path(sha256)
+        if os.path.exists(final_path):
+            os.remove(self.tmp_path)
+            # Se "toca" para que el desalojo lo considere usado recientemente
+            os.utime(final_path)
+            return sha256, True
+        os.replace(self.tmp_path, final_path)
+        return sha256, False
+
+    def abort(self):
+        try:
+            self.fh.close()
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def save_streaming_upload(stream, content_type, content_length, field_name='files[]'):
+    """
+    Lee el cuerpo multipart de 'stream' en bloques y guarda cada PDF del
+    campo 'field_name' en el almacén por contenido.
+
+    Devuelve la lista de archivos [{'filename', 'sha256', 'size', 'duplicate_of', 'seen_before'}]
+    donde 'duplicate_of' es el nombre del archivo idéntico anterior del mismo
+    lote (o None) y 'seen_before' indica que ya estaba en el almacén.
+    Lanza UploadError si el pedido es inválido o supera los límites.
+    """
+    mimetype, options = parse_options_header(content_type or '')
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise UploadError("Se esperaba un formulario multipart/form-data")
+
+    # Rechazo temprano: el tamaño declarado ya supera el límite del lote
+    if content_length and content_length > config.UPLOAD_MAX_BATCH_MB * 1024 * 1024:
+        raise UploadError(f"El lote supera {config.UPLOAD_MAX_BATCH_MB} MB", 413)
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=64 * 1024)
+    files = []
+    by_hash = {}
+    batch_total = 0
+    writer = None
+    skipping = False
+
+    try:
+        while True:
+            chunk = stream.read(config.UPLOAD_CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    filename = secure_filename(event.filename or '')
+                    skipping = event.name != field_name or not filename or not allowed_file(filename)
+                    if not skipping:
+                        writer = _FileWriter(filename, batch_total)
+                elif isinstance(event, Field):
+                    skipping = True
+                elif isinstance(event, Data):
+                    if writer is not None and not skipping:
+                        writer.write(event.data)
+                        if not event.more_data:
+                            batch_total = writer.batch_total
+                            sha256, seen_before = writer.finish()
+                            files.append({
+                                'filename': writer.filename,
+                                'sha256': sha256,
+                                'size': writer.size,
+                                'duplicate_of': by_hash.get(sha256),
+                                'seen_before': seen_before,
+                            })
+                            by_hash.setdefault(sha256, writer.filename)
+                            writer = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except UploadError:
+        raise
+    except RequestEntityTooLarge:
+        raise UploadError("Campo de formulario demasiado grande", 413)
+    except ValueError as e:
+        raise UploadError(f"Formulario inválido: {e}")
+    finally:
+        if writer is not None:
+            writer.abort()
+
+    return files
+
+
+def write_manifest(batch_dir, files):
+    with open(os.path.join(batch_dir, MANIFEST_NAME), 'w', encoding='utf-8') as fh:
+        json.dump({'files': files}, fh, ensure_ascii=False)
+
+
+def read_manifest(batch_dir):
+    with open(os.path.join(batch_dir, MANIFEST_NAME), encoding='utf-8') as fh:
+        return json.load(fh)['files']
+
+
+def _live_hashes():
+    """
+    SHA-256 de los PDFs que figuran en algún manifest de lote. La carpeta de
+    un lote existe desde que se sube hasta que process_batch termina, así que
+    esto cubre los trabajos en cola y los que están corriendo.
+    """
+    hashes = set()
+    root = config.UPLOAD_FOLDER
+    if not os.path.isdir(root):
+        return hashes
+    for name in os.listdir(root):
+        batch_dir = os.path.join(root, name)
+        if not os.path.isfile(os.path.join(batch_dir, MANIFEST_NAME)):
+            continue
+        try:
+            hashes.update(f['sha256'] for f in read_manifest(batch_dir))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No se pudo leer el manifest de {batch_dir}: {e}")
+    return hashes
+
+
+def prune_store():
+    """
+    Desaloja del almacén los PDFs usados hace más tiempo cuando el total
+    supera config.UPLOAD_STORE_MAX_MB. Nunca borra los PDFs de lotes que
+    todavía no terminaron (figuran en su manifest) ni archivos tocados en la
+    última hora (subidas en curso, que todavía no tienen manifest).
+    """
+    directory = store_dir()
+    if not os.path.isdir(directory):
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        total += st.st_size
+        entries.append((st.st_mtime, st.st_size, name, path))
+
+    limit = config.UPLOAD_STORE_MAX_MB * 1024 * 1024
+    if total <= limit:
+        return
+    live = _live_hashes()
+    recent = time.time() - 3600
+    for mtime, size, name, path in sorted(entries):
+        if total <= limit or mtime > recent:
+            break
+        if os.path.splitext(name)[0] in live:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            print(f"No se pudo desalojar {path}: {e}")